@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Benchmark end-to-end tap -> relè con hardware simulato e broker MQTT locale
+Misura p50/p95/p99 della latenza e il throughput per direzione
+
+Uso:
+    python3 benchmarks/bench_tap_latency.py
+    python3 benchmarks/bench_tap_latency.py --scenarios online,cache_hit --rate 5 --taps 50
+    python3 benchmarks/bench_tap_latency.py --output results/v1.2.json
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+# Hardware simulato: deve essere impostato prima di importare i moduli del sistema
+os.environ['HARDWARE_BACKEND'] = 'simulated'
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+sys.path.insert(0, BENCH_DIR)
+
+from config import Config
+Config.HARDWARE_BACKEND = 'simulated'
+
+import hardware
+from main import AccessControlSystem
+from local_broker import LocalBroker, LocalMQTTClient, AuthResponder
+
+SCENARIOS = ('online', 'cache_hit', 'offline', 'auth_timeout')
+
+def percentile(values, pct):
+    """Percentile con interpolazione lineare"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    low = int(k)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+def summarize(values_ms):
+    """Statistiche di latenza in millisecondi"""
+    if not values_ms:
+        return None
+    return {
+        'count': len(values_ms),
+        'p50': round(percentile(values_ms, 50), 3),
+        'p95': round(percentile(values_ms, 95), 3),
+        'p99': round(percentile(values_ms, 99), 3),
+        'mean': round(sum(values_ms) / len(values_ms), 3),
+        'max': round(max(values_ms), 3)
+    }
+
+@contextlib.contextmanager
+def config_overrides(**overrides):
+    """Applica temporaneamente valori di Config"""
+    original = {key: getattr(Config, key) for key in overrides}
+    for key, value in overrides.items():
+        setattr(Config, key, value)
+    try:
+        yield
+    finally:
+        for key, value in original.items():
+            setattr(Config, key, value)
+
+class TapBenchmark:
+    """Esecuzione di uno scenario su un sistema completo"""
+
+    def __init__(self, args):
+        self.args = args
+        self.directions = args.directions
+        self.decisions = {d: [] for d in self.directions}
+        self._decisions_lock = threading.Lock()
+
+    def scenario_settings(self, name):
+        """Configurazione specifica dello scenario"""
+        args = self.args
+        settings = {
+            'AUTH_CACHE_ENABLED': name == 'cache_hit',
+            'AUTH_TIMEOUT': args.auth_timeout,
+        }
+        responder = {'delay': args.auth_delay, 'silent': name == 'auth_timeout'}
+        return settings, responder
+
+    def run(self, name):
+        args = self.args
+        settings, responder_opts = self.scenario_settings(name)
+        relay_time = min(0.05, 0.5 / args.rate)
+
+        with tempfile.TemporaryDirectory() as log_dir, config_overrides(
+            LOG_DIRECTORY=log_dir,
+            RFID_DEBOUNCE_TIME=0.0,
+            RFID_PRESENCE_TIMEOUT=0.0,
+            BIDIRECTIONAL_MODE=True,
+            RFID_IN_ENABLE='in' in self.directions,
+            RFID_OUT_ENABLE='out' in self.directions,
+            RELAY_IN_ENABLE='in' in self.directions,
+            RELAY_OUT_ENABLE='out' in self.directions,
+            RELAY_IN_ACTIVE_TIME=relay_time,
+            RELAY_OUT_ACTIVE_TIME=relay_time,
+            CONNECTION_CHECK_INTERVAL=3600,
+            METRICS_ENABLED=False,
+            OFFLINE_ALLOW_ACCESS=True,
+            PIPELINE_MODE=args.pipeline,
+            **settings
+        ):
+            return self._run_system(name, responder_opts)
+
+    def _run_system(self, name, responder_opts):
+        args = self.args
+        simulator = hardware.simulator
+        simulator.reset()
+        self.decisions = {d: [] for d in self.directions}
+
+        broker = LocalBroker(latency=args.network_latency)
+        responder = AuthResponder(broker, delay=responder_opts['delay'], silent=responder_opts['silent'])
+
+        devnull = open(os.devnull, 'w')
+        system = None
+
+        try:
+            with contextlib.redirect_stdout(devnull):
+                system = AccessControlSystem(mqtt_client_factory=lambda: LocalMQTTClient(broker))
+                if not system.initialize():
+                    raise RuntimeError("Inizializzazione sistema fallita")
+
+                system.offline_manager.is_online = name != 'offline'
+                self._instrument(system)
+
+                system.rfid_manager.start_reading()
+                system.running = True
+                threading.Thread(target=system._main_loop, daemon=True).start()
+
+                if name == 'cache_hit':
+                    self._warm_up(simulator)
+
+                due_times = self._schedule_taps(simulator, name)
+                self._wait_for_decisions(due_times, name)
+                time.sleep(0.2)  # Ultimi fronti relè
+
+            return self._collect(name, system, due_times)
+
+        finally:
+            with contextlib.redirect_stdout(devnull):
+                if system:
+                    self._teardown(system)
+                responder.stop()
+                broker.stop()
+            devnull.close()
+
+    def _instrument(self, system):
+        """Registra l'istante della decisione (log accesso) per direzione"""
+        original = system.logger.log_access_attempt
+
+        def log_access_attempt(card_info, auth_result=None, relay_success=False, auth_time_ms=0):
+            decided_at = time.monotonic()
+            direction = card_info.get('direction')
+            with self._decisions_lock:
+                self.decisions.setdefault(direction, []).append({
+                    'decided_at': decided_at,
+                    'authorized': bool(auth_result and auth_result.get('authorized')),
+                    'relay': relay_success
+                })
+            return original(card_info, auth_result, relay_success, auth_time_ms)
+
+        system.logger.log_access_attempt = log_access_attempt
+
+    def _uid(self, direction, index, pool=None):
+        base = 0x10 if direction == 'in' else 0x20
+        if pool:
+            index = index % pool
+        return (base << 32) | (index << 8)
+
+    def _warm_up(self, simulator):
+        """Prima passata per popolare la cache auth"""
+        start = time.monotonic() + 0.1
+        for direction in self.directions:
+            for i in range(self.args.cache_pool):
+                simulator.tap(direction, self._uid(direction, i), at=start + i * 0.05)
+
+        expected = self.args.cache_pool
+        deadline = time.monotonic() + 10 + expected * self.args.auth_timeout
+        while time.monotonic() < deadline:
+            with self._decisions_lock:
+                if all(len(self.decisions[d]) >= expected for d in self.directions):
+                    break
+            time.sleep(0.05)
+
+        time.sleep(0.3)  # Risposte auth in background -> cache
+        with self._decisions_lock:
+            self.decisions = {d: [] for d in self.directions}
+
+    def _schedule_taps(self, simulator, name):
+        """Programma i tap alla frequenza richiesta su ogni lettore"""
+        interval = 1.0 / self.args.rate
+        start = time.monotonic() + 0.2
+        pool = self.args.cache_pool if name == 'cache_hit' else None
+        due_times = {}
+
+        for direction in self.directions:
+            due_times[direction] = []
+            for i in range(self.args.taps):
+                due = start + i * interval
+                simulator.tap(direction, self._uid(direction, i, pool), at=due)
+                due_times[direction].append(due)
+
+        return due_times
+
+    def _wait_for_decisions(self, due_times, name):
+        expected = {d: len(t) for d, t in due_times.items()}
+        per_tap = self.args.auth_timeout if name == 'auth_timeout' else 1.0
+        deadline = time.monotonic() + 10 + self.args.taps * (per_tap + 1.0 / self.args.rate)
+
+        while time.monotonic() < deadline:
+            with self._decisions_lock:
+                if all(len(self.decisions[d]) >= expected[d] for d in expected):
+                    return
+            time.sleep(0.05)
+
+    def _collect(self, name, system, due_times):
+        results = {}
+        edges = list(hardware.simulator.edges)
+
+        for direction, dues in due_times.items():
+            relay = system.relay_manager.relays.get(direction)
+            on_level = hardware.GPIO.LOW if relay and relay.active_low else hardware.GPIO.HIGH
+            on_edges = [ts for ts, pin, level in edges if relay and pin == relay.gpio_pin and level == on_level]
+
+            with self._decisions_lock:
+                decisions = list(self.decisions.get(direction, []))
+
+            decision_ms = []
+            relay_ms = []
+            edge_index = 0
+
+            # Lettore e worker sono seriali per direzione: ordine dei tap = ordine delle decisioni
+            for due, decision in zip(dues, decisions):
+                decision_ms.append((decision['decided_at'] - due) * 1000)
+
+                if decision['relay']:
+                    while edge_index < len(on_edges) and on_edges[edge_index] < due:
+                        edge_index += 1
+                    if edge_index < len(on_edges):
+                        relay_ms.append((on_edges[edge_index] - due) * 1000)
+                        edge_index += 1
+
+            elapsed = (decisions[-1]['decided_at'] - dues[0]) if decisions else 0
+            results[direction] = {
+                'taps': len(dues),
+                'decided': len(decisions),
+                'authorized': sum(1 for d in decisions if d['authorized']),
+                'relay_activations': sum(1 for d in decisions if d['relay']),
+                'latency_ms': {
+                    'tap_to_decision': summarize(decision_ms),
+                    'tap_to_relay': summarize(relay_ms)
+                },
+                'throughput_per_s': round(len(decisions) / elapsed, 3) if elapsed > 0 else None
+            }
+
+        return results
+
+    def _teardown(self, system):
+        system.running = False
+        try:
+            system.rfid_manager.stop_reading()
+            if system.offline_manager:
+                system.offline_manager.stop_monitoring_threads()
+            if system.connection_supervisor:
+                system.connection_supervisor.stop()
+            if system.mqtt_client:
+                system.mqtt_client.disconnect()
+            system.relay_manager.force_off_all()
+            system.logger.close()
+        except Exception as e:
+            print(f"⚠️ Errore teardown: {e}")
+
+def print_report(results):
+    print(f"\n{'Scenario':<14}{'Dir':<5}{'Taps':>6}{'OK':>6}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'relay p95':>11}{'tap/s':>8}")
+    print("-" * 80)
+    for scenario, directions in results.items():
+        for direction, data in directions.items():
+            decision = data['latency_ms']['tap_to_decision'] or {}
+            relay = data['latency_ms']['tap_to_relay'] or {}
+            print(f"{scenario:<14}{direction:<5}{data['taps']:>6}{data['authorized']:>6}"
+                  f"{decision.get('p50', '-'):>10}{decision.get('p95', '-'):>10}{decision.get('p99', '-'):>10}"
+                  f"{relay.get('p95', '-'):>11}{str(data['throughput_per_s'] or '-'):>8}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark latenza tap -> relè")
+    parser.add_argument("--scenarios", default=','.join(SCENARIOS),
+                        help=f"Scenari separati da virgola ({', '.join(SCENARIOS)})")
+    parser.add_argument("--directions", default="in,out", help="Lettori da usare (in,out)")
+    parser.add_argument("--rate", type=float, default=5.0, help="Tap al secondo per lettore")
+    parser.add_argument("--taps", type=int, default=30, help="Tap per lettore e scenario")
+    parser.add_argument("--auth-delay", type=float, default=0.02, help="Ritardo risposta server auth (s)")
+    parser.add_argument("--auth-timeout", type=float, default=1.0, help="AUTH_TIMEOUT per il benchmark (s)")
+    parser.add_argument("--network-latency", type=float, default=0.005, help="Latenza broker locale (s)")
+    parser.add_argument("--cache-pool", type=int, default=5, help="Card distinte nello scenario cache_hit")
+    parser.add_argument("--pipeline", action="store_true", help="Usa PIPELINE_MODE")
+    parser.add_argument("--output", "-o", help="Salva i risultati in JSON")
+    args = parser.parse_args()
+
+    args.directions = [d.strip() for d in args.directions.split(',') if d.strip()]
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"Scenari sconosciuti: {', '.join(unknown)}")
+
+    print("🧪 BENCHMARK TAP -> RELÈ")
+    print(f"   Scenari: {', '.join(scenarios)} | Lettori: {', '.join(args.directions)} | "
+          f"{args.rate} tap/s x {args.taps}")
+
+    benchmark = TapBenchmark(args)
+    results = {}
+    for scenario in scenarios:
+        print(f"▶️  {scenario}...")
+        results[scenario] = benchmark.run(scenario)
+
+    print_report(results)
+
+    if not args.output:
+        return
+
+    report = {
+        'benchmark': 'tap_latency',
+        'timestamp': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine()
+        },
+        'parameters': {key: value for key, value in vars(args).items() if key != 'output'},
+        'scenarios': results
+    }
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n💾 Risultati salvati in {args.output}")
+
+if __name__ == "__main__":
+    main()
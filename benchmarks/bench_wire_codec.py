@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Confronto delle codifiche dei payload MQTT
+Dimensione in byte e tempi di encode/decode (timeit) per badge, status e
+batch di audit offline: JSON indentato (formato precedente), JSON compatto
+(libreria standard e orjson se installato) e CBOR
+
+Uso:
+    python3 benchmarks/bench_wire_codec.py
+    python3 benchmarks/bench_wire_codec.py --batch-size 200 --output codec_results.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import timeit
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+
+from config import Config
+from card_event import CardEvent
+from wire_codec import JsonCodec, CborCodec, orjson
+
+SAMPLE_RAW_ID = 0xC67BD90561
+
+class IndentedJsonCodec(JsonCodec):
+    """Formato precedente: json.dumps(indent=2)"""
+
+    name = 'json_indent'
+
+    def __init__(self):
+        super().__init__('stdlib')
+
+    def encode(self, obj):
+        return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+
+def make_codecs():
+    codecs = [('json_indent', IndentedJsonCodec()), ('json_stdlib', JsonCodec('stdlib'))]
+    if orjson is not None:
+        codecs.append(('json_orjson', JsonCodec('orjson')))
+    codecs.append(('cbor', CborCodec()))
+    return codecs
+
+def sample_event(index=0):
+    raw_id = SAMPLE_RAW_ID + index
+    return CardEvent(
+        raw_id=raw_id,
+        uid_formatted=hex(raw_id)[2:].upper()[:-2],
+        uid_hex=hex(raw_id),
+        data=None,
+        data_length=0,
+        direction='in',
+        reader_id='in',
+        timestamp=time.time(),
+        event_seq=1000 + index
+    )
+
+def sample_audit_event(index=0):
+    """Evento come prodotto da OfflineManager._audit_event"""
+    fields = sample_event(index).wire_fields()
+    return {
+        'event_seq': fields['event_seq'],
+        'card_uid': fields['card_uid'],
+        'identificativo_tornello': Config.TORNELLO_ID,
+        'direzione': fields['direzione'],
+        'timestamp': fields['timestamp'],
+        'raw_id': fields['raw_id'],
+        'card_data': '',
+        'hex_id': fields['hex_id'],
+        'reader_id': fields['reader_id'],
+        'offline_authorized': True,
+        'offline_message': 'Accesso offline consentito',
+        'sync_type': 'offline_audit',
+        'action_completed': True
+    }
+
+def sample_payloads(batch_size):
+    badge = dict(sample_event().wire_fields(), request_id="0" * 32)
+    status = {
+        'status': 'online',
+        'timestamp': datetime.now().isoformat(),
+        'tornello_id': Config.TORNELLO_ID,
+        'content_types': {'badge': 'application/json', 'offline_audit': 'application/json'}
+    }
+    events = [sample_audit_event(i) for i in range(batch_size)]
+    audit_batch = {
+        'identificativo_tornello': Config.TORNELLO_ID,
+        'sync_type': 'offline_audit_batch',
+        'sync_timestamp': datetime.now().isoformat(),
+        'count': len(events),
+        'first_seq': events[0]['event_seq'],
+        'last_seq': events[-1]['event_seq'],
+        'events': events
+    }
+    return [('badge', badge), ('status', status), (f'audit_batch[{batch_size}]', audit_batch)]
+
+def time_us(fn, min_time):
+    """Tempo per chiamata in microsecondi (minimo su 5 ripetizioni)"""
+    timer = timeit.Timer(fn)
+    loops, elapsed = timer.autorange()
+    if elapsed < min_time:
+        loops = max(1, int(loops * min_time / max(elapsed, 1e-9)))
+    return round(min(timer.repeat(repeat=5, number=loops)) / loops * 1e6, 3)
+
+def run(batch_size, min_time):
+    results = {}
+    for payload_name, payload in sample_payloads(batch_size):
+        rows = {}
+        for codec_name, codec in make_codecs():
+            encoded = codec.encode(payload)
+            assert codec.decode(encoded) == payload, f"Roundtrip {codec_name} non valido"
+            rows[codec_name] = {
+                'bytes': len(encoded),
+                'encode_us': time_us(lambda: codec.encode(payload), min_time),
+                'decode_us': time_us(lambda: codec.decode(encoded), min_time)
+            }
+        results[payload_name] = rows
+    return results
+
+def print_results(results):
+    for payload_name, rows in results.items():
+        baseline = rows['json_indent']['bytes']
+        print(f"\n📦 {payload_name}")
+        print(f"   {'codifica':12s} {'byte':>7s} {'vs indent':>10s} {'encode µs':>10s} {'decode µs':>10s}")
+        for codec_name, row in rows.items():
+            ratio = row['bytes'] / baseline * 100
+            print(f"   {codec_name:12s} {row['bytes']:7d} {ratio:9.1f}% {row['encode_us']:10.2f} {row['decode_us']:10.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Confronto codifiche payload MQTT")
+    parser.add_argument("--batch-size", type=int, default=Config.OFFLINE_SYNC_BATCH_SIZE,
+                        help="Eventi nel batch di audit")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Durata minima per ripetizione (s)")
+    parser.add_argument("--output", "-o", help="File risultati JSON")
+    args = parser.parse_args()
+
+    print("🧪 BENCHMARK CODIFICHE PAYLOAD MQTT")
+    print("===================================")
+    if orjson is None:
+        print("ℹ️ orjson non installato: backend JSON veloce escluso")
+
+    results = run(max(1, args.batch_size), args.min_time)
+    print_results(results)
+
+    if args.output:
+        report = {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'results': results
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n💾 Risultati salvati in {args.output}")
+
+if __name__ == "__main__":
+    main()
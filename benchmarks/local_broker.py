@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Broker MQTT in-process e responder auth per benchmark
+Implementa il sottoinsieme dell'API paho usato da MQTTClient
+"""
+import json
+import threading
+import time
+from collections import deque
+from paho.mqtt.client import topic_matches_sub
+from wire_codec import decode_payload
+
+class LocalMessage:
+    """Messaggio consegnato ai client (stessi attributi di paho MQTTMessage)"""
+
+    def __init__(self, topic, payload, qos=0, retain=False):
+        self.topic = topic
+        self.payload = payload if isinstance(payload, bytes) else str(payload).encode('utf-8')
+        self.qos = qos
+        self.retain = retain
+
+class LocalPublishInfo:
+    """Esito di publish (come paho MQTTMessageInfo)"""
+
+    def __init__(self, mid, rc=0):
+        self.mid = mid
+        self.rc = rc
+
+    def wait_for_publish(self, timeout=None):
+        return True
+
+class LocalBroker:
+    """Broker in memoria con latenza di rete configurabile"""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._clients = []
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._running = True
+
+        self.published = 0
+        self.delivered = 0
+
+        self._thread = threading.Thread(target=self._dispatch_loop, daemon=True, name="LocalBroker")
+        self._thread.start()
+
+    def attach(self, client):
+        with self._condition:
+            self._clients.append(client)
+
+    def detach(self, client):
+        with self._condition:
+            if client in self._clients:
+                self._clients.remove(client)
+
+    def submit(self, action):
+        """Accoda un'azione da eseguire dopo la latenza di rete"""
+        with self._condition:
+            self._queue.append((time.monotonic() + self.latency, action))
+            self._condition.notify()
+
+    def route(self, sender, message, mid):
+        """Publish da un client: PUBACK al mittente e consegna ai sottoscrittori"""
+        self.published += 1
+
+        def deliver():
+            with self._condition:
+                clients = list(self._clients)
+            for client in clients:
+                if client.is_subscribed(message.topic):
+                    self.delivered += 1
+                    client.deliver(message)
+            sender.acknowledge(mid)
+
+        self.submit(deliver)
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        self._thread.join(timeout=2)
+
+    def _dispatch_loop(self):
+        while True:
+            with self._condition:
+                while self._running and not self._queue:
+                    self._condition.wait()
+                if not self._running:
+                    return
+
+                due, action = self._queue[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                self._queue.popleft()
+
+            try:
+                action()
+            except Exception as e:
+                print(f"⚠️ Errore broker locale: {e}")
+
+class LocalMQTTClient:
+    """Client con la stessa interfaccia di paho.mqtt.client.Client"""
+
+    def __init__(self, broker, client_id=""):
+        self.broker = broker
+        self.client_id = client_id
+        self.connected = False
+        self.userdata = None
+
+        self._subscriptions = set()
+        self._callbacks = []
+        self._mid = 0
+        self._lock = threading.Lock()
+
+        # Callback stile paho
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_publish = None
+        self.on_message = None
+        self.on_log = None
+
+    # --- Configurazione (ignorata in locale) ---
+
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def tls_set_context(self, context=None):
+        pass
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self, force=False):
+        pass
+
+    # --- Connessione ---
+
+    def connect(self, host="localhost", port=1883, keepalive=60):
+        self.broker.attach(self)
+        self.broker.submit(self._connected)
+        return 0
+
+    def reconnect(self):
+        return self.connect()
+
+    def disconnect(self):
+        self.broker.detach(self)
+        was_connected = self.connected
+        self.connected = False
+        if was_connected and self.on_disconnect:
+            self.on_disconnect(self, self.userdata, 0)
+        return 0
+
+    def is_connected(self):
+        return self.connected
+
+    def _connected(self):
+        self.connected = True
+        if self.on_connect:
+            self.on_connect(self, self.userdata, {}, 0)
+
+    # --- Publish / subscribe ---
+
+    def publish(self, topic, payload=None, qos=0, retain=False):
+        with self._lock:
+            self._mid += 1
+            mid = self._mid
+
+        if not self.connected:
+            return LocalPublishInfo(mid, rc=4)  # MQTT_ERR_NO_CONN
+
+        self.broker.route(self, LocalMessage(topic, payload, qos, retain), mid)
+        return LocalPublishInfo(mid)
+
+    def subscribe(self, topic, qos=0):
+        with self._lock:
+            self._subscriptions.add(topic)
+        return 0, 0
+
+    def unsubscribe(self, topic):
+        with self._lock:
+            self._subscriptions.discard(topic)
+        return 0, 0
+
+    def message_callback_add(self, sub, callback):
+        with self._lock:
+            self._callbacks.append((sub, callback))
+
+    def message_callback_remove(self, sub):
+        with self._lock:
+            self._callbacks = [(s, cb) for s, cb in self._callbacks if s != sub]
+
+    def is_subscribed(self, topic):
+        with self._lock:
+            return any(topic_matches_sub(sub, topic) for sub in self._subscriptions)
+
+    def deliver(self, message):
+        with self._lock:
+            callbacks = [cb for sub, cb in self._callbacks if topic_matches_sub(sub, message.topic)]
+
+        if callbacks:
+            for callback in callbacks:
+                callback(self, self.userdata, message)
+        elif self.on_message:
+            self.on_message(self, self.userdata, message)
+
+    def acknowledge(self, mid):
+        if self.on_publish:
+            self.on_publish(self, self.userdata, mid)
+
+class AuthResponder:
+    """Server auth simulato: risponde ai badge su auth_response"""
+
+    def __init__(self, broker, delay=0.02, authorized=True, silent=False):
+        self.delay = delay
+        self.authorized = authorized
+        self.silent = silent
+        self.requests = 0
+
+        self.client = LocalMQTTClient(broker, client_id="auth_responder")
+        self.client.on_message = self._on_badge
+        self.client.connect()
+        self.client.subscribe("gate/+/badge")
+
+    def _on_badge(self, client, userdata, msg):
+        self.requests += 1
+        if self.silent:
+            return
+
+        payload = decode_payload(msg.payload)  # Badge in JSON o CBOR
+        tornello_id = msg.topic.split('/')[1]
+        response = {
+            'card_uid': payload.get('card_uid'),
+            'request_id': payload.get('request_id'),
+            'authorized': self.authorized,
+            'message': 'Benchmark'
+        }
+
+        timer = threading.Timer(self.delay, self.client.publish,
+                                args=(f"gate/{tornello_id}/auth_response", json.dumps(response)))
+        timer.daemon = True
+        timer.start()
+
+    def stop(self):
+        self.client.disconnect()
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark delle funzioni Python eseguite a ogni tap
+Tempi per chiamata (timeit) e allocazioni (tracemalloc) per dimensione dati,
+con confronto opzionale contro una baseline salvata
+
+Uso:
+    python3 benchmarks/microbench.py
+    python3 benchmarks/microbench.py --save-baseline benchmarks/baseline.json
+    python3 benchmarks/microbench.py --compare benchmarks/baseline.json --threshold 1.2
+    python3 benchmarks/microbench.py --filter save_offline_queue
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from datetime import datetime
+
+# Hardware simulato: deve essere impostato prima di importare i moduli del sistema
+os.environ['HARDWARE_BACKEND'] = 'simulated'
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, '..', 'src'))
+sys.path.insert(0, BENCH_DIR)
+
+from config import Config
+Config.HARDWARE_BACKEND = 'simulated'
+
+from rfid_reader import RFIDReader
+from mqtt_client import MQTTClient
+from logger import AccessLogger
+from offline_manager import OfflineManager
+from relay_manager import RelayManager
+from local_broker import LocalBroker, LocalMQTTClient
+
+SAMPLE_RAW_ID = 0xC67BD90561
+
+def sample_card_info(index=0):
+    """card_info come prodotto da RFIDManager"""
+    raw_id = SAMPLE_RAW_ID + index
+    return {
+        'raw_id': raw_id,
+        'uid_formatted': hex(raw_id)[2:].upper()[:-2],
+        'uid_hex': hex(raw_id)[2:].upper(),
+        'data': '',
+        'timestamp': time.time(),
+        'reader_id': 'in',
+        'direction': 'in'
+    }
+
+def sample_log_data(index=0):
+    """Record di log accesso come prodotto da AccessLogger.log_access_attempt"""
+    card_info = sample_card_info(index)
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'card_uid': card_info['uid_formatted'],
+        'raw_id': card_info['raw_id'],
+        'tornello_id': Config.TORNELLO_ID,
+        'direzione': 'in',
+        'authorized': True,
+        'auth_message': 'Accesso consentito',
+        'relay_activated': True,
+        'card_data': '',
+        'auth_time_ms': 42,
+        'event_type': 'access_attempt'
+    }
+
+def sample_offline_entry(index=0):
+    """Evento della coda offline come prodotto da OfflineManager"""
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'card_info': sample_card_info(index),
+        'offline_authorized': True,
+        'offline_message': 'Accesso offline consentito',
+        'sync_attempts': 0,
+        'created_offline': True,
+        'sync_type': 'audit_only',
+        'action_completed': True
+    }
+
+class BenchContext:
+    """Risorse condivise dai casi (directory temporanea, stdout silenziato)"""
+
+    def __init__(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="rfid_microbench_")
+        self.devnull = open(os.devnull, 'w')
+        self.broker = None
+        self.loggers = []
+        self.managers = []
+        self.relay_managers = []
+
+    def path(self, *parts):
+        return os.path.join(self.tmpdir, *parts)
+
+    def close(self):
+        for logger in self.loggers:
+            logger.close()
+        for manager in self.managers:
+            manager.journal.close()
+        for relay_manager in self.relay_managers:
+            with contextlib.redirect_stdout(self.devnull):
+                relay_manager.cleanup()
+        if self.broker:
+            self.broker.stop()
+        self.devnull.close()
+
+# --- Casi di benchmark ---
+# Ogni setup riceve (ctx, param) e restituisce la funzione da misurare (senza argomenti)
+
+def setup_format_card_uid(ctx, mode):
+    Config.UID_FORMAT_MODE = mode
+    reader = RFIDReader("bench")
+    return lambda: reader.format_card_uid(SAMPLE_RAW_ID)
+
+def setup_publish_card_data(ctx, param):
+    if ctx.broker is None:
+        ctx.broker = LocalBroker(latency=0)
+
+    client = MQTTClient(client_factory=lambda: LocalMQTTClient(ctx.broker))
+    client.client = client.client_factory()
+    client.client.connected = True
+    client.is_connected = True
+
+    card_info = sample_card_info()
+    return lambda: client.publish_card_data(card_info, request_id="0" * 32)
+
+def setup_card_event_encodings(ctx, param):
+    reader = RFIDReader("bench")
+    auth_result = {'authorized': True, 'message': 'Accesso consentito'}
+
+    def tap():
+        # Tutte le forme serializzate di un tap, costruite una volta ciascuna
+        event = reader.get_card_info(SAMPLE_RAW_ID, '')
+        event.direction = 'in'
+        event.reader_id = 'in'
+        event.timestamp = time.time()
+        event.wire_payload("0" * 32)
+        event.log_record(auth_result, True, 42)
+        event.csv_row()
+        event.card_record()
+    return tap
+
+def setup_write_csv_log(ctx, param):
+    logger = AccessLogger(ctx.path("csv_log"))
+    log_data = sample_log_data()
+    return lambda: logger.write_csv_log(log_data)
+
+def setup_write_json_log(ctx, entries):
+    logger = AccessLogger(ctx.path(f"json_log_{entries}"))
+
+    # Log già a regime: ogni scrittura aggiunge un record e ne scarta uno
+    with open(logger.json_log_file, 'w', encoding='utf-8') as f:
+        json.dump({'access_logs': [sample_log_data(i) for i in range(entries)]}, f, indent=2, ensure_ascii=False)
+
+    log_data = sample_log_data()
+    return lambda: logger.write_json_log(log_data)
+
+def setup_log_access_attempt(ctx, mode):
+    Config.ACCESS_LOG_ASYNC = mode == 'async'
+    Config.ACCESS_LOG_QUEUE_SIZE = 1000000  # Nessun record scartato durante la misura
+    logger = AccessLogger(ctx.path(f"access_{mode}"))
+    ctx.loggers.append(logger)
+
+    card_info = sample_card_info()
+    auth_result = {'authorized': True, 'message': 'Accesso consentito'}
+    return lambda: logger.log_access_attempt(card_info, auth_result, True, 42)
+
+def make_offline_manager(ctx, name, entries):
+    """OfflineManager con una coda già lunga 'entries' eventi"""
+    Config.LOG_DIRECTORY = ctx.path(name)
+    Config.OFFLINE_MAX_QUEUE_SIZE = 10 ** 9  # Nessuna rimozione durante la misura
+    os.makedirs(Config.LOG_DIRECTORY, exist_ok=True)
+
+    manager = OfflineManager()
+    fsync = manager.journal.fsync
+    manager.journal.fsync = False  # Riempimento veloce, la misura usa la configurazione
+    for i in range(entries):
+        entry = sample_offline_entry(i)
+        manager.journal.append(entry)
+        manager.offline_queue.append(entry)
+    manager.journal.fsync = fsync
+
+    ctx.managers.append(manager)
+    return manager
+
+def setup_add_to_offline_queue(ctx, entries):
+    manager = make_offline_manager(ctx, f"offline_add_{entries}", entries)
+    card_info = sample_card_info()
+    return lambda: manager._add_to_offline_queue(card_info, True, 'Accesso offline consentito')
+
+def setup_save_offline_queue(ctx, entries):
+    manager = make_offline_manager(ctx, f"offline_{entries}", entries)
+    return manager.save_offline_queue
+
+def setup_activate_relay(ctx, param):
+    with contextlib.redirect_stdout(ctx.devnull):
+        relay_manager = RelayManager()
+        relay_manager.initialize()
+    ctx.relay_managers.append(relay_manager)
+
+    # Relè già attivo: ogni tap prolunga il timer corrente
+    return lambda: relay_manager.activate_relay('in', 5)
+
+CASES = [
+    ('format_card_uid', setup_format_card_uid, ['remove_suffix', 'fixed_length', 'legacy']),
+    ('publish_card_data', setup_publish_card_data, [None]),
+    ('card_event_encodings', setup_card_event_encodings, [None]),
+    ('write_csv_log', setup_write_csv_log, [None]),
+    ('write_json_log', setup_write_json_log, [500]),
+    ('log_access_attempt', setup_log_access_attempt, ['sync', 'async']),
+    ('add_to_offline_queue', setup_add_to_offline_queue, [10, 1000, 10000]),
+    ('save_offline_queue', setup_save_offline_queue, [10, 1000, 10000]),
+    ('activate_relay', setup_activate_relay, [None]),
+]
+
+def case_key(name, param):
+    return name if param is None else f"{name}[{param}]"
+
+def measure_time(fn, min_time, repeat):
+    """Tempo per chiamata in microsecondi (min e mediana su 'repeat' ripetizioni)"""
+    timer = timeit.Timer(fn)
+    loops, elapsed = timer.autorange()
+
+    # Scala il numero di chiamate per raggiungere min_time per ripetizione
+    if elapsed < min_time:
+        loops = max(1, int(loops * min_time / max(elapsed, 1e-9)))
+
+    runs = [t / loops * 1e6 for t in timer.repeat(repeat=repeat, number=loops)]
+    return {
+        'loops': loops,
+        'min_us': round(min(runs), 3),
+        'median_us': round(statistics.median(runs), 3)
+    }
+
+def measure_allocations(fn):
+    """Allocazioni di una singola chiamata: picco memoria e blocchi netti"""
+    fn()  # Riscaldamento (cache, file già aperti)
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        start_current, _ = tracemalloc.get_traced_memory()
+
+        fn()
+
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    stats = after.compare_to(before, 'filename')
+    return {
+        'peak_bytes': peak - start_current,
+        'net_bytes': current - start_current,
+        'allocated_blocks': sum(s.count_diff for s in stats if s.count_diff > 0)
+    }
+
+def run_suite(args):
+    ctx = BenchContext()
+    overridden = ('UID_FORMAT_MODE', 'LOG_DIRECTORY', 'ACCESS_LOG_ASYNC',
+                  'ACCESS_LOG_QUEUE_SIZE', 'OFFLINE_MAX_QUEUE_SIZE')
+    original_config = {key: getattr(Config, key) for key in overridden}
+    results = {}
+
+    try:
+        for name, setup, params in CASES:
+            for param in params:
+                key = case_key(name, param)
+                if args.filter and args.filter not in key:
+                    continue
+
+                print(f"▶️  {key}...", flush=True)
+                with contextlib.redirect_stdout(ctx.devnull):
+                    fn = setup(ctx, param)
+                    timing = measure_time(fn, args.min_time, args.repeat)
+                    allocations = measure_allocations(fn)
+
+                results[key] = {'function': name, 'param': param, **timing, **allocations}
+    finally:
+        for key, value in original_config.items():
+            setattr(Config, key, value)
+        ctx.close()
+
+    return results
+
+def compare_with_baseline(results, baseline, threshold):
+    """Restituisce le regressioni rispetto alla baseline (mediana e picco memoria)"""
+    regressions = []
+    previous = baseline.get('results', {})
+
+    print(f"\n{'Caso':<34}{'base µs':>12}{'ora µs':>12}{'Δ tempo':>10}{'Δ picco':>10}")
+    print("-" * 78)
+
+    for key, current in results.items():
+        base = previous.get(key)
+        if not base:
+            print(f"{key:<34}{'-':>12}{current['median_us']:>12}{'nuovo':>10}")
+            continue
+
+        time_ratio = current['median_us'] / base['median_us'] if base['median_us'] else 1.0
+        peak_ratio = current['peak_bytes'] / base['peak_bytes'] if base['peak_bytes'] else 1.0
+
+        flag = ""
+        if time_ratio > threshold or peak_ratio > threshold:
+            flag = " ⚠️"
+            regressions.append(key)
+
+        print(f"{key:<34}{base['median_us']:>12}{current['median_us']:>12}"
+              f"{time_ratio:>9.2f}x{peak_ratio:>9.2f}x{flag}")
+
+    return regressions
+
+def print_report(results):
+    print(f"\n{'Caso':<34}{'min µs':>12}{'mediana µs':>12}{'picco KiB':>11}{'blocchi':>9}")
+    print("-" * 78)
+    for key, data in results.items():
+        print(f"{key:<34}{data['min_us']:>12}{data['median_us']:>12}"
+              f"{data['peak_bytes'] / 1024:>11.1f}{data['allocated_blocks']:>9}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark funzioni per-tap")
+    parser.add_argument("--filter", help="Esegue solo i casi che contengono questa stringa")
+    parser.add_argument("--repeat", type=int, default=5, help="Ripetizioni per caso")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Durata minima di ogni ripetizione (s)")
+    parser.add_argument("--output", "-o", help="Salva i risultati in JSON")
+    parser.add_argument("--save-baseline", help="Salva i risultati come baseline")
+    parser.add_argument("--compare", help="Confronta con una baseline salvata")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="Rapporto oltre il quale un caso è una regressione (default 1.2)")
+    args = parser.parse_args()
+
+    print("🧪 MICROBENCHMARK FUNZIONI PER-TAP")
+    print("=" * 40)
+
+    results = run_suite(args)
+    print_report(results)
+
+    report = {
+        'benchmark': 'microbench',
+        'timestamp': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'machine': platform.machine()
+        },
+        'results': results
+    }
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+            print(f"\n💾 Risultati salvati in {path}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+        regressions = compare_with_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ Regressioni oltre {args.threshold}x: {', '.join(regressions)}")
+            sys.exit(1)
+        print(f"\n✅ Nessuna regressione oltre {args.threshold}x")
+
+if __name__ == "__main__":
+    main()
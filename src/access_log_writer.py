@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Scrittore asincrono dei log accessi (CSV + JSON Lines)
+I record arrivano da una coda limitata e vengono scritti a blocchi da un thread
+dedicato: il percorso card -> relè non attende mai il disco. Il JSON è in
+append (un record compatto per riga) con rotazione per dimensione
+"""
+import atexit
+import csv
+import json
+import os
+import threading
+import time
+from queue import Queue, Full, Empty
+from config import Config
+from metrics import registry
+
+LOG_PENDING = registry.gauge('access_log_pending_records', 'Record log accessi in coda verso il disco')
+LOG_LAG = registry.histogram('access_log_lag_seconds', 'Ritardo tra accodamento e scrittura su file')
+LOG_DROPPED = registry.counter('access_log_dropped_total', 'Record log accessi scartati (coda piena)')
+
+# Colonne del log CSV (il JSON contiene anche i campi aggiuntivi)
+CSV_FIELDS = (
+    'timestamp',
+    'card_uid',
+    'raw_id',
+    'tornello_id',
+    'direzione',
+    'authorized',
+    'auth_message',
+    'relay_activated',
+    'card_data',
+    'auth_time_ms',
+    'event_type'
+)
+
+def csv_row(log_data):
+    """Riga CSV di un record di log"""
+    return [log_data[field] for field in CSV_FIELDS]
+
+class _FlushMarker:
+    """Segnaposto in coda: completato quando i record precedenti sono su file"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+class AccessLogWriter:
+    """Writer in background con file CSV e JSON Lines aperti in append"""
+
+    FSYNC_POLICIES = ('never', 'batch', 'interval')
+
+    def __init__(self, csv_path, json_path, queue_size=None, flush_interval=None,
+                 fsync_policy=None, fsync_interval=None, json_max_bytes=None):
+        self.csv_path = csv_path
+        self.json_path = json_path
+        self.flush_interval = flush_interval if flush_interval is not None else Config.ACCESS_LOG_FLUSH_INTERVAL
+        self.fsync_policy = fsync_policy or Config.ACCESS_LOG_FSYNC
+        self.fsync_interval = fsync_interval if fsync_interval is not None else Config.ACCESS_LOG_FSYNC_INTERVAL
+        self.json_max_bytes = json_max_bytes if json_max_bytes is not None else Config.ACCESS_LOG_JSONL_MAX_BYTES
+
+        if self.fsync_policy not in self.FSYNC_POLICIES:
+            print(f"⚠️ ACCESS_LOG_FSYNC non valido: {self.fsync_policy}, uso 'batch'")
+            self.fsync_policy = 'batch'
+
+        self._queue = Queue(maxsize=queue_size or Config.ACCESS_LOG_QUEUE_SIZE)
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        # Stato file (usato solo dal thread writer)
+        self._csv_file = None
+        self._csv_writer = None
+        self._json_file = None
+        self._last_fsync = 0
+
+        LOG_PENDING.set_function(self.pending)
+
+        # Statistiche
+        self.stats = {
+            'queued': 0,
+            'written': 0,
+            'dropped': 0,
+            'batches': 0,
+            'max_batch': 0,
+            'fsyncs': 0,
+            'rotations': 0,
+            'errors': 0
+        }
+
+    def start(self):
+        """Avvia il thread writer (idempotente)"""
+        with self._start_lock:
+            if self._thread and self._thread.is_alive():
+                return
+
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True, name="AccessLogWriter")
+            self._thread.start()
+
+        # Ultimo flush anche se il processo termina senza close()
+        atexit.register(self.close)
+
+    def submit(self, log_data, row=None):
+        """
+        Accoda un record senza bloccare (row: riga CSV già pronta, opzionale)
+        Returns: False se la coda è piena (record scartato)
+        """
+        if not self._thread:
+            self.start()
+
+        try:
+            self._queue.put_nowait((time.monotonic(), log_data, row))
+            self.stats['queued'] += 1
+            return True
+        except Full:
+            self.stats['dropped'] += 1
+            LOG_DROPPED.inc()
+            if self.stats['dropped'] == 1 or self.stats['dropped'] % 100 == 0:
+                print(f"⚠️ Coda log accessi piena: {self.stats['dropped']} record scartati")
+            return False
+
+    def flush(self, timeout=5.0):
+        """Attende che i record accodati finora siano scritti su file"""
+        if not self._thread or not self._thread.is_alive():
+            return True
+
+        marker = _FlushMarker()
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except Full:
+            return False
+
+        self._wake.set()
+        return marker.done.wait(timeout)
+
+    def close(self, timeout=5.0):
+        """Ferma il writer scrivendo i record rimasti"""
+        if self._thread and self._thread.is_alive():
+            self._stop.set()
+            self._wake.set()
+            self._thread.join(timeout=timeout)
+
+        self._close_files()
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+
+            stopping = self._stop.is_set()
+            self._write_batch(self._drain())
+
+            if stopping:
+                # Record accodati durante l'ultima scrittura
+                self._write_batch(self._drain())
+                return
+
+    def _drain(self):
+        items = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except Empty:
+                return items
+
+    def _write_batch(self, items):
+        queued = [item for item in items if not isinstance(item, _FlushMarker)]
+        records = [(log_data, row) for _, log_data, row in queued]
+
+        if records:
+            try:
+                self._append_csv(records)
+                self._append_json(records)
+                self._sync_files()
+
+                written_at = time.monotonic()
+                for enqueued_at, _, _ in queued:
+                    LOG_LAG.observe(written_at - enqueued_at)
+
+                self.stats['written'] += len(records)
+                self.stats['batches'] += 1
+                self.stats['max_batch'] = max(self.stats['max_batch'], len(records))
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"Errore scrittura log accessi: {e}")
+
+        for item in items:
+            if isinstance(item, _FlushMarker):
+                item.done.set()
+
+    def _append_csv(self, records):
+        if self._csv_file is None:
+            self._csv_file = open(self.csv_path, 'a', newline='', encoding='utf-8')
+            self._csv_writer = csv.writer(self._csv_file)
+
+        self._csv_writer.writerows([row or csv_row(log_data) for log_data, row in records])
+        self._csv_file.flush()
+
+    def _append_json(self, records):
+        # Un record per riga: costo proporzionale al blocco, non alla storia del file
+        if self._json_file is None:
+            self._json_file = open(self.json_path, 'a', encoding='utf-8')
+
+        self._json_file.write(''.join(
+            json.dumps(log_data, ensure_ascii=False, separators=(',', ':')) + '\n'
+            for log_data, _ in records
+        ))
+        self._json_file.flush()
+
+        if self.json_max_bytes and self._json_file.tell() >= self.json_max_bytes:
+            self._rotate_json()
+
+    def _rotate_json(self):
+        """Segmento pieno: diventa <file>.1 (sostituendo il precedente)"""
+        if self.fsync_policy != 'never':
+            os.fsync(self._json_file.fileno())
+        self._json_file.close()
+        os.replace(self.json_path, self.json_path + ".1")
+        self._json_file = open(self.json_path, 'a', encoding='utf-8')
+        self.stats['rotations'] += 1
+
+    def _should_fsync(self):
+        if self.fsync_policy == 'batch':
+            return True
+        if self.fsync_policy == 'interval':
+            return time.monotonic() - self._last_fsync >= self.fsync_interval
+        return False
+
+    def _sync_files(self):
+        if not self._should_fsync():
+            return
+
+        os.fsync(self._csv_file.fileno())
+        os.fsync(self._json_file.fileno())
+        self._last_fsync = time.monotonic()
+        self.stats['fsyncs'] += 1
+
+    def _close_files(self):
+        if self._csv_file is not None:
+            try:
+                self._csv_file.flush()
+                if self.fsync_policy != 'never':
+                    os.fsync(self._csv_file.fileno())
+                self._csv_file.close()
+            except Exception as e:
+                print(f"Errore chiusura log CSV: {e}")
+            self._csv_file = None
+            self._csv_writer = None
+
+        if self._json_file is not None:
+            try:
+                self._json_file.flush()
+                if self.fsync_policy != 'never':
+                    os.fsync(self._json_file.fileno())
+                self._json_file.close()
+            except Exception as e:
+                print(f"Errore chiusura log JSON: {e}")
+            self._json_file = None
+
+    def get_status(self):
+        """Status writer"""
+        return {
+            'running': bool(self._thread and self._thread.is_alive()),
+            'pending': self._queue.qsize(),
+            'flush_interval': self.flush_interval,
+            'fsync_policy': self.fsync_policy,
+            'stats': self.stats.copy()
+        }
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Trace per singolo accesso: istanti monotoni delle fasi dalla lettura al log
+Ogni card_info porta la propria AccessTrace; le durate per fase finiscono nel
+log accessi JSON, negli istogrammi delle metriche e (a campione) in un file
+JSON lines per l'analisi della coda lunga di latenza
+"""
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from config import Config
+from metrics import registry
+
+# Fasi nell'ordine del percorso card -> relè -> log
+DETECTED = 'detected'          # read() del lettore ha restituito l'UID
+ENQUEUED = 'enqueued'          # Card messa nella coda del manager
+DEQUEUED = 'dequeued'          # Card presa da un worker
+AUTH_SENT = 'auth_sent'        # Badge pubblicato (o inizio decisione locale)
+AUTH_RECEIVED = 'auth_received'  # Decisione disponibile
+RELAY_ON = 'relay_on'          # activate() del relè completato
+RELAY_OFF = 'relay_off'        # Relè spento dallo scheduler
+LOGGED = 'logged'              # Record consegnato al logger
+
+STAGES = (DETECTED, ENQUEUED, DEQUEUED, AUTH_SENT, AUTH_RECEIVED, RELAY_ON, RELAY_OFF, LOGGED)
+
+# Intervalli misurati: nome -> (fase iniziale, fase finale)
+SPANS = (
+    ('enqueue', DETECTED, ENQUEUED),
+    ('queue_wait', ENQUEUED, DEQUEUED),
+    ('pre_auth', DEQUEUED, AUTH_SENT),
+    ('auth', AUTH_SENT, AUTH_RECEIVED),
+    ('relay', AUTH_RECEIVED, RELAY_ON),
+    ('log', RELAY_ON, LOGGED),
+    ('relay_hold', RELAY_ON, RELAY_OFF),
+    ('total', DETECTED, LOGGED),
+)
+
+STAGE_LATENCY = registry.histogram('access_stage_seconds', 'Durata delle fasi di un accesso', ('stage',))
+
+class AccessTrace:
+    """Istanti time.monotonic() delle fasi di un singolo accesso"""
+
+    __slots__ = ('trace_id', 'marks', 'finished')
+
+    _ids = itertools.count(1)  # next() atomico sotto il GIL
+
+    def __init__(self, detected_at=None):
+        self.trace_id = next(AccessTrace._ids)
+        self.marks = {DETECTED: time.monotonic() if detected_at is None else detected_at}
+        self.finished = False
+
+    def mark(self, stage, at=None):
+        """Registra l'istante di una fase (sovrascrive un valore precedente)"""
+        self.marks[stage] = time.monotonic() if at is None else at
+
+    def offsets_ms(self):
+        """Istanti delle fasi in ms dal rilevamento"""
+        start = self.marks[DETECTED]
+        return {stage: round((self.marks[stage] - start) * 1000, 3)
+                for stage in STAGES if stage in self.marks}
+
+    def spans_ms(self):
+        """Durata in ms degli intervalli con entrambe le fasi registrate"""
+        marks = self.marks
+        spans = {}
+        for name, begin, end in SPANS:
+            if name == 'log' and RELAY_ON not in marks:
+                begin = AUTH_RECEIVED  # Accesso negato: log subito dopo la decisione
+            if begin in marks and end in marks:
+                spans[name] = round((marks[end] - marks[begin]) * 1000, 3)
+        return spans
+
+    def is_complete(self):
+        """Loggato e, se il relè è stato acceso, anche spento"""
+        return LOGGED in self.marks and (RELAY_ON not in self.marks or RELAY_OFF in self.marks)
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'offsets_ms': self.offsets_ms(),
+            'spans_ms': self.spans_ms()
+        }
+
+class AccessTracer:
+    """
+    Chiude le trace completate: istogrammi per fase sempre, export su file
+    JSON lines solo per una frazione (TRACE_SAMPLE_RATE) degli accessi
+    """
+
+    def __init__(self, sample_rate=None, export_path=None):
+        self.sample_rate = sample_rate if sample_rate is not None else Config.TRACE_SAMPLE_RATE
+        self.export_path = export_path or os.path.join(Config.LOG_DIRECTORY, Config.TRACE_EXPORT_FILE)
+        self._lock = threading.Lock()
+
+        # Statistiche
+        self.stats = {
+            'finished': 0,
+            'exported': 0,
+            'errors': 0
+        }
+
+    def finish(self, trace, context=None):
+        """
+        Chiamata dopo il log e allo spegnimento del relè: la trace viene chiusa
+        una sola volta, quando entrambe le fasi sono registrate
+        Returns: True se la trace è stata chiusa da questa chiamata
+        """
+        if trace is None:
+            return False
+
+        with self._lock:
+            if trace.finished or not trace.is_complete():
+                return False
+            trace.finished = True
+            self.stats['finished'] += 1
+            sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+
+        spans = trace.spans_ms()
+        for name, value in spans.items():
+            STAGE_LATENCY.labels(name).observe(value / 1000)
+
+        if sampled:
+            record = dict(context or {})
+            record.update(trace.to_dict())
+            self._export(record)
+        return True
+
+    def _export(self, record):
+        try:
+            line = json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+            with self._lock:
+                with open(self.export_path, 'a', encoding='utf-8') as export_file:
+                    export_file.write(line + '\n')
+                self.stats['exported'] += 1
+        except Exception as e:
+            self.stats['errors'] += 1
+            print(f"⚠️ Errore export trace: {e}")
+
+    def get_status(self):
+        return dict(self.stats, sample_rate=self.sample_rate, export_path=self.export_path)
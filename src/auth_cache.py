@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Cache locale delle decisioni di autorizzazione
+Evita il round trip MQTT per le card viste di recente
+"""
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+from metrics import registry
+
+CACHE_LOOKUPS = registry.counter('auth_cache_lookups_total', 'Ricerche nella cache decisioni auth', ('result',))
+CACHE_HITS = CACHE_LOOKUPS.labels('hit')
+CACHE_MISSES = CACHE_LOOKUPS.labels('miss')
+
+class AuthCache:
+    """Cache LRU con scadenza (TTL) per decisioni positive e negative"""
+
+    def __init__(self, max_size=None, ttl=None, negative_ttl=None):
+        self.max_size = max_size or Config.AUTH_CACHE_MAX_SIZE
+        self.ttl = ttl if ttl is not None else Config.AUTH_CACHE_TTL
+        self.negative_ttl = negative_ttl if negative_ttl is not None else Config.AUTH_CACHE_NEGATIVE_TTL
+
+        # card_uid -> (scadenza, authorized, message)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Statistiche
+        self.stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expired': 0,
+            'invalidations': 0
+        }
+
+    def get(self, card_uid):
+        """
+        Restituisce la decisione in cache per la card
+        Returns: dict risultato auth oppure None se assente/scaduta
+        """
+        if not card_uid:
+            return None
+
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(card_uid)
+
+            if entry is None:
+                self.stats['misses'] += 1
+                CACHE_MISSES.inc()
+                return None
+
+            expires_at, authorized, message = entry
+
+            if now >= expires_at:
+                # Scaduta: rimuovi e tratta come miss
+                del self._entries[card_uid]
+                self.stats['expired'] += 1
+                self.stats['misses'] += 1
+                CACHE_MISSES.inc()
+                return None
+
+            self._entries.move_to_end(card_uid)
+            self.stats['hits'] += 1
+            CACHE_HITS.inc()
+
+        return {
+            'authorized': authorized,
+            'message': message,
+            'cached': True,
+            'access_type': 'online_cached'
+        }
+
+    def put(self, card_uid, authorized, message=''):
+        """Memorizza una decisione ricevuta dal server"""
+        if not card_uid:
+            return
+
+        ttl = self.ttl if authorized else self.negative_ttl
+        if ttl <= 0:
+            # TTL nullo: decisione non memorizzabile
+            self.invalidate(card_uid)
+            return
+
+        expires_at = time.monotonic() + ttl
+
+        with self._lock:
+            self._entries[card_uid] = (expires_at, bool(authorized), message)
+            self._entries.move_to_end(card_uid)
+
+            # Limite dimensione: rimuove le meno usate di recente
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+
+    def invalidate(self, card_uid):
+        """Rimuove una card dalla cache (es. revoca dal server)"""
+        with self._lock:
+            if self._entries.pop(card_uid, None) is not None:
+                self.stats['invalidations'] += 1
+                return True
+        return False
+
+    def clear(self):
+        """Svuota completamente la cache"""
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self.stats['invalidations'] += count
+        return count
+
+    def purge_expired(self):
+        """Rimuove le voci scadute"""
+        now = time.monotonic()
+
+        with self._lock:
+            expired = [uid for uid, entry in self._entries.items() if now >= entry[0]]
+            for uid in expired:
+                del self._entries[uid]
+            self.stats['expired'] += len(expired)
+
+        return len(expired)
+
+    def handle_invalidation(self, payload):
+        """
+        Applica un messaggio di invalidazione dal server
+        Formati supportati:
+            {"card_uid": "C67BD905"}
+            {"card_uids": ["C67BD905", "A1B2C3D4"]}
+            {"all": true}
+        """
+        if payload.get('all'):
+            count = self.clear()
+            print(f"🧹 Cache auth svuotata dal server ({count} voci)")
+            return count
+
+        card_uids = list(payload.get('card_uids', []))
+        if payload.get('card_uid'):
+            card_uids.append(payload['card_uid'])
+
+        removed = 0
+        for card_uid in card_uids:
+            if self.invalidate(card_uid):
+                removed += 1
+
+        if card_uids:
+            print(f"🧹 Cache auth invalidata per {len(card_uids)} card ({removed} presenti)")
+
+        return removed
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def get_status(self):
+        """Status cache"""
+        with self._lock:
+            size = len(self._entries)
+            stats = self.stats.copy()
+
+        lookups = stats['hits'] + stats['misses']
+
+        return {
+            'size': size,
+            'max_size': self.max_size,
+            'ttl': self.ttl,
+            'negative_ttl': self.negative_ttl,
+            'hit_rate': round(stats['hits'] / lookups, 3) if lookups else 0.0,
+            'stats': stats
+        }
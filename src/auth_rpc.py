@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Multiplexer richieste/risposte di autenticazione MQTT
+Ogni richiesta ha un ID di correlazione e un evento dedicato
+"""
+import threading
+import time
+import uuid
+
+# Prefisso dei badge già decisi dalla cache: la risposta aggiorna solo la cache
+REFRESH_PREFIX = 'refresh-'
+
+def refresh_request_id():
+    """ID per il badge inviato dopo una decisione da cache (mai associato per card_uid)"""
+    return REFRESH_PREFIX + uuid.uuid4().hex
+
+class PendingAuthRequest:
+    """Richiesta di autenticazione in attesa di risposta"""
+
+    def __init__(self, card_uid, timeout):
+        self.request_id = uuid.uuid4().hex
+        self.card_uid = card_uid
+        self.created_at = time.monotonic()
+        self.deadline = self.created_at + timeout
+        self.event = threading.Event()
+        self.response = None
+
+        # Contesto della richiesta (per riconciliare le risposte tardive)
+        self.card_info = None
+        self.local_result = None
+
+    def is_expired(self, now=None):
+        return (now or time.monotonic()) >= self.deadline
+
+    def remaining(self):
+        return max(0.0, self.deadline - time.monotonic())
+
+class AuthRequestMultiplexer:
+    """Gestisce più richieste di autenticazione contemporanee"""
+
+    def __init__(self, on_abandoned_expired=None):
+        self._pending = {}  # request_id -> PendingAuthRequest
+        self._lock = threading.Lock()
+
+        # Chiamato per le richieste abbandonate mai risolte dal server
+        self.on_abandoned_expired = on_abandoned_expired
+
+        # Statistiche
+        self.stats = {
+            'requests': 0,
+            'responses': 0,
+            'timeouts': 0,
+            'unmatched': 0,
+            'refresh_responses': 0,
+            'abandoned': 0,
+            'late_responses': 0,
+            'swept': 0
+        }
+
+    def register(self, card_uid, timeout):
+        """Registra una nuova richiesta e restituisce il suo handle"""
+        pending = PendingAuthRequest(card_uid, timeout)
+
+        with self._lock:
+            expired = self._sweep_locked(time.monotonic())
+            self._pending[pending.request_id] = pending
+            self.stats['requests'] += 1
+
+        self._notify_expired(expired)
+        return pending
+
+    def wait(self, pending, timeout=None):
+        """
+        Attende la risposta (svegliato direttamente da resolve)
+        Returns: dict risposta oppure None se scaduta
+        """
+        if timeout is None:
+            timeout = pending.remaining()
+
+        if pending.event.wait(timeout):
+            return pending.response
+
+        return None
+
+    def cancel(self, pending, timed_out=True):
+        """Rimuove la richiesta (es. dopo timeout)"""
+        with self._lock:
+            if self._pending.pop(pending.request_id, None) is not None and timed_out:
+                self.stats['timeouts'] += 1
+
+    def abandon(self, pending, local_result):
+        """
+        Il chiamante ha deciso localmente: la richiesta resta registrata
+        fino alla scadenza per accogliere la risposta tardiva del server
+        Returns: risposta se è arrivata nel frattempo, altrimenti None
+        """
+        with self._lock:
+            if pending.response is not None:
+                return pending.response
+
+            pending.local_result = local_result
+            self.stats['abandoned'] += 1
+
+        return None
+
+    def resolve(self, payload, response):
+        """
+        Associa una risposta del server alla richiesta in attesa
+        Usa request_id se presente, altrimenti la richiesta più vecchia
+        per la stessa card (server che non rimandano l'ID). Le risposte ai
+        badge decisi dalla cache (REFRESH_PREFIX) non risolvono nessuna richiesta
+        Returns: PendingAuthRequest risolta oppure None
+        """
+        request_id = payload.get('request_id')
+        card_uid = payload.get('card_uid')
+
+        with self._lock:
+            now = time.monotonic()
+            expired = self._sweep_locked(now)
+
+            pending = None
+            refresh = bool(request_id) and request_id.startswith(REFRESH_PREFIX)
+            if refresh:
+                self.stats['refresh_responses'] += 1
+            elif request_id:
+                pending = self._pending.pop(request_id, None)
+            elif card_uid:
+                candidates = [p for p in self._pending.values() if p.card_uid == card_uid]
+                if candidates:
+                    pending = min(candidates, key=lambda p: p.created_at)
+                    del self._pending[pending.request_id]
+
+            if pending is not None:
+                pending.response = response
+                self.stats['responses'] += 1
+                if pending.local_result is not None:
+                    self.stats['late_responses'] += 1
+            elif not refresh:
+                self.stats['unmatched'] += 1
+
+        self._notify_expired(expired)
+
+        if pending is not None:
+            pending.event.set()
+        return pending
+
+    def sweep(self):
+        """Rimuove le richieste scadute"""
+        with self._lock:
+            expired = self._sweep_locked(time.monotonic())
+
+        self._notify_expired(expired)
+        return len(expired)
+
+    def _sweep_locked(self, now):
+        expired = [p for p in self._pending.values() if p.is_expired(now)]
+        for pending in expired:
+            del self._pending[pending.request_id]
+        self.stats['swept'] += len(expired)
+        return expired
+
+    def _notify_expired(self, expired):
+        if not self.on_abandoned_expired:
+            return
+
+        for pending in expired:
+            if pending.local_result is not None:
+                try:
+                    self.on_abandoned_expired(pending)
+                except Exception as e:
+                    print(f"⚠️ Errore callback richiesta scaduta: {e}")
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
+
+    def get_status(self):
+        """Status multiplexer"""
+        with self._lock:
+            return {
+                'in_flight': len(self._pending),
+                'stats': self.stats.copy()
+            }
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Evento card unico per tutto il percorso di un tap
+Il lettore crea un CardEvent che attraversa coda, autenticazione, log e coda
+offline; le forme serializzate (payload MQTT, record del log con riga CSV,
+record per journal/coda offline) vengono costruite una sola volta e riusate
+"""
+from datetime import datetime
+from config import Config
+from access_log_writer import csv_row
+from wire_codec import get_wire_codecs
+
+class CardEvent:
+    """
+    Dati di una presentazione card con accesso anche in stile dict
+    (get/[]/in) per il codice che tratta card_info come dizionario.
+    I campi vanno impostati prima del primo encode: le forme in cache
+    non vengono ricalcolate
+    """
+
+    # Campi pubblici (stessi nomi delle chiavi del vecchio dict card_info)
+    FIELDS = ('raw_id', 'uid_formatted', 'uid_hex', 'data', 'data_length',
+              'direction', 'lane', 'reader_id', 'timestamp', 'event_seq', 'trace')
+
+    __slots__ = FIELDS + ('_fields', '_wire', '_record', '_log', '_csv')
+
+    def __init__(self, **fields):
+        for key, value in fields.items():
+            setattr(self, key, value)
+        self._fields = None    # Campi del payload badge
+        self._wire = None      # ((request_id, codifica), payload codificato)
+        self._record = None    # Campi persistenti (coda offline / journal)
+        self._log = None       # Record del log accessi
+        self._csv = None       # Riga CSV del record di log
+
+    @classmethod
+    def coerce(cls, card_info):
+        """CardEvent da un card_info (già evento o dict)"""
+        if isinstance(card_info, cls):
+            return card_info
+        return cls(**{key: value for key, value in card_info.items() if key in cls.FIELDS})
+
+    # --- Accesso stile dict (un campo non impostato equivale a chiave assente) ---
+
+    def get(self, key, default=None):
+        if key not in self.FIELDS:
+            return default
+        return getattr(self, key, default)
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.FIELDS and hasattr(self, key)
+
+    def keys(self):
+        return [key for key in self.FIELDS if hasattr(self, key)]
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+    # --- Forme serializzate (una volta per tap) ---
+
+    def wire_fields(self):
+        """Campi del payload badge (senza request_id)"""
+        if self._fields is not None:
+            return self._fields
+
+        get = self.get
+        payload = {
+            "card_uid": get('uid_formatted'),
+            "identificativo_tornello": Config.TORNELLO_ID,
+            "direzione": get('direction', 'unknown'),
+            "timestamp": datetime.now().isoformat(),
+            "raw_id": str(get('raw_id')),
+            "card_data": get('data'),
+            "hex_id": get('uid_hex'),
+            "auth_required": Config.AUTH_ENABLED,
+            "reader_id": get('reader_id', 'unknown')
+        }
+
+        if get('event_seq') is not None:
+            payload["event_seq"] = self.event_seq
+
+        self._fields = payload
+        return payload
+
+    def wire_payload(self, request_id=None, codec=None):
+        """Payload del badge codificato per il topic MQTT (codifica negoziata per 'badge')"""
+        codec = codec or get_wire_codecs().codec_for('badge')
+        key = (request_id, codec.name)
+        if self._wire is not None and self._wire[0] == key:
+            return self._wire[1]
+
+        payload = self.wire_fields()
+        if request_id:
+            payload = dict(payload, request_id=request_id)
+
+        self._wire = (key, codec.encode(payload))
+        return self._wire[1]
+
+    def card_record(self):
+        """Campi persistenti (senza trace) per coda offline e journal"""
+        if self._record is None:
+            self._record = {key: value for key, value in self.items() if key != 'trace'}
+        return self._record
+
+    def log_record(self, auth_result=None, relay_success=False, auth_time_ms=0):
+        """Record del log accessi con l'esito del tap"""
+        get = self.get
+        log_data = {
+            'timestamp': datetime.now().isoformat(),
+            'card_uid': get('uid_formatted', 'N/A'),
+            'raw_id': get('raw_id', 'N/A'),
+            'tornello_id': Config.TORNELLO_ID,
+            'direzione': get('direction', 'unknown'),
+            'authorized': auth_result.get('authorized', False) if auth_result else False,
+            'auth_message': auth_result.get('message', '') if auth_result else '',
+            'relay_activated': relay_success,
+            'card_data': get('data', ''),
+            'auth_time_ms': auth_time_ms,
+            'event_type': 'access_attempt'
+        }
+
+        # Sequenza evento e durate per fase (solo JSON: il CSV mantiene le sue colonne)
+        if get('event_seq') is not None:
+            log_data['event_seq'] = self.event_seq
+        trace = get('trace')
+        if trace is not None:
+            log_data['trace'] = trace.to_dict()
+
+        self._log = log_data
+        self._csv = None
+        return log_data
+
+    def csv_row(self):
+        """Riga CSV dell'ultimo record di log"""
+        if self._csv is None and self._log is not None:
+            self._csv = csv_row(self._log)
+        return self._csv
+
+    def __repr__(self):
+        return f"CardEvent({', '.join(f'{key}={value!r}' for key, value in self.items())})"
+
+def card_record(card_info):
+    """Campi persistenti di un card_info (evento o dict)"""
+    if isinstance(card_info, CardEvent):
+        return card_info.card_record()
+    return {key: value for key, value in card_info.items() if key != 'trace'}
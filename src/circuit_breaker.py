@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Circuit breaker per il percorso di autenticazione online
+Evita di attendere AUTH_TIMEOUT quando il server auth non risponde
+"""
+import threading
+import time
+from collections import deque
+from config import Config
+
+class CircuitBreaker:
+    """Circuit breaker a tre stati: closed, open, half_open"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name="auth", failure_threshold=None, window_size=None,
+                 slow_call_ms=None, open_duration=None, on_state_change=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or Config.AUTH_BREAKER_FAILURE_THRESHOLD
+        self.window_size = window_size or Config.AUTH_BREAKER_WINDOW
+        self.slow_call_ms = slow_call_ms or Config.AUTH_BREAKER_SLOW_MS
+        self.open_duration = open_duration if open_duration is not None else Config.AUTH_BREAKER_OPEN_SECONDS
+        self.on_state_change = on_state_change
+
+        self.state = self.CLOSED
+        self._outcomes = deque(maxlen=self.window_size)  # True = fallimento
+        self._opened_at = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+        # Statistiche
+        self.stats = {
+            'successes': 0,
+            'failures': 0,
+            'slow_calls': 0,
+            'rejected': 0,
+            'trips': 0,
+            'last_latency_ms': None
+        }
+
+    def allow_request(self):
+        """
+        True se la richiesta può andare al server
+        In half_open passa una sola richiesta di prova alla volta
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_duration:
+                    self.stats['rejected'] += 1
+                    return False
+                self._transition(self.HALF_OPEN)
+
+            # HALF_OPEN
+            if self._probe_in_flight:
+                self.stats['rejected'] += 1
+                return False
+
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self, latency_ms):
+        """Registra una risposta del server (lenta = fallimento)"""
+        slow = latency_ms > self.slow_call_ms
+
+        with self._lock:
+            self.stats['last_latency_ms'] = latency_ms
+            if slow:
+                self.stats['slow_calls'] += 1
+            else:
+                self.stats['successes'] += 1
+
+            self._record_locked(failed=slow)
+
+    def record_failure(self):
+        """Registra un timeout o un errore del server"""
+        with self._lock:
+            self.stats['failures'] += 1
+            self._record_locked(failed=True)
+
+    def release_probe(self):
+        """Libera la prova in half_open senza esito (es. decisione da cache)"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def fail_probe(self):
+        """
+        Prova in half_open senza risposta entro il budget: fallimento subito,
+        senza attendere la scadenza della richiesta abbandonata
+        """
+        with self._lock:
+            if self.state == self.HALF_OPEN and self._probe_in_flight:
+                self.stats['failures'] += 1
+                self._record_locked(failed=True)
+
+    def reset(self):
+        """Torna allo stato chiuso"""
+        with self._lock:
+            self._outcomes.clear()
+            self._probe_in_flight = False
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+
+    def _record_locked(self, failed):
+        if self.state == self.HALF_OPEN:
+            self._probe_in_flight = False
+            if failed:
+                self._trip()
+            else:
+                self._outcomes.clear()
+                self._transition(self.CLOSED)
+            return
+
+        if self.state == self.OPEN:
+            # Risposta tardiva di una richiesta partita prima dell'apertura
+            return
+
+        self._outcomes.append(failed)
+        if sum(self._outcomes) >= self.failure_threshold:
+            self._trip()
+
+    def _trip(self):
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.stats['trips'] += 1
+        self._transition(self.OPEN)
+
+    def _transition(self, new_state):
+        old_state = self.state
+        self.state = new_state
+
+        icons = {self.CLOSED: "🟢", self.OPEN: "🔴", self.HALF_OPEN: "🟡"}
+        print(f"{icons[new_state]} Circuit breaker {self.name}: {old_state} → {new_state}")
+
+        if self.on_state_change:
+            try:
+                self.on_state_change(old_state, new_state)
+            except Exception as e:
+                print(f"⚠️ Errore callback circuit breaker: {e}")
+
+    def get_status(self):
+        """Status circuit breaker"""
+        with self._lock:
+            return {
+                'name': self.name,
+                'state': self.state,
+                'recent_failures': sum(self._outcomes),
+                'failure_threshold': self.failure_threshold,
+                'slow_call_ms': self.slow_call_ms,
+                'open_duration': self.open_duration,
+                'stats': self.stats.copy()
+            }
@@ -60,6 +60,18 @@ class Config:
     MQTT_PASSWORD = os.getenv('MQTT_PASSWORD', '28dade03$')
     MQTT_USE_TLS = os.getenv('MQTT_USE_TLS', 'True').lower() == 'true'
     
+    # Codifica payload MQTT: json | cbor, per topic con WIRE_CODEC_TOPICS ("badge=cbor,...")
+    WIRE_CODEC = os.getenv('WIRE_CODEC', 'json').lower()
+    WIRE_CODEC_TOPICS = os.getenv('WIRE_CODEC_TOPICS', '')
+    WIRE_CODEC_NEGOTIATE = os.getenv('WIRE_CODEC_NEGOTIATE', 'True').lower() == 'true'
+    WIRE_CODEC_TOPIC_SUFFIX = os.getenv('WIRE_CODEC_TOPIC_SUFFIX', 'codec')
+    WIRE_JSON_BACKEND = os.getenv('WIRE_JSON_BACKEND', 'auto').lower()  # auto | orjson | stdlib
+    MQTT_PAYLOAD_DEBUG = os.getenv('MQTT_PAYLOAD_DEBUG', 'False').lower() == 'true'  # Payload badge e PUBACK
+    
+    # Hardware: 'rpi' (GPIO/SPI reali) oppure 'simulated' (test e benchmark su PC)
+    HARDWARE_BACKEND = os.getenv('HARDWARE_BACKEND', 'rpi').lower()
+    SIMULATED_TAP_SCRIPT = os.getenv('SIMULATED_TAP_SCRIPT', '')
+    
     # Tornello
     TORNELLO_ID = os.getenv('TORNELLO_ID', 'tornello_01')
     
@@ -68,6 +80,16 @@ class Config:
     ENABLE_IN_READER = os.getenv('ENABLE_IN_READER', 'True').lower() == 'true'
     ENABLE_OUT_READER = os.getenv('ENABLE_OUT_READER', 'True').lower() == 'true'
     
+    # Pipeline: un worker decisioni per direzione invece del loop seriale
+    PIPELINE_MODE = os.getenv('PIPELINE_MODE', 'False').lower() == 'true'
+    
+    # Lettori e relè multipli: liste di ID (vuote = solo IN/OUT come sotto)
+    # Ogni ID usa RFID_<ID>_RST_PIN/_SDA_PIN/_DIRECTION/_LANE e
+    # RELAY_<ID>_PIN/_ACTIVE_TIME/_ACTIVE_LOW/_INITIAL_STATE/_DIRECTION/_LANE
+    RFID_READERS = os.getenv('RFID_READERS', '')
+    RELAYS = os.getenv('RELAYS', '')
+    DEFAULT_LANE = os.getenv('DEFAULT_LANE', 'main')
+    
     # RFID IN
     RFID_IN_RST_PIN = int(os.getenv('RFID_IN_RST_PIN', 22))
     RFID_IN_SDA_PIN = int(os.getenv('RFID_IN_SDA_PIN', 8))
@@ -97,6 +119,23 @@ class Config:
     AUTH_TIMEOUT = int(os.getenv('AUTH_TIMEOUT', 5))
     AUTH_TOPIC_SUFFIX = os.getenv('AUTH_TOPIC_SUFFIX', 'auth_response')
     
+    # Cache decisioni autorizzazione
+    AUTH_CACHE_ENABLED = os.getenv('AUTH_CACHE_ENABLED', 'True').lower() == 'true'
+    AUTH_CACHE_MAX_SIZE = int(os.getenv('AUTH_CACHE_MAX_SIZE', 5000))
+    AUTH_CACHE_TTL = int(os.getenv('AUTH_CACHE_TTL', 300))
+    AUTH_CACHE_NEGATIVE_TTL = int(os.getenv('AUTH_CACHE_NEGATIVE_TTL', 30))
+    AUTH_INVALIDATE_TOPIC_SUFFIX = os.getenv('AUTH_INVALIDATE_TOPIC_SUFFIX', 'auth_invalidate')
+    
+    # Budget latenza lettura->relè (ms, 0 = disabilitato): oltre il budget decisione locale
+    ACCESS_LATENCY_BUDGET_MS = int(os.getenv('ACCESS_LATENCY_BUDGET_MS', 0))
+    
+    # Circuit breaker server auth
+    AUTH_BREAKER_ENABLED = os.getenv('AUTH_BREAKER_ENABLED', 'True').lower() == 'true'
+    AUTH_BREAKER_FAILURE_THRESHOLD = int(os.getenv('AUTH_BREAKER_FAILURE_THRESHOLD', 3))
+    AUTH_BREAKER_WINDOW = int(os.getenv('AUTH_BREAKER_WINDOW', 10))
+    AUTH_BREAKER_SLOW_MS = int(os.getenv('AUTH_BREAKER_SLOW_MS', 2000))
+    AUTH_BREAKER_OPEN_SECONDS = int(os.getenv('AUTH_BREAKER_OPEN_SECONDS', 30))
+    
     # Apertura Manuale
     MANUAL_OPEN_ENABLED = os.getenv('MANUAL_OPEN_ENABLED', 'True').lower() == 'true'
     MANUAL_OPEN_TOPIC_SUFFIX = os.getenv('MANUAL_OPEN_TOPIC_SUFFIX', 'manual_open')
@@ -108,19 +147,92 @@ class Config:
     OFFLINE_MODE_ENABLED = os.getenv('OFFLINE_MODE_ENABLED', 'True').lower() == 'true'
     OFFLINE_ALLOW_ACCESS = os.getenv('OFFLINE_ALLOW_ACCESS', 'True').lower() == 'true'
     OFFLINE_SYNC_ENABLED = os.getenv('OFFLINE_SYNC_ENABLED', 'True').lower() == 'true'
-    OFFLINE_STORAGE_FILE = os.getenv('OFFLINE_STORAGE_FILE', 'offline_queue.json')
-    OFFLINE_MAX_QUEUE_SIZE = int(os.getenv('OFFLINE_MAX_QUEUE_SIZE', 1000))
+    OFFLINE_STORAGE_FILE = os.getenv('OFFLINE_STORAGE_FILE', 'offline_queue.json')  # Formato precedente (migrato al journal)
+    OFFLINE_MAX_QUEUE_SIZE = int(os.getenv('OFFLINE_MAX_QUEUE_SIZE', 1000))  # Eventi in memoria
+    
+    # Overflow oltre OFFLINE_MAX_QUEUE_SIZE: segmenti compressi su disco (0 = scarta il più vecchio)
+    OFFLINE_SPILL_DIR = os.getenv('OFFLINE_SPILL_DIR', 'offline_spill')
+    OFFLINE_SPILL_MAX_BYTES = int(os.getenv('OFFLINE_SPILL_MAX_BYTES', 64 * 1024 * 1024))
+    OFFLINE_SPILL_SEGMENT_EVENTS = int(os.getenv('OFFLINE_SPILL_SEGMENT_EVENTS', 500))
+    
+    # Sync audit offline: batch limitati per numero/byte, publish QoS1 in volo
+    # confermate dal PUBACK del broker prima di togliere gli eventi dalla coda
+    OFFLINE_SYNC_BATCH_SIZE = int(os.getenv('OFFLINE_SYNC_BATCH_SIZE', 50))
+    OFFLINE_SYNC_BATCH_BYTES = int(os.getenv('OFFLINE_SYNC_BATCH_BYTES', 16384))
+    OFFLINE_SYNC_WINDOW = int(os.getenv('OFFLINE_SYNC_WINDOW', 4))
+    OFFLINE_SYNC_ACK_TIMEOUT = float(os.getenv('OFFLINE_SYNC_ACK_TIMEOUT', 10.0))
+    
+    # Sequenza eventi per tornello e cursore ack del server (deduplica audit)
+    EVENT_SEQUENCE_FILE = os.getenv('EVENT_SEQUENCE_FILE', 'event_sequence.json')
+    EVENT_SEQUENCE_BLOCK = int(os.getenv('EVENT_SEQUENCE_BLOCK', 100))
+    OFFLINE_ACK_CURSOR_FILE = os.getenv('OFFLINE_ACK_CURSOR_FILE', 'offline_ack_cursor.json')
+    OFFLINE_ACK_TOPIC_SUFFIX = os.getenv('OFFLINE_ACK_TOPIC_SUFFIX', 'offline_audit_ack')
+    
+    # Journal append-only della coda offline
+    OFFLINE_JOURNAL_DIR = os.getenv('OFFLINE_JOURNAL_DIR', 'offline_journal')
+    OFFLINE_JOURNAL_SEGMENT_RECORDS = int(os.getenv('OFFLINE_JOURNAL_SEGMENT_RECORDS', 1000))
+    OFFLINE_JOURNAL_MAX_SEGMENTS = int(os.getenv('OFFLINE_JOURNAL_MAX_SEGMENTS', 4))
+    OFFLINE_JOURNAL_FSYNC = os.getenv('OFFLINE_JOURNAL_FSYNC', 'True').lower() == 'true'
     CONNECTION_CHECK_INTERVAL = int(os.getenv('CONNECTION_CHECK_INTERVAL', 30))
     CONNECTION_RETRY_ATTEMPTS = int(os.getenv('CONNECTION_RETRY_ATTEMPTS', 3))
     
+    # Supervisore connessione MQTT (backoff esponenziale con jitter)
+    MQTT_KEEPALIVE = int(os.getenv('MQTT_KEEPALIVE', 30))
+    MQTT_CONNECT_TIMEOUT = float(os.getenv('MQTT_CONNECT_TIMEOUT', '10'))
+    MQTT_CONNECT_WAIT = float(os.getenv('MQTT_CONNECT_WAIT', '5'))
+    CONNECTION_BACKOFF_MIN = float(os.getenv('CONNECTION_BACKOFF_MIN', '1'))
+    CONNECTION_BACKOFF_MAX = float(os.getenv('CONNECTION_BACKOFF_MAX', '60'))
+    CONNECTION_RTT_DEGRADED_MS = int(os.getenv('CONNECTION_RTT_DEGRADED_MS', 1000))
+    
+    # Whitelist locale (decisioni offline per singola card)
+    WHITELIST_ENABLED = os.getenv('WHITELIST_ENABLED', 'False').lower() == 'true'
+    WHITELIST_FILE = os.getenv('WHITELIST_FILE', 'whitelist.idx')
+    WHITELIST_SNAPSHOT_FILE = os.getenv('WHITELIST_SNAPSHOT_FILE', '')
+    WHITELIST_COMPACT_THRESHOLD = int(os.getenv('WHITELIST_COMPACT_THRESHOLD', 1000))
+    WHITELIST_SNAPSHOT_TOPIC_SUFFIX = os.getenv('WHITELIST_SNAPSHOT_TOPIC_SUFFIX', 'whitelist_snapshot')
+    WHITELIST_DELTA_TOPIC_SUFFIX = os.getenv('WHITELIST_DELTA_TOPIC_SUFFIX', 'whitelist_delta')
+    
+    # Metriche Prometheus su endpoint HTTP locale (/metrics)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))
+    
+    # Trace per accesso: frazione esportata su file JSON lines (0 = nessun export)
+    TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0.0))
+    TRACE_EXPORT_FILE = os.getenv('TRACE_EXPORT_FILE', 'access_traces.jsonl')
+    
     # Logging
     LOG_DIRECTORY = os.getenv('LOG_DIRECTORY', 'logs')
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     LOG_RETENTION_DAYS = int(os.getenv('LOG_RETENTION_DAYS', 30))
     ENABLE_CONSOLE_LOG = os.getenv('ENABLE_CONSOLE_LOG', 'False').lower() == 'true'
     
-    # RFID Debounce
+    # Writer log accessi asincrono (never/batch/interval per fsync)
+    ACCESS_LOG_ASYNC = os.getenv('ACCESS_LOG_ASYNC', 'True').lower() == 'true'
+    ACCESS_LOG_QUEUE_SIZE = int(os.getenv('ACCESS_LOG_QUEUE_SIZE', 1000))
+    ACCESS_LOG_FLUSH_INTERVAL = float(os.getenv('ACCESS_LOG_FLUSH_INTERVAL', '1.0'))
+    ACCESS_LOG_FSYNC = os.getenv('ACCESS_LOG_FSYNC', 'batch').lower()
+    ACCESS_LOG_FSYNC_INTERVAL = float(os.getenv('ACCESS_LOG_FSYNC_INTERVAL', '10.0'))
+    ACCESS_LOG_JSONL_MAX_BYTES = int(os.getenv('ACCESS_LOG_JSONL_MAX_BYTES', 5 * 1024 * 1024))  # Rotazione access_log.jsonl
+    
+    # Driver lettore: 'simple' (SimpleMFRC522, predefinito) oppure 'native' (spidev, solo UID)
+    RFID_DRIVER = os.getenv('RFID_DRIVER', 'simple').lower()
+    RFID_SPI_BUS = int(os.getenv('RFID_SPI_BUS', 0))
+    RFID_SPI_SPEED_HZ = int(os.getenv('RFID_SPI_SPEED_HZ', 1000000))
+    RFID_READ_DATA = os.getenv('RFID_READ_DATA', 'False').lower() == 'true'
+    
+    # Bus SPI condiviso: quote di polling per turno ('1' oppure 'in:2,out:1')
+    RFID_SPI_GPIO_CS = os.getenv('RFID_SPI_GPIO_CS', 'False').lower() == 'true'
+    RFID_BUS_POLL_QUOTA = os.getenv('RFID_BUS_POLL_QUOTA', '1')
+    RFID_BUS_IDLE_SLEEP = float(os.getenv('RFID_BUS_IDLE_SLEEP', '0.005'))
+    
+    # Lettori con IRQ cablato (RFID_<ID>_IRQ_PIN): intervallo di riarmo del REQA
+    RFID_IRQ_REARM_INTERVAL = float(os.getenv('RFID_IRQ_REARM_INTERVAL', '0.05'))
+    
+    # RFID Debounce e presenza: una card è "tolta" se non vista per RFID_PRESENCE_TIMEOUT
     RFID_DEBOUNCE_TIME = float(os.getenv('RFID_DEBOUNCE_TIME', '2.0'))
+    RFID_PRESENCE_TIMEOUT = float(os.getenv('RFID_PRESENCE_TIMEOUT', '1.0'))
+    RFID_PRESENCE_MAX_CARDS = int(os.getenv('RFID_PRESENCE_MAX_CARDS', 256))
     
     # Configurazione formato UID
     UID_FORMAT_MODE = os.getenv('UID_FORMAT_MODE', 'remove_suffix')
@@ -136,6 +248,26 @@ class Config:
     def get_auth_response_topic(cls):
         return f"gate/{cls.TORNELLO_ID}/{cls.AUTH_TOPIC_SUFFIX}"
     
+    @classmethod
+    def get_auth_invalidate_topic(cls):
+        return f"gate/{cls.TORNELLO_ID}/{cls.AUTH_INVALIDATE_TOPIC_SUFFIX}"
+    
+    @classmethod
+    def get_whitelist_snapshot_topic(cls):
+        return f"gate/{cls.TORNELLO_ID}/{cls.WHITELIST_SNAPSHOT_TOPIC_SUFFIX}"
+    
+    @classmethod
+    def get_whitelist_delta_topic(cls):
+        return f"gate/{cls.TORNELLO_ID}/{cls.WHITELIST_DELTA_TOPIC_SUFFIX}"
+    
+    @classmethod
+    def get_offline_ack_topic(cls):
+        return f"gate/{cls.TORNELLO_ID}/{cls.OFFLINE_ACK_TOPIC_SUFFIX}"
+    
+    @classmethod
+    def get_wire_codec_topic(cls):
+        return f"gate/{cls.TORNELLO_ID}/{cls.WIRE_CODEC_TOPIC_SUFFIX}"
+    
     @classmethod
     def get_manual_open_topic(cls):
         return f"gate/{cls.TORNELLO_ID}/{cls.MANUAL_OPEN_TOPIC_SUFFIX}"
@@ -144,6 +276,90 @@ class Config:
     def get_manual_response_topic(cls):
         return f"gate/{cls.TORNELLO_ID}/{cls.MANUAL_OPEN_RESPONSE_TOPIC_SUFFIX}"
     
+    @classmethod
+    def _device_setting(cls, prefix, device_id, name, default=None):
+        """Impostazione per dispositivo: attributo di classe (IN/OUT) oppure variabile d'ambiente"""
+        key = f"{prefix}_{device_id.upper()}_{name}"
+        if hasattr(cls, key):
+            return getattr(cls, key)
+        return os.getenv(key, default)
+    
+    @staticmethod
+    def _parse_number(value):
+        if isinstance(value, str):
+            return float(value) if '.' in value else int(value)
+        return value
+    
+    @staticmethod
+    def _parse_bool(value):
+        if isinstance(value, str):
+            return value.lower() == 'true'
+        return bool(value)
+    
+    @staticmethod
+    def _parse_ids(value):
+        return [item.strip() for item in value.split(',') if item.strip()]
+    
+    @classmethod
+    def _default_direction(cls, device_id):
+        return device_id if device_id in ('in', 'out') else 'in'
+    
+    @classmethod
+    def get_reader_definitions(cls):
+        """
+        Lettori configurati
+        Returns: lista di dict (id, direction, lane, rst_pin, sda_pin, irq_pin)
+        """
+        reader_ids = cls._parse_ids(cls.RFID_READERS)
+        if not reader_ids:
+            # Configurazione classica: IN ed eventualmente OUT
+            if cls.RFID_IN_ENABLE:
+                reader_ids.append('in')
+            if cls.BIDIRECTIONAL_MODE and cls.RFID_OUT_ENABLE:
+                reader_ids.append('out')
+        
+        definitions = []
+        for reader_id in reader_ids:
+            rst_pin = cls._device_setting('RFID', reader_id, 'RST_PIN')
+            sda_pin = cls._device_setting('RFID', reader_id, 'SDA_PIN')
+            irq_pin = cls._device_setting('RFID', reader_id, 'IRQ_PIN', '')
+            definitions.append({
+                'id': reader_id,
+                'direction': cls._device_setting('RFID', reader_id, 'DIRECTION', cls._default_direction(reader_id)),
+                'lane': cls._device_setting('RFID', reader_id, 'LANE', cls.DEFAULT_LANE),
+                'rst_pin': int(rst_pin) if rst_pin is not None else None,
+                'sda_pin': int(sda_pin) if sda_pin is not None else None,
+                'irq_pin': int(irq_pin) if irq_pin not in (None, '') else None
+            })
+        return definitions
+    
+    @classmethod
+    def get_relay_definitions(cls):
+        """
+        Relè configurati
+        Returns: lista di dict (id, direction, lane, pin, active_time, active_low, initial_state)
+        """
+        relay_ids = cls._parse_ids(cls.RELAYS)
+        if not relay_ids:
+            if cls.RELAY_IN_ENABLE:
+                relay_ids.append('in')
+            if cls.BIDIRECTIONAL_MODE and cls.RELAY_OUT_ENABLE:
+                relay_ids.append('out')
+        
+        definitions = []
+        for relay_id in relay_ids:
+            pin = cls._device_setting('RELAY', relay_id, 'PIN')
+            definitions.append({
+                'id': relay_id,
+                'direction': cls._device_setting('RELAY', relay_id, 'DIRECTION', cls._default_direction(relay_id)),
+                'lane': cls._device_setting('RELAY', relay_id, 'LANE', cls.DEFAULT_LANE),
+                'pin': int(pin) if pin is not None else None,
+                'active_time': cls._parse_number(cls._device_setting('RELAY', relay_id, 'ACTIVE_TIME', '2')),
+                'active_low': cls._parse_bool(cls._device_setting('RELAY', relay_id, 'ACTIVE_LOW', 'False')),
+                'initial_state': str(cls._device_setting('RELAY', relay_id, 'INITIAL_STATE', 'LOW')).upper()
+            })
+        return definitions
+    
     @classmethod
     def validate_config(cls):
         """Validazione configurazione basilare"""
@@ -153,10 +369,34 @@ class Config:
             errors.append("MQTT_BROKER richiesto")
         if not cls.TORNELLO_ID:
             errors.append("TORNELLO_ID richiesto")
-        if not cls.RFID_IN_ENABLE and not cls.RFID_OUT_ENABLE:
+        
+        try:
+            readers = cls.get_reader_definitions()
+            relays = cls.get_relay_definitions()
+        except ValueError as e:
+            errors.append(f"Definizione lettori/relè non valida: {e}")
+            return errors
+        
+        if not readers:
             errors.append("Almeno un lettore RFID deve essere abilitato")
-        if not cls.RELAY_IN_ENABLE and not cls.RELAY_OUT_ENABLE:
+        if not relays:
             errors.append("Almeno un relè deve essere abilitato")
+        
+        sda_pins = set()
+        for reader in readers:
+            if reader['rst_pin'] is None or reader['sda_pin'] is None:
+                errors.append(f"Lettore {reader['id']}: RFID_{reader['id'].upper()}_RST_PIN/SDA_PIN richiesti")
+            elif reader['sda_pin'] in sda_pins:
+                errors.append(f"Lettore {reader['id']}: SDA {reader['sda_pin']} già in uso")
+            sda_pins.add(reader['sda_pin'])
+        
+        relay_pins = set()
+        for relay in relays:
+            if relay['pin'] is None:
+                errors.append(f"Relè {relay['id']}: RELAY_{relay['id'].upper()}_PIN richiesto")
+            elif relay['pin'] in relay_pins:
+                errors.append(f"Relè {relay['id']}: GPIO {relay['pin']} già in uso")
+            relay_pins.add(relay['pin'])
             
         return errors
 
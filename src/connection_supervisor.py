@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Supervisore della connessione MQTT
+Stato guidato dai callback connect/disconnect di paho (niente probe TCP),
+riconnessione in background con backoff esponenziale e jitter
+"""
+import random
+import threading
+import time
+from config import Config
+
+class ConnectionSupervisor:
+    """Macchina a stati: disconnected -> connecting -> online/degraded -> backoff"""
+
+    DISCONNECTED = 'disconnected'
+    CONNECTING = 'connecting'
+    ONLINE = 'online'
+    DEGRADED = 'degraded'      # Connesso ma RTT keepalive oltre soglia
+    BACKOFF = 'backoff'
+
+    def __init__(self, mqtt_client, logger=None):
+        self.mqtt_client = mqtt_client
+        self.logger = logger
+
+        self.backoff_min = Config.CONNECTION_BACKOFF_MIN
+        self.backoff_max = Config.CONNECTION_BACKOFF_MAX
+        self.connect_timeout = Config.MQTT_CONNECT_TIMEOUT
+        self.rtt_degraded_ms = Config.CONNECTION_RTT_DEGRADED_MS
+        self.watchdog_interval = Config.CONNECTION_CHECK_INTERVAL
+
+        self.state = self.DISCONNECTED
+        self.listeners = []          # callback(online: bool)
+        self.manage_connection = True
+        self.next_attempt_at = None
+
+        self._attempts = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._connected = threading.Event()
+        self._online_event = threading.Event()
+        self._thread = None
+
+        # Statistiche
+        self.stats = {
+            'connect_attempts': 0,
+            'connect_failures': 0,
+            'connections': 0,
+            'disconnections': 0,
+            'last_connected': None,
+            'last_disconnected': None,
+            'last_backoff_s': None
+        }
+
+        mqtt_client.connection_listeners.append(self._on_mqtt_connection)
+
+    def add_listener(self, callback):
+        """Registra callback(online) chiamato a ogni passaggio online/offline"""
+        self.listeners.append(callback)
+
+    def start(self):
+        """
+        Avvia il supervisore
+        Se il client è già connesso (es. tool con connect() bloccante) osserva
+        soltanto lo stato e lascia la riconnessione a paho
+        """
+        if self._thread and self._thread.is_alive():
+            return
+
+        self.manage_connection = not self.mqtt_client.is_connected
+        if self.mqtt_client.is_connected:
+            self._connected.set()
+            self._set_state(self.ONLINE)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="ConnectionSupervisor")
+        self._thread.start()
+
+    def stop(self):
+        """Ferma il supervisore (nessuna ulteriore riconnessione)"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=self.connect_timeout + 1)
+
+    def wait_online(self, timeout):
+        """Attende la prima connessione (True se online entro timeout)"""
+        return self._online_event.wait(timeout)
+
+    def is_online(self):
+        return self.state in (self.ONLINE, self.DEGRADED)
+
+    # --- Eventi paho (thread di rete MQTT) ---
+
+    def _on_mqtt_connection(self, connected, rc):
+        if connected:
+            self._attempts = 0
+            self.stats['connections'] += 1
+            self.stats['last_connected'] = time.time()
+            self._connected.set()
+            self._set_state(self.ONLINE)
+        else:
+            self._connected.clear()
+            if self.is_online():
+                self.stats['disconnections'] += 1
+                self.stats['last_disconnected'] = time.time()
+            self._set_state(self.DISCONNECTED)
+
+        self._wake.set()
+
+    # --- Thread supervisore ---
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.manage_connection and not self.mqtt_client.is_connected:
+                    self._connect_with_backoff()
+                    continue
+
+                self._wake.wait(self.watchdog_interval)
+                self._wake.clear()
+                self._check_keepalive()
+
+            except Exception as e:
+                print(f"⚠️ Errore supervisore connessione: {e}")
+                self._stop.wait(1)
+
+    def _connect_with_backoff(self):
+        if self._attempts > 0:
+            delay = self._backoff_delay()
+            self.stats['last_backoff_s'] = round(delay, 2)
+            self.next_attempt_at = time.time() + delay
+            self._set_state(self.BACKOFF)
+            print(f"⏳ Riconnessione MQTT tra {delay:.1f}s (tentativo {self._attempts + 1})")
+
+            # Un evento di connessione (es. paho) interrompe l'attesa
+            self._wake.clear()
+            if self._wake.wait(delay) or self._stop.is_set():
+                return
+
+        self.next_attempt_at = None
+        self._set_state(self.CONNECTING)
+        self.stats['connect_attempts'] += 1
+        self._connected.clear()
+
+        try:
+            self.mqtt_client.start_connection()
+        except Exception as e:
+            self._attempts += 1
+            self.stats['connect_failures'] += 1
+            self._set_state(self.DISCONNECTED)
+            print(f"🔴 Connessione MQTT fallita: {e}")
+            return
+
+        if self._connected.wait(self.connect_timeout) and self.mqtt_client.is_connected:
+            return
+
+        # Nessun CONNACK o connessione rifiutata: chiude e ritenta
+        self._attempts += 1
+        self.stats['connect_failures'] += 1
+        self.mqtt_client.stop_connection()
+        self._set_state(self.DISCONNECTED)
+
+    def _backoff_delay(self):
+        """Backoff esponenziale con jitter (metà fissa + metà casuale)"""
+        ceiling = min(self.backoff_max, self.backoff_min * (2 ** (self._attempts - 1)))
+        return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+    def _check_keepalive(self):
+        """Connesso ma lento: stato degraded in base all'RTT del keepalive"""
+        if not self.mqtt_client.is_connected:
+            if self.is_online():
+                self._set_state(self.DISCONNECTED)
+            return
+
+        rtt = self.mqtt_client.keepalive_rtt_ms
+        if rtt is not None and rtt > self.rtt_degraded_ms:
+            self._set_state(self.DEGRADED)
+        else:
+            self._set_state(self.ONLINE)
+
+    def _set_state(self, new_state):
+        with self._lock:
+            old_state = self.state
+            if old_state == new_state:
+                return
+            self.state = new_state
+
+        was_online = old_state in (self.ONLINE, self.DEGRADED)
+        now_online = new_state in (self.ONLINE, self.DEGRADED)
+
+        if new_state == self.DEGRADED:
+            print(f"🟡 Connessione MQTT lenta (RTT keepalive {self.mqtt_client.keepalive_rtt_ms}ms)")
+        elif new_state == self.ONLINE and old_state == self.DEGRADED:
+            print("🟢 Connessione MQTT tornata normale")
+
+        if was_online == now_online:
+            return
+
+        if now_online:
+            self._online_event.set()
+        else:
+            self._online_event.clear()
+
+        if self.logger:
+            self.logger.log_system_event(
+                "connection_state", f"{old_state} → {new_state}", "info" if now_online else "warning")
+
+        for listener in list(self.listeners):
+            try:
+                listener(now_online)
+            except Exception as e:
+                print(f"⚠️ Errore callback stato connessione: {e}")
+
+    def get_status(self):
+        """Status supervisore"""
+        return {
+            'state': self.state,
+            'online': self.is_online(),
+            'managed': self.manage_connection,
+            'attempts': self._attempts,
+            'next_attempt_at': self.next_attempt_at,
+            'keepalive_rtt_ms': self.mqtt_client.keepalive_rtt_ms,
+            'stats': self.stats.copy()
+        }
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Identità stabile degli eventi di accesso
+Ogni accesso riceve un numero di sequenza monotono per tornello al momento
+della creazione; il server conferma sul topic di ack fino a quale numero ha
+acquisito l'audit e il cursore persistito permette di non reinviare (e di
+scartare al riavvio) gli eventi già acquisiti
+"""
+import bisect
+import json
+import os
+import threading
+from config import Config
+
+def _write_json_atomic(path, data):
+    """Scrittura atomica con fsync (il file non resta mai troncato)"""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _read_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+class EventSequence:
+    """
+    Contatore monotono persistente a blocchi: su disco viene salvato solo il
+    limite del blocco riservato, quindi una scrittura ogni `block` eventi.
+    Dopo un crash si riparte dal blocco successivo (buchi ammessi, mai ripetizioni)
+    """
+
+    def __init__(self, path=None, block=None, gate_id=None):
+        self.path = path or os.path.join(Config.LOG_DIRECTORY, Config.EVENT_SEQUENCE_FILE)
+        self.block = max(1, block or Config.EVENT_SEQUENCE_BLOCK)
+        self.gate_id = gate_id or Config.TORNELLO_ID
+        self._lock = threading.Lock()
+
+        reserved = int(_read_json(self.path).get('reserved', 0))
+        self._next = reserved + 1
+        self._reserved = reserved
+
+    def next(self):
+        """Prossimo numero di sequenza"""
+        with self._lock:
+            if self._next > self._reserved:
+                self._reserved = self._next + self.block - 1
+                _write_json_atomic(self.path, {'gate': self.gate_id, 'reserved': self._reserved})
+            seq = self._next
+            self._next += 1
+            return seq
+
+    def ensure_above(self, seq):
+        """I prossimi numeri saranno maggiori di `seq` (es. eventi già in coda)"""
+        with self._lock:
+            if seq >= self._next:
+                self._next = seq + 1
+
+    def peek(self):
+        """Ultimo numero assegnato"""
+        with self._lock:
+            return self._next - 1
+
+class AckCursor:
+    """
+    Eventi confermati dal server (persistiti come intervalli di numeri di sequenza)
+    L'ack del server è un massimo (acked_seq), ma gli eventi non entrano in coda
+    in ordine di sequenza (worker per lettore): sono confermati solo i numeri
+    effettivamente inviati fino a quel massimo, mai quelli ancora da inviare.
+    I tap online consumano numeri, quindi gli intervalli non si fondono mai:
+    quelli sotto il limite inferiore (evento più vecchio ancora in coda o
+    inviato) vengono scartati con prune()
+    """
+
+    def __init__(self, path=None, gate_id=None):
+        self.path = path or os.path.join(Config.LOG_DIRECTORY, Config.OFFLINE_ACK_CURSOR_FILE)
+        self.gate_id = gate_id or Config.TORNELLO_ID
+        self._lock = threading.Lock()
+
+        data = _read_json(self.path)
+        self.acked_seq = int(data.get('acked_seq', 0))  # Massimo ack ricevuto dal server
+        if 'ranges' in data:
+            self._ranges = [(int(start), int(end)) for start, end in data['ranges']]
+        else:
+            # Formato precedente: tutto fino al massimo
+            self._ranges = [(1, self.acked_seq)] if self.acked_seq > 0 else []
+
+    def advance(self, seq):
+        """
+        Registra il massimo confermato dal server (ack duplicati o vecchi ignorati)
+        Returns: True se il massimo è avanzato
+        """
+        with self._lock:
+            if seq <= self.acked_seq:
+                return False
+            self.acked_seq = seq
+            self._save()
+            return True
+
+    def mark(self, seqs):
+        """
+        Marca come acquisiti i numeri indicati (unendo gli intervalli contigui)
+        Returns: quanti numeri erano nuovi
+        """
+        with self._lock:
+            added = 0
+            for seq in sorted(set(seq for seq in seqs if seq is not None)):
+                if self._contains(seq):
+                    continue
+                self._insert(seq)
+                added += 1
+            if added:
+                self._save()
+            return added
+
+    def prune(self, low_water):
+        """
+        Dimentica i numeri inferiori a `low_water` (eventi già fuori dalla coda)
+        Returns: True se il file è stato riscritto
+        """
+        with self._lock:
+            index = bisect.bisect_left(self._ranges, (low_water, low_water))
+            kept = self._ranges[index:]
+            if index > 0 and self._ranges[index - 1][1] >= low_water:
+                kept.insert(0, (low_water, self._ranges[index - 1][1]))
+            if kept == self._ranges:
+                return False
+            self._ranges = kept
+            self._save()
+            return True
+
+    def range_count(self):
+        with self._lock:
+            return len(self._ranges)
+
+    def is_acked(self, seq):
+        if seq is None:
+            return False
+        with self._lock:
+            return self._contains(seq)
+
+    def _contains(self, seq):
+        index = bisect.bisect_right(self._ranges, (seq, float('inf'))) - 1
+        return index >= 0 and self._ranges[index][1] >= seq
+
+    def _insert(self, seq):
+        index = bisect.bisect_right(self._ranges, (seq, float('inf')))
+        start, end = seq, seq
+        if index > 0 and self._ranges[index - 1][1] == seq - 1:
+            index -= 1
+            start = self._ranges.pop(index)[0]
+        if index < len(self._ranges) and self._ranges[index][0] == seq + 1:
+            end = self._ranges.pop(index)[1]
+        self._ranges.insert(index, (start, end))
+
+    def _save(self):
+        _write_json_atomic(self.path, {'gate': self.gate_id, 'acked_seq': self.acked_seq,
+                                       'ranges': [list(r) for r in self._ranges]})
+
+# Sequenza di processo, creata al primo uso
+_sequence = None
+_sequence_lock = threading.Lock()
+
+def get_event_sequence():
+    """Sequenza eventi condivisa da lettori e manager offline (una per file)"""
+    global _sequence
+    path = os.path.join(Config.LOG_DIRECTORY, Config.EVENT_SEQUENCE_FILE)
+    with _sequence_lock:
+        if _sequence is None or _sequence.path != path:
+            _sequence = EventSequence(path)
+        return _sequence
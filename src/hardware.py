@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Astrazione hardware: GPIO e lettori RFID
+Backend 'rpi' (RPi.GPIO + mfrc522) oppure 'simulated' per test e benchmark su Linux x86
+"""
+import json
+import threading
+import time
+from config import Config
+
+class SimulatedGPIO:
+    """Sostituto di RPi.GPIO che registra i fronti sui pin di uscita"""
+
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self, simulator):
+        self._simulator = simulator
+        self._mode = None
+        self._levels = {}
+        self._callbacks = {}
+        self._lock = threading.Lock()
+
+    def setwarnings(self, flag):
+        pass
+
+    def setmode(self, mode):
+        self._mode = mode
+
+    def getmode(self):
+        return self._mode
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        with self._lock:
+            if initial is not None:
+                self._levels[pin] = initial
+            else:
+                self._levels.setdefault(pin, self.LOW)
+
+    def output(self, pin, level):
+        level = self.HIGH if level else self.LOW
+        with self._lock:
+            previous = self._levels.get(pin)
+            self._levels[pin] = level
+
+        if previous != level:
+            self._simulator.record_edge(pin, level)
+
+    def input(self, pin):
+        with self._lock:
+            return self._levels.get(pin, self.LOW)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        with self._lock:
+            self._callbacks[pin] = callback
+
+    def remove_event_detect(self, pin):
+        with self._lock:
+            self._callbacks.pop(pin, None)
+
+    def trigger_edge(self, pin):
+        """Simula un fronte su un pin di ingresso (es. linea IRQ)"""
+        with self._lock:
+            callback = self._callbacks.get(pin)
+        if callback:
+            callback(pin)
+
+    def cleanup(self, pins=None):
+        pass
+
+class SimulatedCardReader:
+    """Lettore RFID simulato con la stessa interfaccia di SimpleMFRC522"""
+
+    waits_for_card = True  # read() attende il tap fino al timeout
+
+    def __init__(self, simulator, reader_id):
+        self._simulator = simulator
+        self.reader_id = reader_id
+
+    def read(self):
+        """Attende un tap programmato per questo lettore (None se inattivo)"""
+        return self._simulator.next_tap(self.reader_id, timeout=0.5)
+
+    def read_id(self):
+        card_id, _ = self.read()
+        return card_id
+
+class HardwareSimulator:
+    """
+    Banco di prova: tap programmati sui lettori e registrazione dei fronti relè
+    Tutti i tempi sono in time.monotonic()
+    """
+
+    def __init__(self):
+        self._taps = []       # (due, seq, reader_id, card_id, data)
+        self._seq = 0
+        self._condition = threading.Condition()
+
+        self.delivered_taps = []  # dict con tempi programmati/consegnati
+        self.edges = []           # (timestamp, pin, level)
+        self._edge_condition = threading.Condition()
+
+        self.gpio = SimulatedGPIO(self)
+
+    def tap(self, reader_id, uid, delay=0.0, at=None, data=''):
+        """
+        Programma un tap
+        Args: uid - int (raw id) oppure stringa esadecimale
+              delay - secondi da adesso, oppure at - istante monotonic assoluto
+        """
+        card_id = int(uid, 16) if isinstance(uid, str) else int(uid)
+        due = at if at is not None else time.monotonic() + delay
+
+        with self._condition:
+            self._seq += 1
+            self._taps.append((due, self._seq, reader_id, card_id, data))
+            self._taps.sort()
+            self._condition.notify_all()
+
+    def load_script(self, path):
+        """
+        Carica uno script JSON di tap
+        Formato: [{"at": 1.5, "reader": "in", "uid": "C67BD90561"}, ...]
+        con "at" in secondi dal caricamento
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            script = json.load(f)
+
+        start = time.monotonic()
+        for step in script:
+            self.tap(step['reader'], step['uid'], at=start + float(step.get('at', 0)), data=step.get('data', ''))
+
+        return len(script)
+
+    def next_tap(self, reader_id, timeout=None):
+        """Restituisce (card_id, data) del prossimo tap dovuto per il lettore"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                wait = None
+
+                for index, (due, _, tap_reader, card_id, data) in enumerate(self._taps):
+                    if tap_reader != reader_id:
+                        continue
+                    if due <= now:
+                        del self._taps[index]
+                        self.delivered_taps.append({
+                            'reader_id': reader_id,
+                            'card_id': card_id,
+                            'due': due,
+                            'delivered': now
+                        })
+                        return card_id, data
+                    wait = due - now
+                    break
+
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        return None, None
+                    wait = remaining if wait is None else min(wait, remaining)
+
+                self._condition.wait(wait)
+
+    def pending_taps(self):
+        with self._condition:
+            return len(self._taps)
+
+    def record_edge(self, pin, level):
+        with self._edge_condition:
+            self.edges.append((time.monotonic(), pin, level))
+            self._edge_condition.notify_all()
+
+    def wait_for_edge(self, pin, level, after=0.0, timeout=5.0):
+        """Attende un fronte (pin, livello) successivo all'istante 'after'"""
+        deadline = time.monotonic() + timeout
+
+        with self._edge_condition:
+            while True:
+                for timestamp, edge_pin, edge_level in self.edges:
+                    if edge_pin == pin and edge_level == level and timestamp >= after:
+                        return timestamp
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._edge_condition.wait(remaining)
+
+    def reset(self):
+        with self._condition:
+            self._taps.clear()
+            self.delivered_taps.clear()
+        with self._edge_condition:
+            self.edges.clear()
+
+def is_simulated():
+    return Config.HARDWARE_BACKEND == 'simulated'
+
+# Selezione backend al caricamento del modulo
+simulator = None
+
+if is_simulated():
+    simulator = HardwareSimulator()
+    GPIO = simulator.gpio
+else:
+    import RPi.GPIO as GPIO
+
+# Un proprietario per bus SPI (driver nativo): serializza i lettori sullo stesso bus
+spi_buses = {}
+_spi_buses_lock = threading.Lock()
+
+def get_spi_bus(bus_number=None):
+    """Bus SPI condiviso (creato alla prima richiesta)"""
+    from spi_bus import SPIBus, parse_poll_quotas
+
+    bus_number = Config.RFID_SPI_BUS if bus_number is None else bus_number
+    with _spi_buses_lock:
+        if bus_number not in spi_buses:
+            default_quota, quotas = parse_poll_quotas(Config.RFID_BUS_POLL_QUOTA)
+            spi_buses[bus_number] = SPIBus(
+                bus_number,
+                gpio=GPIO,
+                speed_hz=Config.RFID_SPI_SPEED_HZ,
+                gpio_cs=Config.RFID_SPI_GPIO_CS,
+                default_quota=default_quota,
+                quotas=quotas,
+                idle_sleep=Config.RFID_BUS_IDLE_SLEEP,
+                irq_rearm_interval=Config.RFID_IRQ_REARM_INTERVAL
+            )
+            # Un CS non ancora configurato potrebbe restare basso durante l'init di un altro lettore
+            spi_buses[bus_number].prepare_cs_pins(
+                [reader['sda_pin'] for reader in Config.get_reader_definitions() if reader['sda_pin'] is not None]
+            )
+        return spi_buses[bus_number]
+
+def create_card_reader(reader_id, rst_pin=None, sda_pin=None, irq_pin=None):
+    """Crea il lettore RFID per il backend e il driver configurati"""
+    if simulator is not None:
+        return SimulatedCardReader(simulator, reader_id)
+
+    if Config.RFID_DRIVER == 'native':
+        from mfrc522_driver import MFRC522Driver
+        bus = get_spi_bus()
+        driver = MFRC522Driver(bus.channel(sda_pin), gpio=GPIO, rst_pin=rst_pin,
+                               read_data=Config.RFID_READ_DATA)
+        return bus.attach(reader_id, driver, irq_pin=irq_pin)
+
+    if irq_pin is not None:
+        print(f"⚠️ IRQ lettore {reader_id} ignorato: richiede RFID_DRIVER=native (uso polling)")
+
+    from mfrc522 import SimpleMFRC522
+    return SimpleMFRC522()
+
+def probe_card_reader(reader_id, rst_pin=None, sda_pin=None, reader=None):
+    """Verifica che il modulo RFID risponda"""
+    if simulator is not None:
+        return True
+
+    if reader is not None and hasattr(reader, 'version'):
+        return reader.version() not in (0x00, 0xFF)
+
+    from mfrc522 import SimpleMFRC522
+    test_reader = SimpleMFRC522()
+    del test_reader
+    return True
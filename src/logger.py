@@ -6,9 +6,12 @@ import os
 import json
 import csv
 import logging
+import threading
 from datetime import datetime
 from logging.handlers import RotatingFileHandler
 from config import Config
+from access_log_writer import AccessLogWriter, CSV_FIELDS, csv_row
+from card_event import CardEvent
 
 class AccessLogger:
     """Logger semplificato per gli accessi"""
@@ -21,8 +24,17 @@ class AccessLogger:
         # File log
         self.access_log_file = os.path.join(log_dir, "access_log.csv")
         self.json_log_file = os.path.join(log_dir, "access_log.json")
+        self.jsonl_log_file = os.path.join(log_dir, "access_log.jsonl")  # Writer in background
+        
+        # Scritture serializzate (più worker possono loggare insieme)
+        self._write_lock = threading.Lock()
         
         self.initialize_access_logs()
+        
+        # Writer in background: il tap non attende il disco
+        self.writer = None
+        if Config.ACCESS_LOG_ASYNC:
+            self.writer = AccessLogWriter(self.access_log_file, self.jsonl_log_file)
     
     def ensure_log_directory(self):
         """Crea directory log"""
@@ -62,24 +74,10 @@ class AccessLogger:
     
     def create_csv_header(self):
         """Crea header CSV"""
-        headers = [
-            'timestamp',
-            'card_uid', 
-            'raw_id',
-            'tornello_id',
-            'direzione',
-            'authorized',
-            'auth_message',
-            'relay_activated',
-            'card_data',
-            'auth_time_ms',
-            'event_type'
-        ]
-        
         try:
             with open(self.access_log_file, 'w', newline='', encoding='utf-8') as csvfile:
                 writer = csv.writer(csvfile)
-                writer.writerow(headers)
+                writer.writerow(CSV_FIELDS)
         except Exception as e:
             print(f"Errore creazione CSV: {e}")
     
@@ -102,26 +100,12 @@ class AccessLogger:
     
     def log_access_attempt(self, card_info, auth_result=None, relay_success=False, auth_time_ms=0):
         """Registra tentativo accesso"""
-        timestamp = datetime.now()
-        
-        # Dati log
-        log_data = {
-            'timestamp': timestamp.isoformat(),
-            'card_uid': card_info.get('uid_formatted', 'N/A'),
-            'raw_id': card_info.get('raw_id', 'N/A'),
-            'tornello_id': Config.TORNELLO_ID,
-            'direzione': card_info.get('direction', 'unknown'),  # CORRETTO: dalla card_info
-            'authorized': auth_result.get('authorized', False) if auth_result else False,
-            'auth_message': auth_result.get('message', '') if auth_result else '',
-            'relay_activated': relay_success,
-            'card_data': card_info.get('data', ''),
-            'auth_time_ms': auth_time_ms,
-            'event_type': 'access_attempt'
-        }
+        # Record e riga CSV costruiti dall'evento (una volta per tap)
+        event = CardEvent.coerce(card_info)
+        log_data = event.log_record(auth_result, relay_success, auth_time_ms)
         
         # Scrivi log
-        self.write_csv_log(log_data)
-        self.write_json_log(log_data)
+        self._write_access_record(log_data, event.csv_row())
         
         # Log sistema
         status = "AUTORIZZATO" if log_data['authorized'] else "NEGATO"
@@ -134,25 +118,53 @@ class AccessLogger:
         
         return log_data
     
-    def write_csv_log(self, log_data):
+    def log_auth_reconciliation(self, card_info, local_result, server_result, latency_ms):
+        """Registra una risposta auth arrivata dopo la decisione locale"""
+        local_authorized = local_result.get('authorized', False)
+        server_authorized = server_result.get('authorized', False)
+        mismatch = local_authorized != server_authorized
+        
+        log_data = {
+            'timestamp': datetime.now().isoformat(),
+            'card_uid': card_info.get('uid_formatted', 'N/A'),
+            'raw_id': card_info.get('raw_id', 'N/A'),
+            'tornello_id': Config.TORNELLO_ID,
+            'direzione': card_info.get('direction', 'unknown'),
+            'authorized': server_authorized,
+            'auth_message': f"Risposta tardiva: server={server_authorized}, locale={local_authorized}"
+                            f"{' - DISCORDE' if mismatch else ''}",
+            'relay_activated': local_authorized,  # Il relè segue la decisione locale
+            'card_data': card_info.get('data', ''),
+            'auth_time_ms': latency_ms,
+            'event_type': 'late_auth_mismatch' if mismatch else 'late_auth_response'
+        }
+        
+        self._write_access_record(log_data)
+        
+        if mismatch:
+            self.system_logger.warning(
+                f"Decisione locale discorde - Card: {log_data['card_uid']} - "
+                f"Locale: {local_authorized} - Server: {server_authorized} - {latency_ms}ms"
+            )
+        
+        return log_data
+    
+    def _write_access_record(self, log_data, row=None):
+        """Scrive un record su CSV e JSON (serializzato tra i worker)"""
+        if self.writer:
+            self.writer.submit(log_data, row)
+            return
+        
+        with self._write_lock:
+            self.write_csv_log(log_data, row)
+            self.write_json_log(log_data)
+    
+    def write_csv_log(self, log_data, row=None):
         """Scrivi CSV"""
         try:
             with open(self.access_log_file, 'a', newline='', encoding='utf-8') as csvfile:
                 writer = csv.writer(csvfile)
-                row = [
-                    log_data['timestamp'],
-                    log_data['card_uid'],
-                    log_data['raw_id'],
-                    log_data['tornello_id'],
-                    log_data['direzione'],
-                    log_data['authorized'],
-                    log_data['auth_message'],
-                    log_data['relay_activated'],
-                    log_data['card_data'],
-                    log_data['auth_time_ms'],
-                    log_data['event_type']
-                ]
-                writer.writerow(row)
+                writer.writerow(row or csv_row(log_data))
         except Exception as e:
             print(f"Errore CSV: {e}")
     
@@ -177,6 +189,21 @@ class AccessLogger:
         except Exception as e:
             print(f"Errore JSON: {e}")
     
+    def flush(self, timeout=5.0):
+        """Attende la scrittura dei record accodati"""
+        if self.writer:
+            return self.writer.flush(timeout)
+        return True
+    
+    def close(self):
+        """Scrive i record rimasti e chiude i file"""
+        if self.writer:
+            self.writer.close()
+    
+    def get_writer_status(self):
+        """Status writer asincrono (None se disabilitato)"""
+        return self.writer.get_status() if self.writer else None
+    
     def log_system_event(self, event_type, message, level="info"):
         """Log evento sistema"""
         if level == "error":
@@ -200,6 +227,8 @@ class AccessLogger:
             if not os.path.exists(self.access_log_file):
                 return stats
             
+            self.flush()
+            
             cutoff_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
             
             with open(self.access_log_file, 'r', encoding='utf-8') as csvfile:
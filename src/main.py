@@ -5,6 +5,7 @@ Sistema controllo accessi RFID - Versione semplificata
 import sys
 import time
 import signal
+import threading
 from datetime import datetime
 
 from config import Config
@@ -13,22 +14,43 @@ from relay_manager import RelayManager
 from mqtt_client import MQTTClient
 from logger import AccessLogger
 from offline_manager import OfflineManager
+from connection_supervisor import ConnectionSupervisor
 from manual_control import ManualControl
+from metrics import registry, MetricsServer
+from access_trace import AccessTracer, AUTH_SENT, AUTH_RECEIVED, RELAY_ON, RELAY_OFF, LOGGED
+import hardware
+
+AUTH_LATENCY = registry.histogram('auth_latency_seconds', 'Latenza decisione di accesso per origine', ('source',))
+ACCESS_DECISIONS = registry.counter('access_decisions_total', 'Decisioni di accesso', ('result',))
 
 class AccessControlSystem:
     """Sistema principale controllo accessi"""
     
-    def __init__(self):
+    def __init__(self, mqtt_client_factory=None):
+        self.mqtt_client_factory = mqtt_client_factory
         self.rfid_manager = None
         self.relay_manager = None
         self.mqtt_client = None
+        self.connection_supervisor = None
         self.logger = None
         self.offline_manager = None
         self.manual_control = None
+        self.metrics_server = None
+        self.tracer = AccessTracer()
         self.running = False
         
+        # Contatore card condiviso tra i worker
+        self.card_count = 0
+        self._count_lock = threading.Lock()
+        self.pipeline_workers = {}
+        
         signal.signal(signal.SIGINT, self._signal_handler)
     
+    def _on_connection_state_change(self, online):
+        """Annuncia lo stato al server a ogni (ri)connessione"""
+        if online:
+            self.mqtt_client.publish_status("online")
+    
     def _signal_handler(self, sig, frame):
         print("\n🛑 Interruzione ricevuta...")
         self.shutdown()
@@ -53,6 +75,20 @@ class AccessControlSystem:
             print(f"❌ Errore Logger: {e}")
             return False
         
+        # Endpoint metriche locale
+        if Config.METRICS_ENABLED and self.metrics_server is None:
+            self.metrics_server = MetricsServer()
+            if not self.metrics_server.start():
+                self.metrics_server = None
+        
+        # Tap programmati (solo backend simulato)
+        if hardware.simulator is not None and Config.SIMULATED_TAP_SCRIPT:
+            try:
+                count = hardware.simulator.load_script(Config.SIMULATED_TAP_SCRIPT)
+                print(f"🧪 Hardware simulato: {count} tap programmati")
+            except Exception as e:
+                print(f"⚠️ Errore script tap simulati: {e}")
+        
         # RFID Manager
         try:
             self.rfid_manager = RFIDManager()
@@ -73,13 +109,17 @@ class AccessControlSystem:
         
         # MQTT Client (opzionale)
         try:
-            self.mqtt_client = MQTTClient()
-            if self.mqtt_client.initialize():
-                if self.mqtt_client.connect():
-                    self.mqtt_client.publish_status("online")
+            self.mqtt_client = MQTTClient(client_factory=self.mqtt_client_factory)
+            if self.mqtt_client.initialize(reconnect_on_failure=False):
+                # Connessione e riconnessioni in background
+                self.connection_supervisor = ConnectionSupervisor(self.mqtt_client, self.logger)
+                self.connection_supervisor.add_listener(self._on_connection_state_change)
+                self.connection_supervisor.start()
+                
+                if self.connection_supervisor.wait_online(Config.MQTT_CONNECT_WAIT):
                     print("✅ MQTT connesso")
                 else:
-                    print("⚠️ MQTT non connesso")
+                    print("⚠️ MQTT non connesso (riconnessione in background)")
             else:
                 print("⚠️ MQTT non inizializzato")
         except Exception as e:
@@ -87,7 +127,7 @@ class AccessControlSystem:
         
         # Offline Manager
         try:
-            self.offline_manager = OfflineManager(self.mqtt_client, self.logger)
+            self.offline_manager = OfflineManager(self.mqtt_client, self.logger, self.connection_supervisor)
             if self.offline_manager.initialize():
                 print("✅ Offline Manager attivo")
             else:
@@ -147,7 +187,9 @@ class AccessControlSystem:
     
     def _main_loop(self):
         """Loop principale"""
-        card_count = 0
+        if Config.PIPELINE_MODE:
+            self._pipeline_loop()
+            return
         
         try:
             print("⏳ In attesa card RFID...")
@@ -160,86 +202,7 @@ class AccessControlSystem:
                     if card_info is None:
                         continue
                     
-                    card_count += 1
-                    
-                    # Info card
-                    direction = card_info.get('direction', 'unknown').upper()
-                    uid = card_info.get('uid_formatted', 'N/A')
-                    
-                    print(f"\n🎉 Card #{card_count}: {uid} ({direction})")
-                    
-                    # Autenticazione
-                    auth_start = time.time()
-                    
-                    if self.offline_manager:
-                        auth_result = self.offline_manager.handle_card_access(card_info)
-                    else:
-                        # Fallback diretto
-                        if self.mqtt_client and self.mqtt_client.is_connected:
-                            auth_result = self.mqtt_client.publish_card_data_and_wait_auth(card_info)
-                        else:
-                            auth_result = {
-                                'authorized': Config.OFFLINE_ALLOW_ACCESS if Config.OFFLINE_MODE_ENABLED else False,
-                                'message': 'Sistema offline',
-                                'offline_mode': True
-                            }
-                    
-                    auth_time = int((time.time() - auth_start) * 1000)
-                    
-                    # Risultato auth
-                    authorized = auth_result.get('authorized', False)
-                    offline_mode = auth_result.get('offline_mode', False)
-                    message = auth_result.get('message', auth_result.get('error', ''))
-                    access_type = auth_result.get('access_type', 'online')
-                    
-                    mode_text = "OFFLINE" if offline_mode else "ONLINE"
-                    auth_text = "✅ AUTORIZZATO" if authorized else "❌ NEGATO"
-                    print(f"🔐 {auth_text} ({mode_text}) - {auth_time}ms")
-                    if message:
-                        print(f"💬 {message}")
-                    
-                    # Log specifico per accessi offline
-                    if offline_mode and Config.OFFLINE_MODE_ENABLED:
-                        access_mode = "PERMISSIVO" if Config.OFFLINE_ALLOW_ACCESS else "RESTRITTIVO"
-                        print(f"🌐 Modalità offline {access_mode} attiva")
-                    
-                    # Attiva relè se autorizzato
-                    relay_success = False
-                    if authorized:
-                        direction_key = card_info.get('direction', 'in')
-                        available_relays = self.relay_manager.get_active_relays()
-                        
-                        if direction_key in available_relays:
-                            relay_success = self.relay_manager.activate_relay(direction_key)
-                            if relay_success:
-                                print(f"⚡ Relè {direction_key.upper()} attivato")
-                            else:
-                                print(f"❌ Errore relè {direction_key.upper()}")
-                        elif available_relays:
-                            # Usa primo relè disponibile
-                            relay_key = available_relays[0]
-                            relay_success = self.relay_manager.activate_relay(relay_key)
-                            if relay_success:
-                                print(f"⚡ Relè {relay_key.upper()} attivato")
-                            else:
-                                print(f"❌ Errore relè {relay_key.upper()}")
-                        else:
-                            print("❌ Nessun relè disponibile")
-                    else:
-                        print("🔒 Accesso negato - Relè non attivato")
-                    
-                    # Log accesso
-                    if self.logger:
-                        self.logger.log_access_attempt(
-                            card_info=card_info,
-                            auth_result=auth_result,
-                            relay_success=relay_success,
-                            auth_time_ms=auth_time
-                        )
-                    
-                    # Riepilogo
-                    print(f"📊 Riepilogo: Auth={auth_text}, Relè={'✅' if relay_success else '❌'}")
-                    print("-"*50)
+                    self._process_card(card_info)
                     
                 except KeyboardInterrupt:
                     break
@@ -250,11 +213,174 @@ class AccessControlSystem:
         except Exception as e:
             print(f"❌ Errore loop principale: {e}")
     
+    def _pipeline_loop(self):
+        """Loop principale in modalità pipeline: un worker per direzione"""
+        print("⏳ In attesa card RFID (pipeline per direzione)...")
+        
+        for reader_id in self.rfid_manager.get_active_readers():
+            worker = threading.Thread(
+                target=self._pipeline_worker,
+                args=(reader_id,),
+                daemon=True,
+                name=f"Pipeline-{reader_id.upper()}"
+            )
+            worker.start()
+            self.pipeline_workers[reader_id] = worker
+            print(f"🚀 Worker decisioni {reader_id.upper()} avviato")
+        
+        try:
+            while self.running:
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
+    
+    def _pipeline_worker(self, reader_id):
+        """Worker decisioni per un singolo lettore"""
+        while self.running:
+            try:
+                card_info = self.rfid_manager.get_next_card(timeout=1, reader_id=reader_id)
+                
+                if card_info is None:
+                    continue
+                
+                self._process_card(card_info)
+                
+            except Exception as e:
+                print(f"⚠️ Errore elaborazione card ({reader_id.upper()}): {e}")
+    
+    def _process_card(self, card_info):
+        """Autenticazione, attivazione relè e log di una singola card"""
+        with self._count_lock:
+            self.card_count += 1
+            card_number = self.card_count
+        
+        # Info card
+        direction = card_info.get('direction', 'unknown').upper()
+        uid = card_info.get('uid_formatted', 'N/A')
+        
+        print(f"\n🎉 Card #{card_number}: {uid} ({direction})")
+        
+        trace = card_info.get('trace')
+        
+        # Autenticazione
+        auth_start = time.time()
+        if trace is not None:
+            trace.mark(AUTH_SENT)  # Spostato alla pubblicazione del badge se online
+        
+        if self.offline_manager:
+            auth_result = self.offline_manager.handle_card_access(card_info)
+        else:
+            # Fallback diretto
+            if self.mqtt_client and self.mqtt_client.is_connected:
+                auth_result = self.mqtt_client.publish_card_data_and_wait_auth(card_info)
+            else:
+                auth_result = {
+                    'authorized': Config.OFFLINE_ALLOW_ACCESS if Config.OFFLINE_MODE_ENABLED else False,
+                    'message': 'Sistema offline',
+                    'offline_mode': True
+                }
+        
+        auth_elapsed = time.time() - auth_start
+        if trace is not None:
+            trace.mark(AUTH_RECEIVED)
+        auth_time = int(auth_elapsed * 1000)
+        
+        # Risultato auth
+        authorized = auth_result.get('authorized', False)
+        offline_mode = auth_result.get('offline_mode', False)
+        
+        if auth_result.get('cached'):
+            auth_source = 'cache'
+        elif offline_mode:
+            auth_source = 'offline'
+        else:
+            auth_source = 'online'
+        AUTH_LATENCY.labels(auth_source).observe(auth_elapsed)
+        ACCESS_DECISIONS.labels('authorized' if authorized else 'denied').inc()
+        message = auth_result.get('message', auth_result.get('error', ''))
+        access_type = auth_result.get('access_type', 'online')
+        
+        mode_text = "OFFLINE" if offline_mode else "ONLINE"
+        auth_text = "✅ AUTORIZZATO" if authorized else "❌ NEGATO"
+        print(f"🔐 {auth_text} ({mode_text}) - {auth_time}ms")
+        if message:
+            print(f"💬 {message}")
+        
+        # Log specifico per accessi offline
+        if offline_mode and Config.OFFLINE_MODE_ENABLED:
+            access_mode = "PERMISSIVO" if Config.OFFLINE_ALLOW_ACCESS else "RESTRITTIVO"
+            print(f"🌐 Modalità offline {access_mode} attiva")
+        
+        # Attiva relè se autorizzato
+        relay_success = False
+        if authorized:
+            relay_key = self.relay_manager.route(
+                card_info.get('lane', Config.DEFAULT_LANE),
+                card_info.get('direction', 'in')
+            )
+            
+            if relay_key is not None:
+                relay_success = self.relay_manager.activate_relay(
+                    relay_key, on_release=self._relay_release_handler(card_info))
+                if relay_success:
+                    if trace is not None:
+                        trace.mark(RELAY_ON)
+                    print(f"⚡ Relè {relay_key.upper()} attivato")
+                else:
+                    print(f"❌ Errore relè {relay_key.upper()}")
+            else:
+                print("❌ Nessun relè disponibile")
+        else:
+            print("🔒 Accesso negato - Relè non attivato")
+        
+        # Log accesso (fase 'log' chiusa a record consegnato al logger)
+        if self.logger:
+            self.logger.log_access_attempt(
+                card_info=card_info,
+                auth_result=auth_result,
+                relay_success=relay_success,
+                auth_time_ms=auth_time
+            )
+        if trace is not None:
+            trace.mark(LOGGED)
+        
+        # Riepilogo
+        print(f"📊 Riepilogo: Auth={auth_text}, Relè={'✅' if relay_success else '❌'}")
+        print("-"*50)
+        
+        self.tracer.finish(trace, self._trace_context(card_info, authorized))
+    
+    def _relay_release_handler(self, card_info):
+        """Callback di spegnimento relè: chiude la trace dell'accesso"""
+        trace = card_info.get('trace')
+        if trace is None:
+            return None
+        
+        def on_release(off_at):
+            if RELAY_ON in trace.marks:
+                trace.mark(RELAY_OFF, off_at)
+                self.tracer.finish(trace, self._trace_context(card_info, True))
+        return on_release
+    
+    @staticmethod
+    def _trace_context(card_info, authorized):
+        """Campi identificativi dell'accesso nell'export delle trace"""
+        return {
+            'card_uid': card_info.get('uid_formatted'),
+            'reader_id': card_info.get('reader_id'),
+            'lane': card_info.get('lane'),
+            'authorized': authorized
+        }
+    
     def shutdown(self):
         """Spegne sistema"""
         print("🛑 Spegnimento sistema...")
         self.running = False
         
+        for worker in self.pipeline_workers.values():
+            worker.join(timeout=2)
+        self.pipeline_workers.clear()
+        
         if self.logger:
             self.logger.log_system_event("system_shutdown", "Spegnimento sistema")
         
@@ -266,11 +392,14 @@ class AccessControlSystem:
             self.manual_control.cleanup()
         
         if self.offline_manager:
-            if self.offline_manager.is_online and not self.offline_manager.offline_queue.empty():
+            if self.offline_manager.is_online and self.offline_manager.get_queue_size() > 0:
                 print("📤 Sync finale...")
                 self.offline_manager.force_sync()
             self.offline_manager.cleanup()
         
+        if self.connection_supervisor:
+            self.connection_supervisor.stop()
+        
         if self.mqtt_client:
             self.mqtt_client.publish_status("offline")
             self.mqtt_client.disconnect()
@@ -279,8 +408,12 @@ class AccessControlSystem:
             self.relay_manager.reset_all_to_initial_state()
             self.relay_manager.cleanup()
         
+        if self.metrics_server:
+            self.metrics_server.stop()
+        
         if self.logger:
             self.logger.log_system_event("system_stop", "Sistema spento")
+            self.logger.close()
         
         print("👋 Sistema spento!")
         sys.exit(0)
@@ -290,7 +423,7 @@ def main():
     try:
         # Verifica permessi
         import os
-        if os.geteuid() != 0:
+        if os.geteuid() != 0 and not hardware.is_simulated():
             print("❌ Eseguire con sudo")
             print("💡 sudo python3 main.py")
             sys.exit(1)
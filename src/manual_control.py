@@ -2,11 +2,11 @@
 """
 Controllo apertura manuale - Versione corretta
 """
-import json
 import time
 import threading
 from datetime import datetime
 from config import Config
+from wire_codec import decode_payload, get_wire_codecs
 
 class ManualControl:
     """Controllo manuale del tornello"""
@@ -50,7 +50,7 @@ class ManualControl:
     def _on_manual_command(self, client, userdata, msg):
         """Callback comandi MQTT"""
         try:
-            payload = json.loads(msg.payload.decode('utf-8'))
+            payload = decode_payload(msg.payload)
             print(f"🔓 Comando manuale ricevuto: {payload.get('command_id', 'N/A')}")
             self._process_manual_command(payload)
         except Exception as e:
@@ -159,9 +159,9 @@ class ManualControl:
                 'tornello_id': Config.TORNELLO_ID
             }
             
-            json_payload = json.dumps(response_payload, ensure_ascii=False)
+            payload = get_wire_codecs().encode(Config.MANUAL_OPEN_RESPONSE_TOPIC_SUFFIX, response_payload)
             
-            result = self.mqtt_client.client.publish(response_topic, json_payload, qos=1)
+            result = self.mqtt_client.client.publish(response_topic, payload, qos=1)
             
             if result.rc == 0:
                 print(f"📤 Risposta inviata: {success}")
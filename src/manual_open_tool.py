@@ -18,6 +18,7 @@ from mqtt_client import MQTTClient
 from manual_control import ManualControl
 from relay_manager import RelayManager
 from logger import AccessLogger
+from wire_codec import decode_payload
 
 def send_remote_command(direction='in', duration=2, user_id='admin', auth_token='admin123456'):
     """Invia comando di apertura manuale via MQTT"""
@@ -191,7 +192,7 @@ def monitor_manual_responses():
         
         def on_response(client, userdata, msg):
             try:
-                payload = json.loads(msg.payload.decode('utf-8'))
+                payload = decode_payload(msg.payload)
                 timestamp = payload.get('timestamp', 'N/A')
                 success = payload.get('success', False)
                 message = payload.get('message', 'N/A')
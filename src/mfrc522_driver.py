@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Driver MFRC522 su spidev con percorso rapido solo-UID
+REQA + anticollisione restituiscono l'UID in pochi ms; i blocchi dati del
+settore vengono letti (autenticazione + READ) solo se RFID_READ_DATA=True
+"""
+import time
+
+# Registri MFRC522
+COMMAND_REG = 0x01
+COMM_IEN_REG = 0x02
+DIV_IEN_REG = 0x03
+COMM_IRQ_REG = 0x04
+DIV_IRQ_REG = 0x05
+ERROR_REG = 0x06
+STATUS2_REG = 0x08
+FIFO_DATA_REG = 0x09
+FIFO_LEVEL_REG = 0x0A
+CONTROL_REG = 0x0C
+BIT_FRAMING_REG = 0x0D
+MODE_REG = 0x11
+TX_CONTROL_REG = 0x14
+TX_AUTO_REG = 0x15
+CRC_RESULT_REG_M = 0x21
+CRC_RESULT_REG_L = 0x22
+T_MODE_REG = 0x2A
+T_PRESCALER_REG = 0x2B
+T_RELOAD_REG_H = 0x2C
+T_RELOAD_REG_L = 0x2D
+VERSION_REG = 0x37
+
+# Comandi PCD
+PCD_IDLE = 0x00
+PCD_CALC_CRC = 0x03
+PCD_TRANSCEIVE = 0x0C
+PCD_AUTHENT = 0x0E
+PCD_SOFT_RESET = 0x0F
+
+# Comandi PICC
+PICC_REQIDL = 0x26
+PICC_ANTICOLL = 0x93
+PICC_AUTHENT1A = 0x60
+PICC_READ = 0x30
+
+# Stesso layout di SimpleMFRC522: settore 2, blocchi 8-10, trailer 11
+DEFAULT_KEY = [0xFF, 0xFF, 0xFF, 0xFF, 0xFF, 0xFF]
+DATA_BLOCKS = (8, 9, 10)
+TRAILER_BLOCK = 11
+
+def uid_to_num(uid):
+    """Stessa conversione di SimpleMFRC522: 4 byte UID + BCC come intero"""
+    n = 0
+    for byte in uid[:5]:
+        n = n * 256 + byte
+    return n
+
+class MFRC522Driver:
+    """
+    Lettore MFRC522 con la stessa interfaccia read()/read_id() di SimpleMFRC522
+    read() non blocca indefinitamente: interroga il campo fino a poll_timeout
+    e restituisce (None, None) se nessuna card è presente
+    """
+
+    def __init__(self, spi, gpio=None, rst_pin=None, read_data=False,
+                 poll_timeout=0.5, poll_interval=0.01):
+        self.spi = spi
+        self.gpio = gpio
+        self.rst_pin = rst_pin
+        self.read_data = read_data
+        self.poll_timeout = poll_timeout
+        self.poll_interval = poll_interval
+
+        # Statistiche
+        self.stats = {
+            'reads': 0,
+            'data_reads': 0,
+            'last_uid_ms': 0.0
+        }
+
+        self.init()
+
+    # --- Accesso registri ---
+
+    def write_register(self, register, value):
+        self.spi.xfer2([(register << 1) & 0x7E, value])
+
+    def read_register(self, register):
+        return self.spi.xfer2([((register << 1) & 0x7E) | 0x80, 0])[1]
+
+    def set_bits(self, register, mask):
+        self.write_register(register, self.read_register(register) | mask)
+
+    def clear_bits(self, register, mask):
+        self.write_register(register, self.read_register(register) & (~mask & 0xFF))
+
+    # --- Inizializzazione ---
+
+    def init(self):
+        if self.gpio is not None and self.rst_pin is not None:
+            self.gpio.setup(self.rst_pin, self.gpio.OUT)
+            self.gpio.output(self.rst_pin, 1)
+
+        self.write_register(COMMAND_REG, PCD_SOFT_RESET)
+        # Timer interno ~25ms: limita l'attesa di una risposta dalla card
+        self.write_register(T_MODE_REG, 0x8D)
+        self.write_register(T_PRESCALER_REG, 0x3E)
+        self.write_register(T_RELOAD_REG_L, 30)
+        self.write_register(T_RELOAD_REG_H, 0)
+        self.write_register(TX_AUTO_REG, 0x40)
+        self.write_register(MODE_REG, 0x3D)
+        self.antenna_on()
+
+    def antenna_on(self):
+        if not (self.read_register(TX_CONTROL_REG) & 0x03):
+            self.set_bits(TX_CONTROL_REG, 0x03)
+
+    def version(self):
+        """Versione chip (0x91/0x92 originale, 0x88/0xB2 cloni; 0x00/0xFF = assente)"""
+        return self.read_register(VERSION_REG)
+
+    # --- Comunicazione con la card ---
+
+    def to_card(self, command, data):
+        """Esegue un comando PCD; restituisce (ok, byte ricevuti, bit ricevuti)"""
+        if command == PCD_AUTHENT:
+            irq_en, wait_irq = 0x12, 0x10
+        else:
+            irq_en, wait_irq = 0x77, 0x30
+
+        self.write_register(COMM_IEN_REG, irq_en | 0x80)
+        self.clear_bits(COMM_IRQ_REG, 0x80)
+        self.set_bits(FIFO_LEVEL_REG, 0x80)
+        self.write_register(COMMAND_REG, PCD_IDLE)
+
+        for byte in data:
+            self.write_register(FIFO_DATA_REG, byte)
+
+        self.write_register(COMMAND_REG, command)
+        if command == PCD_TRANSCEIVE:
+            self.set_bits(BIT_FRAMING_REG, 0x80)
+
+        # Attende la risposta o lo scadere del timer interno
+        irq = 0
+        for _ in range(2000):
+            irq = self.read_register(COMM_IRQ_REG)
+            if irq & 0x01 or irq & wait_irq:
+                break
+        else:
+            self.clear_bits(BIT_FRAMING_REG, 0x80)
+            return False, [], 0
+
+        self.clear_bits(BIT_FRAMING_REG, 0x80)
+
+        if self.read_register(ERROR_REG) & 0x1B:
+            return False, [], 0
+        if irq & irq_en & 0x01:
+            return False, [], 0  # Nessuna card (timeout timer)
+
+        back_data = []
+        back_bits = 0
+        if command == PCD_TRANSCEIVE:
+            count = self.read_register(FIFO_LEVEL_REG)
+            last_bits = self.read_register(CONTROL_REG) & 0x07
+            back_bits = (count - 1) * 8 + last_bits if last_bits else count * 8
+            count = max(1, min(count, 16))
+            back_data = [self.read_register(FIFO_DATA_REG) for _ in range(count)]
+
+        return True, back_data, back_bits
+
+    def calculate_crc(self, data):
+        self.clear_bits(DIV_IRQ_REG, 0x04)
+        self.set_bits(FIFO_LEVEL_REG, 0x80)
+        for byte in data:
+            self.write_register(FIFO_DATA_REG, byte)
+        self.write_register(COMMAND_REG, PCD_CALC_CRC)
+
+        for _ in range(255):
+            if self.read_register(DIV_IRQ_REG) & 0x04:
+                break
+
+        return [self.read_register(CRC_RESULT_REG_L), self.read_register(CRC_RESULT_REG_M)]
+
+    def request(self):
+        """REQA: True se una card è nel campo"""
+        self.write_register(BIT_FRAMING_REG, 0x07)
+        ok, _, bits = self.to_card(PCD_TRANSCEIVE, [PICC_REQIDL])
+        return ok and bits == 0x10
+
+    def anticollision(self):
+        """Anticollisione livello 1: 4 byte UID + BCC, None se non valido"""
+        self.write_register(BIT_FRAMING_REG, 0x00)
+        ok, uid, _ = self.to_card(PCD_TRANSCEIVE, [PICC_ANTICOLL, 0x20])
+        if not ok or len(uid) != 5:
+            return None
+
+        bcc = 0
+        for byte in uid[:4]:
+            bcc ^= byte
+        if bcc != uid[4]:
+            return None
+        return uid
+
+    def select_tag(self, uid):
+        frame = [PICC_ANTICOLL, 0x70] + list(uid[:5])
+        frame += self.calculate_crc(frame)
+        ok, _, bits = self.to_card(PCD_TRANSCEIVE, frame)
+        return ok and bits == 0x18
+
+    def authenticate(self, block, key, uid):
+        ok, _, _ = self.to_card(PCD_AUTHENT, [PICC_AUTHENT1A, block] + list(key) + list(uid[:4]))
+        return ok and bool(self.read_register(STATUS2_REG) & 0x08)
+
+    def stop_crypto(self):
+        self.clear_bits(STATUS2_REG, 0x08)
+
+    def read_block(self, block):
+        frame = [PICC_READ, block]
+        frame += self.calculate_crc(frame)
+        ok, data, _ = self.to_card(PCD_TRANSCEIVE, frame)
+        return data[:16] if ok and len(data) >= 16 else None
+
+    def read_sector_text(self, uid):
+        """Testo dei blocchi dati come SimpleMFRC522.read() (None se illeggibile)"""
+        try:
+            if not self.select_tag(uid) or not self.authenticate(TRAILER_BLOCK, DEFAULT_KEY, uid):
+                return None
+
+            data = []
+            for block in DATA_BLOCKS:
+                block_data = self.read_block(block)
+                if block_data is None:
+                    return None
+                data.extend(block_data)
+
+            self.stats['data_reads'] += 1
+            return ''.join(chr(byte) for byte in data)
+        finally:
+            self.stop_crypto()
+
+    # --- Rilevamento via IRQ ---
+
+    def enable_irq(self):
+        """Pin IRQ push-pull attivo basso, interrupt solo su ricezione (RxIRq)"""
+        self.write_register(DIV_IEN_REG, 0x80)
+        self.write_register(COMM_IEN_REG, 0xA0)
+
+    def arm_irq(self):
+        """
+        Invia un REQA senza attendere la risposta: se una card risponde il chip
+        alza RxIRq e il pin IRQ genera il fronte (nessuna attesa attiva sull'host)
+        """
+        self.write_register(COMM_IEN_REG, 0xA0)
+        self.write_register(COMM_IRQ_REG, 0x7F)
+        self.set_bits(FIFO_LEVEL_REG, 0x80)
+        self.write_register(COMMAND_REG, PCD_IDLE)
+        self.write_register(FIFO_DATA_REG, PICC_REQIDL)
+        self.write_register(COMMAND_REG, PCD_TRANSCEIVE)
+        self.write_register(BIT_FRAMING_REG, 0x87)
+
+    def irq_uid(self):
+        """UID dopo il fronte IRQ: la risposta al REQA armato è già nel FIFO"""
+        irq = self.read_register(COMM_IRQ_REG)
+        self.clear_bits(BIT_FRAMING_REG, 0x80)
+        self.write_register(COMM_IRQ_REG, 0x7F)
+
+        if not irq & 0x20 or self.read_register(ERROR_REG) & 0x1B:
+            return None
+        if self.read_register(FIFO_LEVEL_REG) != 2:
+            return None  # Non è un ATQA
+        return self.anticollision()
+
+    # --- Interfaccia lettore ---
+
+    def read_uid_once(self):
+        """Un singolo tentativo REQA + anticollisione (None se nessuna card)"""
+        if not self.request():
+            return None
+        return self.anticollision()
+
+    def read(self):
+        """Attende una card fino a poll_timeout: (card_id, testo o None)"""
+        deadline = time.monotonic() + self.poll_timeout
+
+        while True:
+            started = time.perf_counter()
+            uid = self.read_uid_once()
+            if uid is not None:
+                self.stats['reads'] += 1
+                self.stats['last_uid_ms'] = (time.perf_counter() - started) * 1000
+                text = self.read_sector_text(uid) if self.read_data else None
+                return uid_to_num(uid), text
+
+            if time.monotonic() >= deadline:
+                return None, None
+            time.sleep(self.poll_interval)
+
+    def read_id(self):
+        card_id, _ = self.read()
+        return card_id
+
+    def close(self):
+        try:
+            self.spi.close()
+        except Exception:
+            pass
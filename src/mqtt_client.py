@@ -11,28 +11,60 @@ import threading
 from datetime import datetime
 import paho.mqtt.client as mqtt
 from config import Config
+from auth_cache import AuthCache
+from auth_rpc import AuthRequestMultiplexer, refresh_request_id
+from access_trace import AUTH_SENT
+from card_event import CardEvent
+from wire_codec import decode_payload, get_wire_codecs
 
 class MQTTClient:
     """Classe per gestire la comunicazione MQTT con autenticazione server"""
     
-    def __init__(self):
+    # Topic pubblicati dal tornello (suffisso dopo gate/<id>/)
+    PUBLISHED_TOPICS = ('badge', 'status', 'offline_audit', Config.MANUAL_OPEN_RESPONSE_TOPIC_SUFFIX)
+    
+    def __init__(self, client_factory=None):
         self.client = None
+        self.client_factory = client_factory  # Alternativa a mqtt.Client (es. broker locale per benchmark)
         self.is_connected = False
         self.connection_attempts = 0
         self.max_retries = 3
+        self._loop_running = False
+        
+        # Callback (connected, rc) sui cambi di connessione (supervisore)
+        self.connection_listeners = []
+        
+        # Callback (mid) alla conferma del broker di una publish (PUBACK per QoS1)
+        self.publish_listeners = []
+        
+        # RTT del keepalive (PINGREQ -> PINGRESP)
+        self.keepalive_rtt_ms = None
+        self._ping_sent_at = None
+        
+        # Sistema di autenticazione: richieste correlate tramite request_id
+        self.auth_requests = AuthRequestMultiplexer(on_abandoned_expired=self._on_auth_request_expired)
+        
+        # Callback (pending, response) per le risposte arrivate dopo una
+        # decisione locale; response è None se il server non ha mai risposto
+        self.late_response_handler = None
         
-        # Sistema di autenticazione
-        self.auth_responses = {}  # Dizionario per memorizzare le risposte di auth
-        self.auth_lock = threading.Lock()
-        self.pending_auths = {}  # Richieste di auth in attesa
+        # Cache locale delle decisioni (card viste di recente)
+        self.auth_cache = AuthCache() if Config.AUTH_CACHE_ENABLED else None
     
-    def initialize(self):
-        """Inizializza il client MQTT"""
+    def initialize(self, reconnect_on_failure=True):
+        """
+        Inizializza il client MQTT
+        Args: reconnect_on_failure (bool) - False se la riconnessione è gestita
+              dal ConnectionSupervisor invece che dal loop di paho
+        """
         try:
             print("🌐 Configurazione client MQTT...")
             
             # Crea il client MQTT
-            self.client = mqtt.Client()
+            if self.client_factory:
+                self.client = self.client_factory()
+            else:
+                self.client = mqtt.Client(reconnect_on_failure=reconnect_on_failure)
             
             # Configura autenticazione
             if Config.MQTT_USERNAME and Config.MQTT_PASSWORD:
@@ -71,8 +103,10 @@ class MQTTClient:
             try:
                 print(f"🔌 Tentativo connessione {attempt}/{self.max_retries} a {Config.MQTT_BROKER}:{Config.MQTT_PORT}...")
                 
-                self.client.connect(Config.MQTT_BROKER, Config.MQTT_PORT, 60)
-                self.client.loop_start()
+                self.client.connect(Config.MQTT_BROKER, Config.MQTT_PORT, Config.MQTT_KEEPALIVE)
+                if not self._loop_running:
+                    self.client.loop_start()
+                    self._loop_running = True
                 
                 # Aspetta la connessione
                 timeout = 10
@@ -96,6 +130,44 @@ class MQTTClient:
         print("❌ Impossibile connettersi al broker MQTT")
         return False
     
+    def start_connection(self):
+        """
+        Un tentativo di connessione non bloccante oltre la connessione TCP
+        (usato dal ConnectionSupervisor; il CONNACK arriva in _on_connect)
+        Solleva un'eccezione se il broker non è raggiungibile
+        """
+        if not self.client:
+            raise RuntimeError("Client MQTT non inizializzato")
+        
+        # Il thread di rete di un tentativo precedente è terminato
+        self.client.loop_stop()
+        self._loop_running = False
+        
+        print(f"🔌 Connessione a {Config.MQTT_BROKER}:{Config.MQTT_PORT}...")
+        self.client.connect(Config.MQTT_BROKER, Config.MQTT_PORT, Config.MQTT_KEEPALIVE)
+        self.client.loop_start()
+        self._loop_running = True
+    
+    def stop_connection(self):
+        """Interrompe un tentativo di connessione rimasto senza risposta"""
+        if not self.client:
+            return
+        
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+        self.client.loop_stop()
+        self._loop_running = False
+        self.is_connected = False
+    
+    def _notify_connection(self, connected, rc):
+        for listener in list(self.connection_listeners):
+            try:
+                listener(connected, rc)
+            except Exception as e:
+                print(f"⚠️ Errore callback connessione: {e}")
+    
     def _on_connect(self, client, userdata, flags, rc):
         """Callback per la connessione MQTT"""
         if rc == 0:
@@ -107,6 +179,27 @@ class MQTTClient:
                 auth_topic = Config.get_auth_response_topic()
                 client.subscribe(auth_topic, qos=1)
                 print(f"📬 Sottoscritto al topic auth: {auth_topic}")
+                
+                # Invalidazioni cache (revoche immediate dal server)
+                if self.auth_cache is not None:
+                    invalidate_topic = Config.get_auth_invalidate_topic()
+                    client.subscribe(invalidate_topic, qos=1)
+                    print(f"📬 Sottoscritto al topic invalidazione: {invalidate_topic}")
+            
+            # Whitelist: i messaggi vengono gestiti dall'OfflineManager
+            # attraverso i callback specifici registrati
+            if Config.WHITELIST_ENABLED:
+                for topic in (Config.get_whitelist_snapshot_topic(), Config.get_whitelist_delta_topic()):
+                    client.subscribe(topic, qos=1)
+                print("📬 Sottoscritto ai topic whitelist")
+            
+            # Codifiche accettate dal server (annuncio retained)
+            if Config.WIRE_CODEC_NEGOTIATE:
+                client.subscribe(Config.get_wire_codec_topic(), qos=1)
+            
+            # Ack del server sull'audit offline: gestiti dall'OfflineManager
+            if Config.OFFLINE_SYNC_ENABLED:
+                client.subscribe(Config.get_offline_ack_topic(), qos=1)
             
             # Sottoscrive al topic di apertura manuale se abilitata
             if Config.MANUAL_OPEN_ENABLED:
@@ -125,18 +218,25 @@ class MQTTClient:
             }
             error_msg = error_messages.get(rc, f"Errore sconosciuto ({rc})")
             print(f"🔴 MQTT: Errore connessione - {error_msg}")
+        
+        self._notify_connection(rc == 0, rc)
     
     def _on_message(self, client, userdata, msg):
         """Callback per i messaggi ricevuti"""
         try:
             topic = msg.topic
-            payload = json.loads(msg.payload.decode('utf-8'))
+            payload = decode_payload(msg.payload)
             
             print(f"📬 Messaggio ricevuto su {topic}")
             
             # Gestisce risposte di autenticazione
             if topic == Config.get_auth_response_topic():
                 self._handle_auth_response(payload)
+            elif topic == Config.get_auth_invalidate_topic():
+                if self.auth_cache is not None:
+                    self.auth_cache.handle_invalidation(payload)
+            elif topic == Config.get_wire_codec_topic():
+                get_wire_codecs().handle_advert(payload)
             # I messaggi di apertura manuale vengono gestiti dal ManualControl
             # attraverso il callback specifico registrato
             
@@ -151,12 +251,21 @@ class MQTTClient:
             message = payload.get('message', '')
             
             if card_uid:
-                with self.auth_lock:
-                    self.auth_responses[card_uid] = {
-                        'authorized': authorized,
-                        'message': message,
-                        'timestamp': time.time()
-                    }
+                # Aggiorna la cache anche per le risposte non attese
+                if self.auth_cache is not None:
+                    self.auth_cache.put(card_uid, authorized, message)
+                
+                # Sveglia direttamente la richiesta in attesa
+                response = {
+                    'authorized': authorized,
+                    'message': message,
+                    'timestamp': time.time()
+                }
+                pending = self.auth_requests.resolve(payload, response)
+                
+                # Risposta tardiva: il tornello ha già deciso localmente
+                if pending is not None and pending.local_result is not None and self.late_response_handler:
+                    self.late_response_handler(pending, response)
                 
                 status = "✅ AUTORIZZATO" if authorized else "❌ NEGATO"
                 print(f"🔐 Risposta auth per {card_uid}: {status}")
@@ -166,28 +275,59 @@ class MQTTClient:
         except Exception as e:
             print(f"❌ Errore gestione risposta auth: {e}")
     
+    def _on_auth_request_expired(self, pending):
+        """Richiesta decisa localmente a cui il server non ha mai risposto"""
+        if self.late_response_handler:
+            self.late_response_handler(pending, None)
+    
     def _on_disconnect(self, client, userdata, rc):
         """Callback per la disconnessione MQTT"""
         self.is_connected = False
+        self._ping_sent_at = None
         if rc != 0:
             print("🟡 MQTT: Disconnessione inaspettata")
         else:
             print("🟡 MQTT: Disconnesso dal broker")
+        
+        self._notify_connection(False, rc)
+    
+    def add_publish_listener(self, listener):
+        self.publish_listeners.append(listener)
+    
+    def remove_publish_listener(self, listener):
+        try:
+            self.publish_listeners.remove(listener)
+        except ValueError:
+            pass
     
     def _on_publish(self, client, userdata, mid):
-        """Callback per la pubblicazione MQTT"""
-        print(f"📤 MQTT: Messaggio inviato (ID: {mid})")
+        """Callback per la pubblicazione MQTT (PUBACK ricevuto per QoS1)"""
+        for listener in list(self.publish_listeners):
+            try:
+                listener(mid)
+            except Exception as e:
+                print(f"⚠️ Errore callback publish: {e}")
+        if Config.MQTT_PAYLOAD_DEBUG:
+            print(f"📤 MQTT: Messaggio inviato (ID: {mid})")
     
     def _on_log(self, client, userdata, level, buf):
-        """Callback per i log MQTT (opzionale, per debug)"""
+        """Callback per i log MQTT (RTT keepalive, debug)"""
+        # Misura RTT del keepalive
+        if buf.startswith("Sending PINGREQ"):
+            self._ping_sent_at = time.monotonic()
+        elif buf.startswith("Received PINGRESP") and self._ping_sent_at is not None:
+            self.keepalive_rtt_ms = int((time.monotonic() - self._ping_sent_at) * 1000)
+            self._ping_sent_at = None
+        
         # Decommentare per vedere i log dettagliati
         # print(f"🐛 MQTT Log: {buf}")
-        pass
     
-    def publish_card_data_and_wait_auth(self, card_info):
+    def publish_card_data_and_wait_auth(self, card_info, budget=None, fallback=None):
         """
         Pubblica i dati della card e aspetta l'autorizzazione dal server
         Args: card_info (dict) - Informazioni della card
+              budget (float) - Attesa massima in secondi prima della decisione locale
+              fallback (callable) - card_info -> risultato locale usato oltre il budget
         Returns: dict - Risultato dell'autenticazione
         """
         if not self.is_connected:
@@ -202,42 +342,67 @@ class MQTTClient:
             self.publish_card_data(card_info)
             return {'authorized': True, 'message': 'Autenticazione disabilitata'}
         
+        # Decisione in cache: apre subito, il badge va comunque al server
+        # e la sua risposta aggiornerà la cache in background
+        if self.auth_cache is not None:
+            cached = self.auth_cache.get(card_uid)
+            if cached is not None:
+                status = "✅ AUTORIZZATO" if cached['authorized'] else "❌ NEGATO"
+                print(f"⚡ Decisione da cache per {card_uid}: {status}")
+                # ID di refresh: la risposta non deve risolvere una richiesta reale per la stessa card
+                self.publish_card_data(card_info, request_id=refresh_request_id())
+                return cached
+        
         try:
             print(f"🔐 Richiesta autenticazione per card: {card_uid}")
             
-            # Rimuove eventuali risposte precedenti
-            with self.auth_lock:
-                if card_uid in self.auth_responses:
-                    del self.auth_responses[card_uid]
+            # Registra la richiesta prima di pubblicare (la risposta può
+            # arrivare prima che publish ritorni)
+            pending = self.auth_requests.register(card_uid, Config.AUTH_TIMEOUT)
+            pending.card_info = card_info
             
             # Pubblica la richiesta di autenticazione
-            if not self.publish_card_data(card_info):
+            if not self.publish_card_data(card_info, request_id=pending.request_id):
+                self.auth_requests.cancel(pending, timed_out=False)
                 return {'authorized': False, 'error': 'Errore invio richiesta'}
             
             # Aspetta la risposta del server
-            print(f"⏳ Attendo risposta server (timeout: {Config.AUTH_TIMEOUT}s)...")
-            
-            start_time = time.time()
-            while (time.time() - start_time) < Config.AUTH_TIMEOUT:
-                with self.auth_lock:
-                    if card_uid in self.auth_responses:
-                        response = self.auth_responses[card_uid]
-                        del self.auth_responses[card_uid]  # Pulisce la risposta
-                        return response
+            use_budget = budget is not None and fallback is not None and budget < Config.AUTH_TIMEOUT
+            if use_budget:
+                print(f"⏳ Attendo risposta server (budget: {int(budget * 1000)}ms)...")
+            else:
+                print(f"⏳ Attendo risposta server (timeout: {Config.AUTH_TIMEOUT}s)...")
+            
+            response = self.auth_requests.wait(pending, budget if use_budget else None)
+            if response is not None:
+                return response
+            
+            # Budget superato: decisione locale, la risposta tardiva
+            # verrà riconciliata quando arriva
+            if use_budget:
+                local_result = fallback(card_info)
+                response = self.auth_requests.abandon(pending, local_result)
+                if response is not None:
+                    return response
                 
-                time.sleep(0.1)  # Controlla ogni 100ms
+                print(f"⏱️ Budget {int(budget * 1000)}ms superato - decisione locale")
+                local_result['budget_exceeded'] = True
+                return local_result
             
             # Timeout scaduto
+            self.auth_requests.cancel(pending)
             print("⏰ Timeout autenticazione scaduto")
-            return {'authorized': False, 'error': 'Timeout autenticazione'}
+            return {'authorized': False, 'error': 'Timeout autenticazione', 'timeout': True}
             
         except Exception as e:
             print(f"❌ Errore processo autenticazione: {e}")
             return {'authorized': False, 'error': str(e)}
-    def publish_card_data(self, card_info):
+    
+    def publish_card_data(self, card_info, request_id=None):
         """
         Pubblica i dati della card sul topic MQTT
         Args: card_info (dict) - Informazioni della card
+              request_id (str) - ID di correlazione da rimandare nella risposta auth
         """
         if not self.is_connected:
             print("❌ MQTT non connesso, impossibile inviare dati")
@@ -247,31 +412,22 @@ class MQTTClient:
             # Prepara il topic
             topic = Config.get_mqtt_topic("badge")
             
-            # Prepara il payload
-            payload = {
-                "card_uid": card_info.get('uid_formatted'),
-                "identificativo_tornello": Config.TORNELLO_ID,
-                "direzione": card_info.get('direction', 'unknown'),  # Usa la direzione dalla card
-                "timestamp": datetime.now().isoformat(),
-                "raw_id": str(card_info.get('raw_id')),
-                "card_data": card_info.get('data'),
-                "hex_id": card_info.get('uid_hex'),
-                "auth_required": Config.AUTH_ENABLED,
-                "reader_id": card_info.get('reader_id', 'unknown')
-            }
-            
-            # Converte in JSON
-            json_payload = json.dumps(payload, ensure_ascii=False, indent=2)
+            # Payload costruito dall'evento nella codifica del topic (riusato se ripubblicato)
+            event = CardEvent.coerce(card_info)
+            codec = get_wire_codecs().codec_for("badge")
+            payload = event.wire_payload(request_id, codec)
             
-            print(f"\n📡 Invio dati MQTT:")
-            print(f"📍 Topic: {topic}")
-            print(f"📦 Payload:")
-            print(json_payload)
+            print(f"📡 Invio badge {event.get('uid_formatted')} su {topic} ({codec.name}, {len(payload)} byte)")
+            if Config.MQTT_PAYLOAD_DEBUG:
+                print(json.dumps(event.wire_fields(), ensure_ascii=False, indent=2))
             
             # Pubblica il messaggio
-            result = self.client.publish(topic, json_payload, qos=1, retain=False)
+            result = self.client.publish(topic, payload, qos=1, retain=False)
             
             if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                trace = card_info.get('trace')
+                if trace is not None:
+                    trace.mark(AUTH_SENT)
                 print("✅ Messaggio MQTT inviato con successo!")
                 return True
             else:
@@ -292,13 +448,16 @@ class MQTTClient:
         
         try:
             topic = Config.get_mqtt_topic("status")
+            codecs = get_wire_codecs()
             payload = {
                 "status": status,
                 "timestamp": datetime.now().isoformat(),
-                "tornello_id": Config.TORNELLO_ID
+                "tornello_id": Config.TORNELLO_ID,
+                # Codifica usata per topic (il server la riconosce anche dal primo byte)
+                "content_types": codecs.content_types(self.PUBLISHED_TOPICS)
             }
             
-            result = self.client.publish(topic, json.dumps(payload), qos=1)
+            result = self.client.publish(topic, codecs.encode("status", payload), qos=1)
             return result.rc == mqtt.MQTT_ERR_SUCCESS
             
         except Exception as e:
@@ -315,6 +474,7 @@ class MQTTClient:
             if self.client:
                 self.client.loop_stop()
                 self.client.disconnect()
+                self._loop_running = False
                 
             self.is_connected = False
             print("🌐 MQTT disconnesso")
@@ -330,7 +490,11 @@ class MQTTClient:
             'port': Config.MQTT_PORT,
             'username': Config.MQTT_USERNAME,
             'tls_enabled': Config.MQTT_USE_TLS,
-            'topic': Config.get_mqtt_topic("badge")
+            'keepalive_rtt_ms': self.keepalive_rtt_ms,
+            'topic': Config.get_mqtt_topic("badge"),
+            'auth_cache': self.auth_cache.get_status() if self.auth_cache is not None else None,
+            'wire_codecs': get_wire_codecs().get_status(),
+            'auth_requests': self.auth_requests.get_status()
         }
     
     def __del__(self):
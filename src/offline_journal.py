@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Journal append-only segmentato per la coda offline
+Un record per riga con checksum CRC32: aggiungere un evento costa una riga
+(+ fsync) indipendentemente dalla lunghezza della coda
+"""
+import json
+import os
+import threading
+import zlib
+from config import Config
+
+class OfflineJournal:
+    """
+    Segmenti seg-<id>.log in una directory; ogni riga è
+    "<crc32 esadecimale> <json>" con op 'add' (evento) oppure 'del' (sequenze
+    sincronizzate o scartate). Al riavvio i segmenti vengono rigiocati in ordine
+    """
+
+    SEGMENT_PREFIX = "seg-"
+    SEGMENT_SUFFIX = ".log"
+
+    def __init__(self, directory=None, segment_max_records=None, max_segments=None, fsync=None):
+        self.directory = directory or os.path.join(Config.LOG_DIRECTORY, Config.OFFLINE_JOURNAL_DIR)
+        self.segment_max_records = segment_max_records or Config.OFFLINE_JOURNAL_SEGMENT_RECORDS
+        self.max_segments = max_segments or Config.OFFLINE_JOURNAL_MAX_SEGMENTS
+        self.fsync = Config.OFFLINE_JOURNAL_FSYNC if fsync is None else fsync
+
+        self._lock = threading.Lock()
+        self._segments = []          # id segmenti in ordine, l'ultimo è attivo
+        self._segment_live = {}      # id segmento -> sequenze vive aggiunte lì
+        self._seq_segment = {}       # sequenza -> id segmento
+        self._active_file = None
+        self._active_records = 0
+        self._next_seq = 1
+
+        # Statistiche
+        self.stats = {
+            'appended': 0,
+            'deleted': 0,
+            'corrupted_records': 0,
+            'truncated_bytes': 0,
+            'segments_removed': 0,
+            'compactions': 0
+        }
+
+    # --- Apertura e recupero ---
+
+    def load(self):
+        """
+        Rigioca i segmenti e restituisce gli eventi ancora in coda (in ordine)
+        Una riga finale incompleta (crash durante la scrittura) viene troncata
+        """
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            self._close_active()
+
+            live = {}
+            self._segments = self._list_segments()
+            self._segment_live = {}
+            self._seq_segment = {}
+            last_segment = self._segments[-1] if self._segments else None
+
+            for segment_id in self._segments:
+                self._segment_live[segment_id] = set()
+                records = self._replay_segment(segment_id, truncate=segment_id == last_segment)
+
+                for record in records:
+                    if record['op'] == 'add':
+                        seq = record['seq']
+                        entry = record['entry']
+                        entry['journal_seq'] = seq
+                        live[seq] = entry
+                        self._track_add(seq, segment_id)
+                        self._next_seq = max(self._next_seq, seq + 1)
+                    elif record['op'] == 'del':
+                        for seq in record['seqs']:
+                            live.pop(seq, None)
+                            self._track_delete(seq)
+
+            if last_segment is not None:
+                self._active_records = len(self._read_lines(last_segment))
+            self._open_active()
+            self._remove_dead_segments()
+
+            return [live[seq] for seq in sorted(live)]
+
+    def _replay_segment(self, segment_id, truncate=False):
+        records = []
+        path = self._segment_path(segment_id)
+        good_offset = 0
+
+        with open(path, 'rb') as f:
+            data = f.read()
+
+        offset = 0
+        while offset < len(data):
+            end = data.find(b'\n', offset)
+            if end == -1:
+                break  # Riga senza terminatore: scrittura interrotta
+
+            record = self._decode_line(data[offset:end])
+            offset = end + 1
+
+            if record is None:
+                self.stats['corrupted_records'] += 1
+                continue
+
+            records.append(record)
+            good_offset = offset
+
+        if truncate and good_offset < len(data):
+            # Scarta la coda danneggiata prima di riprendere ad appendere
+            with open(path, 'r+b') as f:
+                f.truncate(good_offset)
+            self.stats['truncated_bytes'] += len(data) - good_offset
+
+        return records
+
+    # --- Scrittura ---
+
+    def append(self, entry):
+        """Aggiunge un evento e restituisce la sua sequenza"""
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+
+            record = {'op': 'add', 'seq': seq, 'entry': self._strip(entry)}
+            segment_id = self._write_record(record)
+            self._track_add(seq, segment_id)
+
+            entry['journal_seq'] = seq
+            self.stats['appended'] += 1
+            return seq
+
+    def append_many(self, entries):
+        """Aggiunge più eventi con un solo fsync (es. ripristino dallo spill)"""
+        if not entries:
+            return
+        
+        with self._lock:
+            for entry in entries:
+                seq = self._next_seq
+                self._next_seq += 1
+
+                record = {'op': 'add', 'seq': seq, 'entry': self._strip(entry)}
+                segment_id = self._write_record(record, sync=False)
+                self._track_add(seq, segment_id)
+                entry['journal_seq'] = seq
+
+            if self.fsync:
+                os.fsync(self._active_file.fileno())
+            self.stats['appended'] += len(entries)
+
+    def delete(self, seqs):
+        """Marca come rimossi gli eventi (sincronizzati o scartati)"""
+        seqs = [seq for seq in seqs if seq is not None]
+        if not seqs:
+            return
+
+        with self._lock:
+            self._write_record({'op': 'del', 'seqs': seqs})
+            for seq in seqs:
+                self._track_delete(seq)
+
+            self.stats['deleted'] += len(seqs)
+            self._remove_dead_segments()
+
+    def compact(self, entries):
+        """
+        Riscrive gli eventi vivi in un nuovo segmento ed elimina i precedenti
+        Il nuovo segmento è completo su disco prima della rimozione dei vecchi
+        """
+        with self._lock:
+            new_id = (self._segments[-1] + 1) if self._segments else 1
+            tmp_path = self._segment_path(new_id) + ".tmp"
+
+            with open(tmp_path, 'wb') as f:
+                for entry in entries:
+                    if entry.get('journal_seq') is None:
+                        # Evento rimasto solo in memoria (scrittura fallita)
+                        entry['journal_seq'] = self._next_seq
+                        self._next_seq += 1
+                    record = {'op': 'add', 'seq': entry['journal_seq'], 'entry': self._strip(entry)}
+                    f.write(self._encode_record(record))
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._close_active()
+            os.replace(tmp_path, self._segment_path(new_id))
+            self._fsync_directory()
+
+            for segment_id in self._segments:
+                self._unlink_segment(segment_id)
+
+            self._segments = [new_id]
+            self._segment_live = {new_id: set()}
+            self._seq_segment = {}
+            for entry in entries:
+                self._track_add(entry['journal_seq'], new_id)
+
+            self._active_records = len(entries)
+            self._open_active()
+            self.stats['compactions'] += 1
+
+    def needs_compaction(self):
+        with self._lock:
+            return len(self._segments) > self.max_segments
+
+    def reset(self):
+        """Elimina tutti i segmenti (coda svuotata)"""
+        with self._lock:
+            self._close_active()
+            for segment_id in self._segments:
+                self._unlink_segment(segment_id)
+
+            self._segments = []
+            self._segment_live = {}
+            self._seq_segment = {}
+            self._active_records = 0
+            self._open_active()
+
+    def close(self):
+        with self._lock:
+            self._close_active()
+
+    # --- Interni ---
+
+    def _write_record(self, record, sync=True):
+        if self._active_file is None or self._active_records >= self.segment_max_records:
+            self._rotate()
+
+        self._active_file.write(self._encode_record(record))
+        self._active_file.flush()
+        if self.fsync and sync:
+            os.fsync(self._active_file.fileno())
+
+        self._active_records += 1
+        return self._segments[-1]
+
+    def _rotate(self):
+        if self.fsync and self._active_file is not None:
+            os.fsync(self._active_file.fileno())  # Record scritti con append_many
+        self._close_active()
+        new_id = (self._segments[-1] + 1) if self._segments else 1
+        self._segments.append(new_id)
+        self._segment_live[new_id] = set()
+        self._active_records = 0
+        self._open_active()
+        self._fsync_directory()
+
+    def _open_active(self):
+        if not self._segments:
+            self._segments.append(1)
+            self._segment_live[1] = set()
+            self._active_records = 0
+        self._active_file = open(self._segment_path(self._segments[-1]), 'ab')
+
+    def _close_active(self):
+        if self._active_file is not None:
+            try:
+                self._active_file.flush()
+                if self.fsync:
+                    os.fsync(self._active_file.fileno())
+                self._active_file.close()
+            except Exception as e:
+                print(f"⚠️ Errore chiusura journal offline: {e}")
+            self._active_file = None
+
+    def _track_add(self, seq, segment_id):
+        self._seq_segment[seq] = segment_id
+        self._segment_live.setdefault(segment_id, set()).add(seq)
+
+    def _track_delete(self, seq):
+        segment_id = self._seq_segment.pop(seq, None)
+        if segment_id is not None:
+            self._segment_live.get(segment_id, set()).discard(seq)
+
+    def _remove_dead_segments(self):
+        """
+        Rimuove dal più vecchio i segmenti senza eventi vivi
+        (un 'del' si riferisce sempre a segmenti uguali o precedenti)
+        """
+        while len(self._segments) > 1 and not self._segment_live.get(self._segments[0]):
+            segment_id = self._segments.pop(0)
+            self._segment_live.pop(segment_id, None)
+            self._unlink_segment(segment_id)
+
+    def _unlink_segment(self, segment_id):
+        try:
+            os.remove(self._segment_path(segment_id))
+            self.stats['segments_removed'] += 1
+        except FileNotFoundError:
+            pass
+
+    def _fsync_directory(self):
+        if not self.fsync:
+            return
+        try:
+            fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError:
+            pass
+
+    def _list_segments(self):
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith(self.SEGMENT_PREFIX) and name.endswith(self.SEGMENT_SUFFIX):
+                try:
+                    segments.append(int(name[len(self.SEGMENT_PREFIX):-len(self.SEGMENT_SUFFIX)]))
+                except ValueError:
+                    continue
+        return sorted(segments)
+
+    def _segment_path(self, segment_id):
+        return os.path.join(self.directory, f"{self.SEGMENT_PREFIX}{segment_id:08d}{self.SEGMENT_SUFFIX}")
+
+    def _read_lines(self, segment_id):
+        with open(self._segment_path(segment_id), 'rb') as f:
+            return f.read().splitlines()
+
+    @staticmethod
+    def _strip(entry):
+        return {key: value for key, value in entry.items() if key != 'journal_seq'}
+
+    @staticmethod
+    def _encode_record(record):
+        body = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return b"%08x %s\n" % (zlib.crc32(body), body)
+
+    @staticmethod
+    def _decode_line(line):
+        try:
+            checksum, body = line.split(b' ', 1)
+            if int(checksum, 16) != zlib.crc32(body):
+                return None
+            return json.loads(body.decode('utf-8'))
+        except (ValueError, UnicodeDecodeError):
+            return None
+
+    def get_status(self):
+        """Status journal"""
+        with self._lock:
+            return {
+                'directory': self.directory,
+                'segments': len(self._segments),
+                'active_records': self._active_records,
+                'live_events': len(self._seq_segment),
+                'fsync': self.fsync,
+                'stats': self.stats.copy()
+            }
@@ -8,44 +8,87 @@ import json
 import os
 import time
 import threading
-import socket
+from collections import deque
 from datetime import datetime
-from queue import Queue, Empty
 from config import Config
+from offline_journal import OfflineJournal
+from offline_spill import OfflineSpill
+from whitelist import WhitelistReplica
+from circuit_breaker import CircuitBreaker
+from connection_supervisor import ConnectionSupervisor
+from publish_window import PublishWindow
+from event_sequence import AckCursor, get_event_sequence
+from card_event import card_record
+from wire_codec import decode_payload, get_wire_codecs
+from metrics import registry
+
+OFFLINE_BACKLOG = registry.gauge('offline_backlog_events', 'Eventi offline in attesa di sincronizzazione')
 
 class OfflineManager:
     """Classe per gestire la modalità offline e la sincronizzazione - VERSIONE CORRETTA"""
     
-    def __init__(self, mqtt_client=None, logger=None):
+    def __init__(self, mqtt_client=None, logger=None, supervisor=None):
         self.mqtt_client = mqtt_client
         self.logger = logger
         self.is_online = False
         self.last_connection_check = 0
         
-        # Coda per i messaggi offline
-        self.offline_queue = Queue()
+        # Stato connessione dai callback MQTT (nessun probe TCP)
+        self.supervisor = supervisor
+        self._owns_supervisor = False
+        
+        # Coda per i messaggi offline (in memoria) + journal append-only su disco;
+        # oltre OFFLINE_MAX_QUEUE_SIZE gli eventi vanno nei segmenti di spill compressi
+        self.offline_queue = deque()
         self.queue_file_path = os.path.join(Config.LOG_DIRECTORY, Config.OFFLINE_STORAGE_FILE)
+        self.journal = OfflineJournal()
+        self.spill = OfflineSpill()
+        OFFLINE_BACKLOG.set_function(self.get_queue_size)
         
-        # Thread per il controllo connessione e sync
-        self.connection_thread = None
+        # Thread di sync, svegliato subito alla riconnessione
         self.sync_thread = None
+        self._sync_wakeup = threading.Event()
         self.running = False
         
-        # Lock per thread safety
-        self._lock = threading.Lock()
+        # Lock per thread safety (rientrante: add -> save)
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+        
+        # Sequenza eventi del tornello e cursore degli ack del server
+        self.sequence = get_event_sequence()
+        self.ack_cursor = AckCursor()
+        self._sent_seqs = set()  # Inviati senza PUBACK: confermabili dall'ack del server
         
         # Carica la coda dai file persistente
         self.load_offline_queue()
         
+        # Circuit breaker sul percorso auth online (server lento/muto)
+        self.auth_breaker = None
+        if Config.AUTH_BREAKER_ENABLED:
+            self.auth_breaker = CircuitBreaker("auth", on_state_change=self._on_breaker_state_change)
+        
+        # Replica locale delle card autorizzate
+        self.whitelist = None
+        if Config.WHITELIST_ENABLED:
+            self.whitelist = WhitelistReplica()
+            self.whitelist.load()
+            if Config.WHITELIST_SNAPSHOT_FILE and os.path.exists(Config.WHITELIST_SNAPSHOT_FILE):
+                self.whitelist.load_snapshot_file(Config.WHITELIST_SNAPSHOT_FILE)
+        
         # Statistiche
         self.stats = {
             'total_offline_accesses': 0,
             'offline_authorized': 0,
             'offline_denied': 0,
-            'pending_sync': self.offline_queue.qsize(),
+            'pending_sync': self.get_queue_size(),
             'last_sync_attempt': None,
             'last_successful_sync': None,
-            'connection_checks': 0
+            'connection_checks': 0,
+            'budget_fallbacks': 0,
+            'late_responses': 0,
+            'late_mismatches': 0,
+            'acked_seq': self.ack_cursor.acked_seq,
+            'acked_skipped': 0
         }
     
     def initialize(self):
@@ -57,16 +100,41 @@ class OfflineManager:
                 print("🔴 Modalità offline disabilitata")
                 return False
             
-            # Verifica connessione iniziale
+            # Riconciliazione risposte auth tardive (budget di latenza)
+            if self.mqtt_client:
+                self.mqtt_client.late_response_handler = self._on_late_auth_response
+            
+            # Aggiornamenti whitelist dal server
+            if self.whitelist is not None and self.mqtt_client and self.mqtt_client.client:
+                self.mqtt_client.client.message_callback_add(
+                    Config.get_whitelist_snapshot_topic(), self._on_whitelist_snapshot)
+                self.mqtt_client.client.message_callback_add(
+                    Config.get_whitelist_delta_topic(), self._on_whitelist_delta)
+            
+            # Ack del server sull'audit offline (cursore "acquisito fino a")
+            if Config.OFFLINE_SYNC_ENABLED and self.mqtt_client and self.mqtt_client.client:
+                self.mqtt_client.client.message_callback_add(
+                    Config.get_offline_ack_topic(), self._on_audit_ack)
+            
+            # Stato connessione dal supervisore MQTT (creato qui se non fornito)
+            if self.supervisor is None and self.mqtt_client and self.mqtt_client.client:
+                self.supervisor = ConnectionSupervisor(self.mqtt_client, self.logger)
+                self._owns_supervisor = True
+            if self.supervisor is not None:
+                self.supervisor.start()
+                self.supervisor.add_listener(self._on_connection_state_change)
             self.check_connection()
             
             # Avvia i thread di monitoraggio
             self.start_monitoring_threads()
             
             print(f"✅ Offline Manager inizializzato")
-            print(f"   📊 Elementi in coda: {self.offline_queue.qsize()}")
+            print(f"   📊 Elementi in coda: {self.get_queue_size()}")
             print(f"   🌐 Stato connessione: {'Online' if self.is_online else 'Offline'}")
             print(f"   🚪 Accesso offline: {'Consentito' if Config.OFFLINE_ALLOW_ACCESS else 'Negato'}")
+            if self.whitelist is not None:
+                wl_status = self.whitelist.get_status()
+                print(f"   📋 Whitelist: {wl_status['cards']} card (versione {wl_status['version']})")
             
             return True
             
@@ -75,17 +143,9 @@ class OfflineManager:
             return False
     
     def start_monitoring_threads(self):
-        """Avvia i thread di monitoraggio"""
+        """Avvia il thread di sincronizzazione"""
         self.running = True
         
-        # Thread per controllo connessione
-        self.connection_thread = threading.Thread(
-            target=self._connection_monitor_thread,
-            daemon=True,
-            name="ConnectionMonitor"
-        )
-        self.connection_thread.start()
-        
         # Thread per sincronizzazione
         if Config.OFFLINE_SYNC_ENABLED:
             self.sync_thread = threading.Thread(
@@ -98,102 +158,83 @@ class OfflineManager:
     def stop_monitoring_threads(self):
         """Ferma i thread di monitoraggio"""
         self.running = False
-        
-        if self.connection_thread:
-            self.connection_thread.join(timeout=2)
+        self._sync_wakeup.set()
         
         if self.sync_thread:
             self.sync_thread.join(timeout=2)
+        
+        if self._owns_supervisor:
+            self.supervisor.stop()
     
     def check_connection(self):
-        """Controlla se c'è connessione internet e MQTT"""
-        try:
-            # Prima verifica connessione internet generica
-            socket.create_connection(("8.8.8.8", 53), timeout=3)
-            
-            # Poi testa il broker MQTT specifico
-            socket.create_connection((Config.MQTT_BROKER, Config.MQTT_PORT), timeout=5)
-            
-            # Verifica anche stato MQTT client se disponibile
-            mqtt_connected = False
-            if self.mqtt_client:
-                try:
-                    mqtt_connected = self.mqtt_client.is_connected
-                except:
-                    mqtt_connected = False
-            
-            # Se arriviamo qui, la connessione di base c'è
-            was_offline = not self.is_online
-            self.is_online = True
-            self.last_connection_check = time.time()
-            self.stats['connection_checks'] += 1
-            
-            if was_offline:
-                print("🟢 Connessione internet ripristinata!")
-                if self.logger:
-                    self.logger.log_system_event("connection_restored", "Connessione internet ripristinata")
-                
-                # Riconnetti MQTT se necessario
-                if self.mqtt_client and not mqtt_connected:
-                    try:
-                        print("🔄 Tentativo riconnessione MQTT...")
-                        self.mqtt_client.connect()
-                    except Exception as e:
-                        print(f"⚠️ Riconnessione MQTT fallita: {e}")
-                
-                # Avvia sync se abilitata
-                if Config.OFFLINE_SYNC_ENABLED and not self.offline_queue.empty():
-                    print(f"📤 Avvio sincronizzazione ({self.offline_queue.qsize()} elementi in coda)")
-            
-            return True
-            
-        except (socket.timeout, socket.error, OSError, ConnectionRefusedError) as e:
-            was_online = self.is_online
-            self.is_online = False
-            self.last_connection_check = time.time()
-            self.stats['connection_checks'] += 1
-            
-            if was_online:
-                print("🔴 Connessione internet persa - Attivazione modalità offline")
-                if self.logger:
-                    self.logger.log_system_event("connection_lost", f"Connessione internet persa: {e}", "warning")
-                
-                # Mostra info modalità offline
-                if Config.OFFLINE_ALLOW_ACCESS:
-                    print("✅ Accessi offline consentiti - Sistema continua a funzionare")
-                else:
-                    print("❌ Accessi offline disabilitati - Sistema bloccato")
+        """Stato connessione corrente (dai callback MQTT, senza traffico di rete)"""
+        if self.supervisor is not None:
+            online = self.supervisor.is_online()
+        else:
+            online = bool(self.mqtt_client and self.mqtt_client.is_connected)
+        
+        self.last_connection_check = time.time()
+        self.stats['connection_checks'] += 1
+        self.is_online = online
+        return online
+    
+    def _on_connection_state_change(self, online):
+        """Callback del supervisore: passaggio online/offline"""
+        was_online = self.is_online
+        self.is_online = online
+        self.last_connection_check = time.time()
+        self.stats['connection_checks'] += 1
+        
+        if online and not was_online:
+            print("🟢 Connessione MQTT ripristinata!")
+            if self.logger:
+                self.logger.log_system_event("connection_restored", "Connessione MQTT ripristinata")
             
-            return False
+            # Sync immediata invece di attendere il prossimo ciclo
+            if Config.OFFLINE_SYNC_ENABLED and self.offline_queue:
+                print(f"📤 Avvio sincronizzazione ({len(self.offline_queue)} elementi in coda)")
+                self._sync_wakeup.set()
         
+        elif not online and was_online:
+            print("🔴 Connessione MQTT persa - Attivazione modalità offline")
+            if self.logger:
+                self.logger.log_system_event("connection_lost", "Connessione MQTT persa", "warning")
+            
+            # Mostra info modalità offline
+            if Config.OFFLINE_ALLOW_ACCESS:
+                print("✅ Accessi offline consentiti - Sistema continua a funzionare")
+            else:
+                print("❌ Accessi offline disabilitati - Sistema bloccato")
+    
+    def _on_whitelist_snapshot(self, client, userdata, msg):
+        """Callback snapshot completo whitelist"""
+        try:
+            payload = decode_payload(msg.payload)
+            count = self.whitelist.handle_snapshot_message(payload)
+            if count is not None and self.logger:
+                self.logger.log_system_event("whitelist_snapshot", f"Snapshot whitelist: {count} card")
         except Exception as e:
-            print(f"⚠️ Errore controllo connessione: {e}")
-            # In caso di errore, mantieni lo stato attuale
-            return self.is_online
+            print(f"❌ Errore snapshot whitelist: {e}")
     
-    def _connection_monitor_thread(self):
-        """Thread per il monitoraggio continuo della connessione"""
-        while self.running:
-            try:
-                # Controlla connessione ogni X secondi
-                if time.time() - self.last_connection_check >= Config.CONNECTION_CHECK_INTERVAL:
-                    self.check_connection()
-                
-                time.sleep(5)  # Controlla ogni 5 secondi per responsività
-                
-            except Exception as e:
-                if self.logger:
-                    self.logger.log_system_event("connection_monitor_error", str(e), "error")
-                time.sleep(10)
+    def _on_whitelist_delta(self, client, userdata, msg):
+        """Callback delta incrementale whitelist"""
+        try:
+            payload = decode_payload(msg.payload)
+            self.whitelist.handle_delta_message(payload)
+        except Exception as e:
+            print(f"❌ Errore delta whitelist: {e}")
     
     def _sync_thread(self):
         """Thread per la sincronizzazione automatica"""
         while self.running:
             try:
-                if self.is_online and not self.offline_queue.empty():
-                    self.sync_offline_data()
+                # Attesa interrotta subito alla riconnessione
+                self._sync_wakeup.wait(10)
+                self._sync_wakeup.clear()
                 
-                time.sleep(10)  # Tenta sync ogni 10 secondi quando online
+                # Lo spill non è mai pieno con la coda in memoria vuota
+                if self.running and self.is_online and self.offline_queue:
+                    self.sync_offline_data()
                 
             except Exception as e:
                 if self.logger:
@@ -206,22 +247,64 @@ class OfflineManager:
         Returns: dict con risultato dell'autenticazione
         """
         if self.is_online and self.mqtt_client and self.mqtt_client.is_connected:
-            # Modalità online - autenticazione normale
+            # Server auth non risponde: decisione locale senza attendere il timeout
+            if self.auth_breaker and not self.auth_breaker.allow_request():
+                result = self._handle_offline_access(card_info)
+                result['circuit_open'] = True
+                return result
+            
+            # Modalità online - autenticazione normale, entro il budget se configurato
+            budget = Config.ACCESS_LATENCY_BUDGET_MS / 1000 if Config.ACCESS_LATENCY_BUDGET_MS > 0 else None
             try:
-                return self.mqtt_client.publish_card_data_and_wait_auth(card_info)
+                start = time.monotonic()
+                result = self.mqtt_client.publish_card_data_and_wait_auth(
+                    card_info, budget=budget, fallback=self._budget_fallback)
+                self._record_auth_outcome(result, (time.monotonic() - start) * 1000)
+                return result
             except Exception as e:
+                if self.auth_breaker:
+                    self.auth_breaker.record_failure()
                 print(f"⚠️ Errore autenticazione online, fallback offline: {e}")
                 return self._handle_offline_access(card_info)
         else:
             # Modalità offline
             return self._handle_offline_access(card_info)
     
+    def _record_auth_outcome(self, result, latency_ms):
+        """Aggiorna il circuit breaker con l'esito della richiesta online"""
+        if not self.auth_breaker:
+            return
+        
+        if result.get('cached'):
+            # Le decisioni da cache non dicono nulla sullo stato del server:
+            # in half_open la prova va liberata per la prossima richiesta
+            self.auth_breaker.release_probe()
+            return
+        
+        if result.get('budget_exceeded'):
+            # Registrate all'arrivo della risposta tardiva; una prova in half_open
+            # fallisce subito (la scadenza delle richieste abbandonate viene
+            # controllata solo con nuove richieste, che il breaker rifiuterebbe)
+            self.auth_breaker.fail_probe()
+            return
+        
+        if result.get('error'):
+            self.auth_breaker.record_failure()
+        else:
+            self.auth_breaker.record_success(latency_ms)
+    
+    def _on_breaker_state_change(self, old_state, new_state):
+        """Log dei cambi di stato del circuit breaker"""
+        if self.logger:
+            level = "warning" if new_state == CircuitBreaker.OPEN else "info"
+            self.logger.log_system_event("auth_breaker", f"Circuit breaker auth: {old_state} -> {new_state}", level)
+    
     def _handle_offline_access(self, card_info):
         """
         Gestisce l'accesso in modalità offline - VERSIONE CORRETTA
         
         COMPORTAMENTO CORRETTO:
-        1. Decide localmente se autorizzare (basato su OFFLINE_ALLOW_ACCESS)
+        1. Decide localmente se autorizzare (whitelist se caricata, altrimenti OFFLINE_ALLOW_ACCESS)
         2. Apre/non apre il tornello IMMEDIATAMENTE
         3. Salva evento per sync futura (solo audit)
         4. Quando torna online, sync è solo per log/audit (NO riapertura)
@@ -234,27 +317,24 @@ class OfflineManager:
             }
         
         # DECISIONE LOCALE IMMEDIATA
-        if Config.OFFLINE_ALLOW_ACCESS:
-            # Modalità permissiva - autorizza accesso
-            authorized = True
-            message = "Accesso offline autorizzato - modalità permissiva"
-            print("🟡 MODALITÀ OFFLINE - Accesso CONSENTITO (locale)")
-        else:
-            # Modalità restrittiva - nega accesso  
-            authorized = False
-            message = "Accesso negato - sistema offline modalità restrittiva"
-            print("🔴 MODALITÀ OFFLINE - Accesso NEGATO (locale)")
-        
-        # Salva SEMPRE per audit futuro (sia autorizzati che negati)
-        self._add_to_offline_queue(card_info, authorized, message)
-        
-        # Aggiorna statistiche
-        self.stats['total_offline_accesses'] += 1
+        authorized, message, access_type = self._local_decision(card_info)
+        source = "whitelist" if access_type == 'offline_whitelist' else "locale"
         if authorized:
-            self.stats['offline_authorized'] += 1
+            print(f"🟡 MODALITÀ OFFLINE - Accesso CONSENTITO ({source})")
         else:
-            self.stats['offline_denied'] += 1
-        self.stats['pending_sync'] = self.offline_queue.qsize()
+            print(f"🔴 MODALITÀ OFFLINE - Accesso NEGATO ({source})")
+        
+        with self._lock:
+            # Salva SEMPRE per audit futuro (sia autorizzati che negati)
+            self._add_to_offline_queue(card_info, authorized, message)
+            
+            # Aggiorna statistiche
+            self.stats['total_offline_accesses'] += 1
+            if authorized:
+                self.stats['offline_authorized'] += 1
+            else:
+                self.stats['offline_denied'] += 1
+            self.stats['pending_sync'] = self.get_queue_size()
         
         return {
             'authorized': authorized,      # DECISIONE LOCALE IMMEDIATA
@@ -262,9 +342,83 @@ class OfflineManager:
             'offline_mode': True,
             'offline_decision': True,      # Flag importante: decisione presa localmente
             'local_timestamp': datetime.now().isoformat(),
-            'access_type': 'offline_local'  # Identifica tipo accesso
+            'access_type': access_type      # Identifica tipo accesso
         }
     
+    def _local_decision(self, card_info):
+        """
+        Decisione locale per una card: whitelist se caricata,
+        altrimenti politica OFFLINE_ALLOW_ACCESS
+        Returns: (authorized, message, access_type)
+        """
+        if self.whitelist is not None and self.whitelist.is_loaded():
+            # Decisione per singola card dalla replica locale
+            if self.whitelist.contains(card_info.get('uid_formatted')):
+                return True, "Accesso offline autorizzato - card in whitelist", 'offline_whitelist'
+            return False, "Accesso negato - card non presente in whitelist", 'offline_whitelist'
+        
+        if Config.OFFLINE_ALLOW_ACCESS:
+            # Modalità permissiva - autorizza accesso
+            return True, "Accesso offline autorizzato - modalità permissiva", 'offline_local'
+        
+        # Modalità restrittiva - nega accesso
+        return False, "Accesso negato - sistema offline modalità restrittiva", 'offline_local'
+    
+    def _budget_fallback(self, card_info):
+        """
+        Decisione locale quando il server supera il budget di latenza
+        Il badge è già stato inviato: nessun evento in coda offline
+        """
+        authorized, message, access_type = self._local_decision(card_info)
+        
+        with self._lock:
+            self.stats['budget_fallbacks'] += 1
+        
+        return {
+            'authorized': authorized,
+            'message': f"{message} (server oltre budget)",
+            'offline_mode': False,
+            'local_decision': True,
+            'local_timestamp': datetime.now().isoformat(),
+            'access_type': access_type.replace('offline_', 'budget_')
+        }
+    
+    def _on_late_auth_response(self, pending, response):
+        """
+        Riconcilia la risposta del server arrivata dopo la decisione locale
+        (la cache auth è già aggiornata dal client MQTT)
+        """
+        latency_ms = int((time.monotonic() - pending.created_at) * 1000)
+        local_result = pending.local_result
+        
+        if response is None:
+            # Il server non ha mai risposto
+            if self.auth_breaker:
+                self.auth_breaker.record_failure()
+            if self.logger:
+                self.logger.log_system_event(
+                    "late_auth_missing",
+                    f"Nessuna risposta server per {pending.card_uid} (decisione locale: {local_result.get('authorized')})",
+                    "warning"
+                )
+            return
+        
+        if self.auth_breaker:
+            self.auth_breaker.record_success(latency_ms)
+        
+        mismatch = bool(response.get('authorized')) != bool(local_result.get('authorized'))
+        with self._lock:
+            self.stats['late_responses'] += 1
+            if mismatch:
+                self.stats['late_mismatches'] += 1
+        
+        if mismatch:
+            print(f"⚠️ Risposta tardiva DISCORDE per {pending.card_uid}: "
+                  f"server={response.get('authorized')}, locale={local_result.get('authorized')} ({latency_ms}ms)")
+        
+        if self.logger and pending.card_info:
+            self.logger.log_auth_reconciliation(pending.card_info, local_result, response, latency_ms)
+    
     def _add_to_offline_queue(self, card_info, authorized, message):
         """
         Aggiunge un accesso alla coda offline - VERSIONE CORRETTA
@@ -274,8 +428,9 @@ class OfflineManager:
         try:
             # Prepara i dati per la coda
             offline_entry = {
+                'event_seq': card_info.get('event_seq') or self.sequence.next(),
                 'timestamp': datetime.now().isoformat(),
-                'card_info': card_info,
+                'card_info': card_record(card_info),
                 'offline_authorized': authorized,    # Decisione locale
                 'offline_message': message,
                 'sync_attempts': 0,
@@ -284,21 +439,32 @@ class OfflineManager:
                 'action_completed': True            # Azione già eseguita localmente
             }
             
-            # Controlla se la coda è piena
-            if self.offline_queue.qsize() >= Config.OFFLINE_MAX_QUEUE_SIZE:
-                print(f"⚠️ Coda offline piena ({Config.OFFLINE_MAX_QUEUE_SIZE}), rimuovo elemento più vecchio")
+            with self._lock:
+                queue_full = len(self.offline_queue) >= Config.OFFLINE_MAX_QUEUE_SIZE
+                
+                if self.spill.enabled and (queue_full or not self.spill.is_empty()):
+                    # Overflow su disco; finché lo spill non è vuoto anche i nuovi
+                    # eventi vanno lì, così tornano in coda nell'ordine di arrivo
+                    self.spill.append(offline_entry)
+                    print(f"💾 Evento offline su disco (overflow, {self.get_queue_size()} in coda)")
+                    return
+                
+                # Controlla se la coda è piena (spill disabilitato)
+                if queue_full:
+                    print(f"⚠️ Coda offline piena ({Config.OFFLINE_MAX_QUEUE_SIZE}), rimuovo elemento più vecchio")
+                    dropped = self.offline_queue.popleft()
+                    self.journal.delete([dropped.get('journal_seq')])
+                
+                # In coda + una riga nel journal (costo costante)
+                self.offline_queue.append(offline_entry)
+                queue_size = self.get_queue_size()
+                
                 try:
-                    self.offline_queue.get_nowait()
-                except Empty:
-                    pass
-            
-            # Aggiungi alla coda
-            self.offline_queue.put(offline_entry)
-            
-            # Salva su file
-            self.save_offline_queue()
+                    self.journal.append(offline_entry)
+                except Exception as e:
+                    print(f"⚠️ Errore scrittura journal offline: {e}")
             
-            print(f"💾 Evento offline salvato per audit futuro ({self.offline_queue.qsize()} in coda)")
+            print(f"💾 Evento offline salvato per audit futuro ({queue_size} in coda)")
             
         except Exception as e:
             print(f"❌ Errore salvataggio coda offline: {e}")
@@ -311,96 +477,51 @@ class OfflineManager:
         
         IMPORTANTE: Questa sync è SOLO per audit/log.
         NON invia comandi che possono riaprire il tornello!
+        
+        Gli eventi partono in batch (OFFLINE_SYNC_BATCH_SIZE / _BYTES) con al
+        massimo OFFLINE_SYNC_WINDOW publish QoS1 in volo; un evento lascia la
+        coda persistente solo dopo il PUBACK del broker per il suo batch.
+        Svuotata la coda in memoria, i segmenti di spill vengono ripristinati
+        e inviati in ordine nello stesso ciclo
         """
         if not self.is_online or not Config.OFFLINE_SYNC_ENABLED:
             return
         
-        if self.offline_queue.empty():
-            return
-        
-        self.stats['last_sync_attempt'] = datetime.now().isoformat()
         synced_count = 0
         failed_count = 0
         
-        print(f"📤 Sync audit offline ({self.offline_queue.qsize()} eventi)")
-        
-        # Lista temporanea per elementi falliti
-        failed_items = []
-        
-        while not self.offline_queue.empty() and self.is_online:
-            try:
-                # Ottieni il prossimo elemento
-                offline_entry = self.offline_queue.get_nowait()
-                card_info = offline_entry['card_info']
+        # Una sola sync alla volta (thread di sync e force_sync allo spegnimento)
+        with self._sync_lock:
+            while self.is_online:
+                with self._lock:
+                    pending = list(self.offline_queue)
                 
-                # Prepara payload di AUDIT (non comando)
-                audit_payload = {
-                    'card_uid': card_info['uid_formatted'],
-                    'identificativo_tornello': Config.TORNELLO_ID,
-                    'direzione': card_info['direction'],
-                    'timestamp': offline_entry['timestamp'],
-                    'raw_id': str(card_info['raw_id']),
-                    'card_data': card_info.get('data', ''),
-                    'hex_id': card_info.get('uid_hex', ''),
-                    'reader_id': card_info.get('reader_id', 'unknown'),
-                    
-                    # Campi specifici offline
-                    'offline_authorized': offline_entry['offline_authorized'],
-                    'offline_message': offline_entry['offline_message'],
-                    'sync_type': 'offline_audit',    # Tipo speciale
-                    'action_completed': True,        # Azione già completata
-                    'sync_timestamp': datetime.now().isoformat()
-                }
+                # Già acquisiti dal server (ack arrivato, PUBACK perso): niente reinvio
+                acked = [entry for entry in pending if self.ack_cursor.is_acked(entry.get('event_seq'))]
+                if acked:
+                    pending = [entry for entry in pending if not self.ack_cursor.is_acked(entry.get('event_seq'))]
+                    self._remove_from_queue(acked)
+                    self._prune_ack_cursor()
+                    self.stats['acked_skipped'] += len(acked)
                 
-                # Invia su topic SEPARATO per audit
-                audit_topic = f"gate/{Config.TORNELLO_ID}/offline_audit"
+                if not pending:
+                    if self.offline_queue:
+                        continue  # Coda ripristinata dallo spill dopo la rimozione
+                    break
                 
-                try:
-                    if self.mqtt_client and self.mqtt_client.is_connected:
-                        json_payload = json.dumps(audit_payload, ensure_ascii=False)
-                        result = self.mqtt_client.client.publish(audit_topic, json_payload, qos=1)
-                        
-                        if result.rc == 0:
-                            synced_count += 1
-                            print(f"✅ Audit sync: {card_info['uid_formatted']} ({synced_count})")
-                        else:
-                            offline_entry['sync_attempts'] += 1
-                            failed_items.append(offline_entry)
-                            failed_count += 1
-                    else:
-                        # Connessione MQTT persa
-                        failed_items.append(offline_entry)
-                        failed_count += 1
-                        break
-                        
-                except Exception as e:
-                    print(f"⚠️ Errore sincronizzazione elemento: {e}")
-                    offline_entry['sync_attempts'] += 1
-                    
-                    # Se troppi tentativi, scarta
-                    if offline_entry['sync_attempts'] < Config.CONNECTION_RETRY_ATTEMPTS:
-                        failed_items.append(offline_entry)
-                    
-                    failed_count += 1
+                self.stats['last_sync_attempt'] = datetime.now().isoformat()
+                batches = self._build_audit_batches(pending)
                 
-                # Pausa breve per non sovraccaricare
-                time.sleep(0.1)
+                print(f"📤 Sync audit offline ({len(pending)} eventi, {len(batches)} batch)")
+                synced, failed = self._publish_audit_batches(batches)
+                synced_count += synced
+                failed_count += failed
                 
-            except Empty:
-                break
-            except Exception as e:
-                print(f"❌ Errore durante sync: {e}")
-                break
-        
-        # Rimetti gli elementi falliti in coda
-        for item in failed_items:
-            self.offline_queue.put(item)
-        
-        # Salva la coda aggiornata
-        self.save_offline_queue()
+                if failed or not synced:
+                    break  # Il resto (coda e spill) alla prossima sync
         
         # Aggiorna statistiche
-        self.stats['pending_sync'] = self.offline_queue.qsize()
+        self.stats['pending_sync'] = self.get_queue_size()
         if synced_count > 0:
             self.stats['last_successful_sync'] = datetime.now().isoformat()
         
@@ -409,63 +530,337 @@ class OfflineManager:
             print(f"📊 Sync audit completata:")
             print(f"   ✅ Sincronizzati: {synced_count}")
             print(f"   ❌ Falliti: {failed_count}")
-            print(f"   ⏳ Rimanenti in coda: {self.offline_queue.qsize()}")
+            print(f"   ⏳ Rimanenti in coda: {self.get_queue_size()}")
             
             if self.logger:
                 self.logger.log_system_event(
                     "offline_audit_sync_completed", 
-                    f"Audit sync: {synced_count} ok, {failed_count} falliti, {self.offline_queue.qsize()} rimanenti"
+                    f"Audit sync: {synced_count} ok, {failed_count} falliti, {self.get_queue_size()} rimanenti"
                 )
     
-    def save_offline_queue(self):
-        """Salva la coda offline su file"""
+    def _audit_event(self, offline_entry):
+        """Payload di AUDIT (non comando) per un singolo evento offline"""
+        card_info = offline_entry['card_info']
+        return {
+            'event_seq': offline_entry.get('event_seq'),   # Chiave di deduplica con il tornello
+            'card_uid': card_info['uid_formatted'],
+            'identificativo_tornello': Config.TORNELLO_ID,
+            'direzione': card_info['direction'],
+            'timestamp': offline_entry['timestamp'],
+            'raw_id': str(card_info['raw_id']),
+            'card_data': card_info.get('data', ''),
+            'hex_id': card_info.get('uid_hex', ''),
+            'reader_id': card_info.get('reader_id', 'unknown'),
+            
+            # Campi specifici offline
+            'offline_authorized': offline_entry['offline_authorized'],
+            'offline_message': offline_entry['offline_message'],
+            'sync_type': 'offline_audit',    # Tipo speciale
+            'action_completed': True         # Azione già completata
+        }
+    
+    def _build_audit_batches(self, pending):
+        """
+        Raggruppa gli eventi in batch limitati per numero e per byte
+        Returns: lista di (eventi offline, payload codificato del batch)
+        """
+        batch_size = max(1, Config.OFFLINE_SYNC_BATCH_SIZE)
+        max_bytes = Config.OFFLINE_SYNC_BATCH_BYTES
+        codec = get_wire_codecs().codec_for('offline_audit')
+        
+        batches = []
+        entries, events, size = [], [], 0
+        for offline_entry in pending:
+            try:
+                event = codec.encode(self._audit_event(offline_entry))
+            except Exception as e:
+                print(f"⚠️ Evento offline non valido, resta in coda: {e}")
+                continue
+            
+            event_bytes = len(event) + 1
+            # Un evento più grande del limite viaggia comunque da solo
+            if entries and (len(entries) >= batch_size or size + event_bytes > max_bytes):
+                batches.append((entries, self._audit_batch_payload(codec, entries, events)))
+                entries, events, size = [], [], 0
+            
+            entries.append(offline_entry)
+            events.append(event)
+            size += event_bytes
+        
+        if entries:
+            batches.append((entries, self._audit_batch_payload(codec, entries, events)))
+        return batches
+    
+    def _audit_batch_payload(self, codec, entries, events):
+        """Messaggio di batch con gli eventi già codificati"""
+        seqs = [entry.get('event_seq') for entry in entries if entry.get('event_seq') is not None]
+        header = {
+            'identificativo_tornello': Config.TORNELLO_ID,
+            'sync_type': 'offline_audit_batch',
+            'sync_timestamp': datetime.now().isoformat(),
+            'count': len(events),
+            'first_seq': min(seqs) if seqs else None,
+            'last_seq': max(seqs) if seqs else None
+        }
+        return codec.encode_with_items(header, 'events', events)
+    
+    def _publish_audit_batches(self, batches):
+        """
+        Invia i batch attraverso la finestra di publish in volo
+        Returns: (eventi confermati, eventi non confermati)
+        """
+        client = self.mqtt_client
+        if not client or not client.is_connected:
+            return 0, 0
+        
+        # Invia su topic SEPARATO per audit
+        audit_topic = f"gate/{Config.TORNELLO_ID}/offline_audit"
+        ack_timeout = Config.OFFLINE_SYNC_ACK_TIMEOUT
+        window = PublishWindow(Config.OFFLINE_SYNC_WINDOW)
+        synced_count = 0
+        failed_count = 0
+        
+        client.add_publish_listener(window.on_publish)
         try:
-            # Converte la coda in lista
-            queue_data = []
-            temp_queue = Queue()
-            
-            while not self.offline_queue.empty():
+            for entries, payload in batches:
+                if not self.is_online or not client.is_connected:
+                    break  # Connessione persa: il resto alla prossima sync
+                
+                if not window.wait_slot(ack_timeout):
+                    print(f"⚠️ Nessun PUBACK audit entro {ack_timeout}s, sync sospesa")
+                    break
+                synced_count += self._confirm_audit_batches(window)
+                
                 try:
-                    item = self.offline_queue.get_nowait()
-                    queue_data.append(item)
-                    temp_queue.put(item)
-                except Empty:
+                    result = client.client.publish(audit_topic, payload, qos=1)
+                except Exception as e:
+                    print(f"⚠️ Errore invio batch audit: {e}")
+                    result = None
+                
+                if result is None or result.rc != 0:
+                    for offline_entry in entries:
+                        offline_entry['sync_attempts'] += 1
+                    failed_count += len(entries)
                     break
+                
+                with self._lock:
+                    self._sent_seqs.update(entry.get('event_seq') for entry in entries)
+                window.track(result.mid, entries)
+            
+            if client.is_connected:
+                window.wait_all(ack_timeout)
+            synced_count += self._confirm_audit_batches(window)
+        finally:
+            client.remove_publish_listener(window.on_publish)
+        
+        # Batch mai confermati: restano in coda per la prossima sync
+        for entries in window.abandon():
+            for offline_entry in entries:
+                offline_entry['sync_attempts'] += 1
+            failed_count += len(entries)
+        
+        return synced_count, failed_count
+    
+    def _confirm_audit_batches(self, window):
+        """Toglie dalla coda gli eventi dei batch confermati dal broker"""
+        confirmed = [offline_entry for entries in window.take_acked() for offline_entry in entries]
+        if confirmed:
+            with self._lock:
+                self._sent_seqs.difference_update(entry.get('event_seq') for entry in confirmed)
+            self._remove_from_queue(confirmed)
+            print(f"✅ Audit sync confermata dal broker: {len(confirmed)} eventi")
+        return len(confirmed)
+    
+    def _remove_from_queue(self, items):
+        """Rimuove gli eventi completati dalla coda e li marca nel journal"""
+        if not items:
+            return
+        
+        with self._lock:
+            done = {id(item) for item in items}
+            removed = []
+            
+            # Caso normale: gli elementi completati sono in testa alla coda
+            while self.offline_queue and id(self.offline_queue[0]) in done:
+                item = self.offline_queue.popleft()
+                done.discard(id(item))
+                removed.append(item)
+            
+            for item in items:
+                if id(item) in done:
+                    done.discard(id(item))
+                    try:
+                        self.offline_queue.remove(item)
+                        removed.append(item)
+                    except ValueError:
+                        pass  # Già rimosso (es. ack del server prima del PUBACK)
             
-            # Rimetti tutto nella coda originale
-            self.offline_queue = temp_queue
-            
-            # Salva su file
-            with open(self.queue_file_path, 'w', encoding='utf-8') as f:
-                json.dump({
-                    'saved_at': datetime.now().isoformat(),
-                    'queue_size': len(queue_data),
-                    'queue_data': queue_data
-                }, f, indent=2, ensure_ascii=False)
+            self.journal.delete([item.get('journal_seq') for item in removed])
+        
+        self._restore_from_spill()
+        self.save_offline_queue()
+    
+    def _restore_from_spill(self):
+        """
+        Riporta in coda i segmenti di spill, in ordine, appena c'è posto
+        (journal scritto prima di eliminare il segmento: nessuna perdita)
+        Returns: eventi ripristinati
+        """
+        restored = 0
+        while True:
+            with self._lock:
+                count = self.spill.oldest_count()
+                if count == 0:
+                    break
+                if self.offline_queue and len(self.offline_queue) + count > Config.OFFLINE_MAX_QUEUE_SIZE:
+                    break
+                
+                segment_id, entries = self.spill.take_oldest()
+                if segment_id is None:
+                    break
+                
+                # Eventi già ripristinati prima di un crash o già acquisiti dal server
+                queued = {entry.get('event_seq') for entry in self.offline_queue}
+                entries = [entry for entry in entries
+                           if entry.get('event_seq') not in queued
+                           and not self.ack_cursor.is_acked(entry.get('event_seq'))]
+                
+                self.journal.append_many(entries)
+                self.offline_queue.extend(entries)
+                self.spill.release(segment_id)
+                restored += len(entries)
+        
+        if restored:
+            print(f"📥 Ripristinati {restored} eventi offline dallo spill su disco")
+        return restored
+    
+    def save_offline_queue(self):
+        """
+        Compatta il journal offline se ha troppi segmenti
+        Gli eventi sono già su disco al momento dell'inserimento
+        """
+        try:
+            with self._lock:
+                if self.journal.needs_compaction():
+                    self.journal.compact(list(self.offline_queue))
                 
         except Exception as e:
             print(f"⚠️ Errore salvataggio coda offline: {e}")
     
     def load_offline_queue(self):
-        """Carica la coda offline da file"""
+        """Carica la coda offline dal journal (e dal vecchio file JSON se presente)"""
         try:
-            if not os.path.exists(self.queue_file_path):
-                return
-            
-            with open(self.queue_file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            queue_data = self.journal.load()
+            self.offline_queue.extend(queue_data)
+            spilled = self.spill.load()
             
-            queue_data = data.get('queue_data', [])
+            # Migrazione dal formato precedente (offline_queue.json riscritto a ogni evento)
+            if os.path.exists(self.queue_file_path):
+                with open(self.queue_file_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                
+                legacy_items = data.get('queue_data', [])
+                for item in legacy_items:
+                    self.journal.append(item)
+                    self.offline_queue.append(item)
+                
+                os.replace(self.queue_file_path, self.queue_file_path + ".migrated")
+                queue_data += legacy_items
             
-            for item in queue_data:
-                self.offline_queue.put(item)
+            self._restore_event_sequence()
+            self._restore_from_spill()
             
             if queue_data:
                 print(f"📥 Caricati {len(queue_data)} eventi dalla coda offline persistente")
+            if spilled:
+                print(f"📥 {spilled} eventi nei segmenti di spill su disco")
                 
         except Exception as e:
             print(f"⚠️ Errore caricamento coda offline: {e}")
     
+    def _restore_event_sequence(self):
+        """
+        Allinea coda, sequenza e cursore dopo il caricamento: scarta gli eventi
+        già confermati dal server e numera quelli del formato senza sequenza
+        """
+        self.sequence.ensure_above(self.ack_cursor.acked_seq)
+        
+        with self._lock:
+            seqs = [entry['event_seq'] for entry in self.offline_queue if entry.get('event_seq')]
+            if seqs:
+                self.sequence.ensure_above(max(seqs))
+            
+            unnumbered = [entry for entry in self.offline_queue if not entry.get('event_seq')]
+            for entry in unnumbered:
+                entry['event_seq'] = self.sequence.next()
+            if unnumbered:
+                # Numeri stabili anche dopo il prossimo riavvio
+                self.journal.compact(list(self.offline_queue))
+            
+            acked = [entry for entry in self.offline_queue if self.ack_cursor.is_acked(entry['event_seq'])]
+        
+        if acked:
+            print(f"🧹 {len(acked)} eventi già confermati dal server rimossi dalla coda")
+            self._remove_from_queue(acked)
+        self._prune_ack_cursor()
+    
+    def _on_audit_ack(self, client, userdata, msg):
+        """Ack del server: audit acquisito fino a `acked_seq` (cursore persistito)"""
+        try:
+            payload = decode_payload(msg.payload)
+            gate_id = payload.get('identificativo_tornello', Config.TORNELLO_ID)
+            if gate_id != Config.TORNELLO_ID:
+                return
+            self.handle_audit_ack(int(payload['acked_seq']))
+        except Exception as e:
+            print(f"❌ Errore ack audit: {e}")
+    
+    def handle_audit_ack(self, acked_seq):
+        """
+        Conferma gli eventi inviati fino a `acked_seq` e li toglie dalla coda
+        (quelli con numero inferiore ma non ancora inviati restano da inviare)
+        Returns: numero di eventi rimossi
+        """
+        self.ack_cursor.advance(acked_seq)
+        
+        with self._lock:
+            sent = [seq for seq in self._sent_seqs if seq is not None and seq <= acked_seq]
+            self._sent_seqs.difference_update(sent)
+            self.stats['acked_seq'] = self.ack_cursor.acked_seq
+        
+        if not sent:
+            return 0
+        self.ack_cursor.mark(sent)
+        
+        with self._lock:
+            acked = [entry for entry in self.offline_queue if self.ack_cursor.is_acked(entry.get('event_seq'))]
+        
+        self._remove_from_queue(acked)
+        self._prune_ack_cursor()
+        self.stats['pending_sync'] = self.get_queue_size()
+        return len(acked)
+    
+    def _prune_ack_cursor(self):
+        """
+        Limita il cursore agli eventi ancora confermabili: sotto il più vecchio
+        in coda o inviato (gli eventi dello spill non sono mai stati inviati)
+        """
+        with self._lock:
+            pending = [entry.get('event_seq') for entry in self.offline_queue]
+            pending.extend(self._sent_seqs)
+            pending = [seq for seq in pending if seq is not None]
+            low_water = min(pending) if pending else self.ack_cursor.acked_seq + 1
+        self.ack_cursor.prune(low_water)
+    
+    def get_queue_size(self):
+        """Numero di eventi in attesa di sync (in memoria + spill su disco)"""
+        return len(self.offline_queue) + self.spill.event_count()
+    
+    def get_queue_items(self):
+        """Copia degli eventi in coda (per visualizzazione/export)"""
+        with self._lock:
+            return list(self.offline_queue)
+    
     def get_status(self):
         """Restituisce lo stato del manager offline"""
         return {
@@ -473,21 +868,25 @@ class OfflineManager:
             'online': self.is_online,
             'allow_offline_access': Config.OFFLINE_ALLOW_ACCESS,
             'sync_enabled': Config.OFFLINE_SYNC_ENABLED,
-            'queue_size': self.offline_queue.qsize(),
+            'queue_size': self.get_queue_size(),
+            'memory_queue_size': len(self.offline_queue),
+            'journal': self.journal.get_status(),
+            'spill': self.spill.get_status(),
             'stats': self.stats.copy(),
+            'whitelist': self.whitelist.get_status() if self.whitelist is not None else None,
+            'auth_breaker': self.auth_breaker.get_status() if self.auth_breaker else None,
+            'connection': self.supervisor.get_status() if self.supervisor is not None else None,
             'last_connection_check': self.last_connection_check
         }
     
     def clear_offline_queue(self):
         """Pulisce la coda offline (usa con cautela!)"""
         try:
-            # Svuota la coda
-            while not self.offline_queue.empty():
-                self.offline_queue.get_nowait()
-            
-            # Rimuovi il file
-            if os.path.exists(self.queue_file_path):
-                os.remove(self.queue_file_path)
+            # Svuota la coda e il journal
+            with self._lock:
+                self.offline_queue.clear()
+                self.journal.reset()
+                self.spill.reset()
             
             # Reset statistiche
             self.stats['pending_sync'] = 0
@@ -515,8 +914,13 @@ class OfflineManager:
             # Ferma i thread
             self.stop_monitoring_threads()
             
-            # Salva la coda finale
+            # Compatta e chiude il journal
             self.save_offline_queue()
+            self.journal.close()
+            self.spill.close()
+            
+            if self.whitelist is not None:
+                self.whitelist.close()
             
             print("🧹 Offline Manager cleanup completato")
             
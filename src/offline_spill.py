@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Segmenti di overflow della coda offline su disco
+Oltre OFFLINE_MAX_QUEUE_SIZE gli eventi non vengono più scartati: finiscono
+in segmenti compressi (limite complessivo in byte) e tornano in coda in
+ordine man mano che la sync la svuota. La memoria resta costante qualunque
+sia la durata dell'interruzione
+"""
+import gzip
+import os
+import threading
+from config import Config
+from offline_journal import OfflineJournal
+
+class OfflineSpill:
+    """
+    Segmento attivo spill-<id>.log (una riga con checksum per evento, come il
+    journal) sigillato in spill-<id>-<eventi>.jsonl.gz quando raggiunge
+    segment_events. Oltre max_bytes il segmento sigillato più vecchio viene scartato
+    """
+
+    PREFIX = "spill-"
+    ACTIVE_SUFFIX = ".log"
+    SEALED_SUFFIX = ".jsonl.gz"
+
+    def __init__(self, directory=None, max_bytes=None, segment_events=None, fsync=None):
+        self.directory = directory or os.path.join(Config.LOG_DIRECTORY, Config.OFFLINE_SPILL_DIR)
+        self.max_bytes = Config.OFFLINE_SPILL_MAX_BYTES if max_bytes is None else max_bytes
+        self.segment_events = max(1, segment_events or Config.OFFLINE_SPILL_SEGMENT_EVENTS)
+        self.fsync = Config.OFFLINE_JOURNAL_FSYNC if fsync is None else fsync
+
+        self._lock = threading.Lock()
+        self._sealed = []            # [id, eventi, byte] dal più vecchio
+        self._active_id = None
+        self._active_file = None
+        self._active_events = 0
+        self._next_id = 1
+
+        # Statistiche
+        self.stats = {
+            'spilled': 0,
+            'restored': 0,
+            'segments_sealed': 0,
+            'dropped_segments': 0,
+            'dropped_events': 0
+        }
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    # --- Apertura ---
+
+    def load(self):
+        """Rilegge i segmenti presenti (il segmento attivo torna appendibile)"""
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            self._close_active()
+            self._sealed = []
+            self._active_id = None
+            self._active_events = 0
+
+            for name in sorted(os.listdir(self.directory)):
+                if not name.startswith(self.PREFIX):
+                    continue
+                path = os.path.join(self.directory, name)
+                stem = name[len(self.PREFIX):]
+                try:
+                    if stem.endswith(self.SEALED_SUFFIX):
+                        segment_id, events = (int(part) for part in stem[:-len(self.SEALED_SUFFIX)].split('-'))
+                        self._sealed.append([segment_id, events, os.path.getsize(path)])
+                    elif stem.endswith(self.ACTIVE_SUFFIX):
+                        segment_id = int(stem[:-len(self.ACTIVE_SUFFIX)])
+                        if self._active_id is not None:
+                            self._seal_locked()  # Più segmenti attivi: crash durante la sigillatura
+                        self._active_id = segment_id
+                        self._active_events = len(self._read_active(truncate=True))
+                    else:
+                        continue
+                except ValueError:
+                    continue
+                self._next_id = max(self._next_id, segment_id + 1)
+
+            self._sealed.sort()
+            if self._active_id is not None and any(sealed[0] == self._active_id for sealed in self._sealed):
+                # Crash dopo la compressione: il .log è già nel .gz
+                self._unlink(self._active_path())
+                self._active_id = None
+                self._active_events = 0
+            return self._event_count()
+
+    # --- Scrittura ---
+
+    def append(self, entry):
+        """Aggiunge un evento in coda al segmento attivo"""
+        record = OfflineJournal._encode_record(OfflineJournal._strip(entry))
+
+        with self._lock:
+            if self._active_file is None:
+                if self._active_id is None:
+                    self._active_id = self._next_id
+                    self._next_id += 1
+                    self._active_events = 0
+                self._active_file = open(self._active_path(), 'ab')
+
+            self._active_file.write(record)
+            self._active_file.flush()
+            if self.fsync:
+                os.fsync(self._active_file.fileno())
+            self._active_events += 1
+            self.stats['spilled'] += 1
+
+            if self._active_events >= self.segment_events:
+                self._seal_locked()
+            self._enforce_limit()
+
+    def _seal_locked(self):
+        """Comprime il segmento attivo (il .gz è su disco prima della rimozione del .log)"""
+        self._close_active()
+        if self._active_id is None:
+            return
+
+        lines = self._read_active()
+        if lines:
+            path = self._sealed_path(self._active_id, len(lines))
+            tmp_path = path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(gzip.compress(b''.join(lines)))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+            self._sealed.append([self._active_id, len(lines), os.path.getsize(path)])
+            self.stats['segments_sealed'] += 1
+
+        self._unlink(self._active_path())
+        self._active_id = None
+        self._active_events = 0
+
+    def _enforce_limit(self):
+        """Oltre il limite in byte scarta i segmenti sigillati più vecchi"""
+        while len(self._sealed) > 1 and self._total_bytes() > self.max_bytes:
+            segment_id, events, _ = self._sealed.pop(0)
+            self._unlink(self._sealed_path(segment_id, events))
+            self.stats['dropped_segments'] += 1
+            self.stats['dropped_events'] += events
+            print(f"⚠️ Spill offline oltre {self.max_bytes} byte: scartati {events} eventi più vecchi")
+
+    # --- Lettura in ordine ---
+
+    def oldest_count(self):
+        """Eventi del prossimo segmento da ripristinare (0 se vuoto)"""
+        with self._lock:
+            if self._sealed:
+                return self._sealed[0][1]
+            return self._active_events
+
+    def take_oldest(self):
+        """
+        Eventi del segmento più vecchio (in ordine) e chiave per confermarne
+        la rimozione con release() dopo averli messi al sicuro altrove
+        """
+        with self._lock:
+            if not self._sealed and self._active_events:
+                self._seal_locked()
+            if not self._sealed:
+                return None, []
+
+            segment_id, events, _ = self._sealed[0]
+            with open(self._sealed_path(segment_id, events), 'rb') as f:
+                lines = gzip.decompress(f.read()).splitlines()
+
+            entries = []
+            for line in lines:
+                record = OfflineJournal._decode_line(line)
+                if record is not None:
+                    entries.append(record)
+            return segment_id, entries
+
+    def release(self, segment_id):
+        """Elimina un segmento già ripristinato"""
+        with self._lock:
+            for index, (sealed_id, events, _) in enumerate(self._sealed):
+                if sealed_id == segment_id:
+                    del self._sealed[index]
+                    self._unlink(self._sealed_path(sealed_id, events))
+                    self.stats['restored'] += events
+                    return True
+            return False
+
+    def reset(self):
+        """Elimina tutti i segmenti"""
+        with self._lock:
+            self._close_active()
+            if self._active_id is not None:
+                self._unlink(self._active_path())
+            for segment_id, events, _ in self._sealed:
+                self._unlink(self._sealed_path(segment_id, events))
+            self._sealed = []
+            self._active_id = None
+            self._active_events = 0
+
+    def close(self):
+        with self._lock:
+            self._close_active()
+
+    # --- Stato ---
+
+    def event_count(self):
+        with self._lock:
+            return self._event_count()
+
+    def is_empty(self):
+        return self.event_count() == 0
+
+    def _event_count(self):
+        return sum(events for _, events, _ in self._sealed) + self._active_events
+
+    def _total_bytes(self):
+        total = sum(size for _, _, size in self._sealed)
+        if self._active_id is not None:
+            try:
+                total += os.path.getsize(self._active_path())
+            except OSError:
+                pass
+        return total
+
+    def get_status(self):
+        """Status spill"""
+        with self._lock:
+            return {
+                'directory': self.directory,
+                'events': self._event_count(),
+                'segments': len(self._sealed) + (1 if self._active_events else 0),
+                'bytes': self._total_bytes(),
+                'max_bytes': self.max_bytes,
+                'stats': self.stats.copy()
+            }
+
+    # --- File ---
+
+    def _read_active(self, truncate=False):
+        """Righe valide del segmento attivo (una riga finale incompleta viene troncata)"""
+        path = self._active_path()
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+
+        lines = []
+        good_offset = 0
+        offset = 0
+        while offset < len(data):
+            end = data.find(b'\n', offset)
+            if end == -1:
+                break
+            line = data[offset:end + 1]
+            offset = end + 1
+            if OfflineJournal._decode_line(line[:-1]) is not None:
+                lines.append(line)
+            good_offset = offset
+
+        if truncate and good_offset < len(data):
+            with open(path, 'r+b') as f:
+                f.truncate(good_offset)
+        return lines
+
+    def _close_active(self):
+        if self._active_file is not None:
+            try:
+                self._active_file.close()
+            except Exception as e:
+                print(f"⚠️ Errore chiusura spill offline: {e}")
+            self._active_file = None
+
+    def _unlink(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _active_path(self):
+        return os.path.join(self.directory, f"{self.PREFIX}{self._active_id:08d}{self.ACTIVE_SUFFIX}")
+
+    def _sealed_path(self, segment_id, events):
+        return os.path.join(self.directory, f"{self.PREFIX}{segment_id:08d}-{events:06d}{self.SEALED_SUFFIX}")
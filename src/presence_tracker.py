@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Tracciamento presenza card per lettore
+Una card genera un solo evento per presentazione fisica: finché resta sul
+lettore (vista entro presence_timeout) non viene riautorizzata, e più card
+alternate (A, B, A) non si scavalcano il debounce a vicenda
+"""
+import threading
+import time
+from collections import OrderedDict
+from config import Config
+
+PRESENT = 'present'
+REMOVED = 'removed'
+
+class PresenceTracker:
+    """Mappa limitata UID -> (ultima vista, ultimo evento), ordinata per ultima vista"""
+
+    def __init__(self, presence_timeout=None, debounce_time=None, max_cards=None):
+        self.presence_timeout = presence_timeout if presence_timeout is not None else Config.RFID_PRESENCE_TIMEOUT
+        self.debounce_time = debounce_time if debounce_time is not None else Config.RFID_DEBOUNCE_TIME
+        self.max_cards = max_cards or Config.RFID_PRESENCE_MAX_CARDS
+
+        # card_id -> [ultima vista, ultimo evento]
+        self._cards = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Statistiche
+        self.stats = {
+            'events': 0,
+            'suppressed_present': 0,
+            'suppressed_debounce': 0,
+            'evictions': 0
+        }
+
+    def _ttl(self):
+        return max(self.presence_timeout, self.debounce_time)
+
+    def _expire(self, now):
+        """Rimuove dalla testa le card non più rilevanti (ordine per ultima vista)"""
+        ttl = self._ttl()
+        while self._cards:
+            card_id, (last_seen, _) = next(iter(self._cards.items()))
+            if now - last_seen < ttl:
+                break
+            del self._cards[card_id]
+
+    def observe(self, card_id, now=None):
+        """
+        Registra una lettura
+        Returns: True se è una nuova presentazione (evento da elaborare)
+        """
+        now = time.monotonic() if now is None else now
+
+        with self._lock:
+            self._expire(now)
+            entry = self._cards.get(card_id)
+
+            if entry is None:
+                self._cards[card_id] = [now, now]
+                if len(self._cards) > self.max_cards:
+                    self._cards.popitem(last=False)
+                    self.stats['evictions'] += 1
+                self.stats['events'] += 1
+                return True
+
+            last_seen, last_event = entry
+            entry[0] = now
+            self._cards.move_to_end(card_id)
+
+            if now - last_seen < self.presence_timeout:
+                # Ancora appoggiata: stessa presentazione
+                self.stats['suppressed_present'] += 1
+                return False
+
+            if now - last_event < self.debounce_time:
+                # Tolta e riappoggiata troppo presto
+                self.stats['suppressed_debounce'] += 1
+                return False
+
+            entry[1] = now
+            self.stats['events'] += 1
+            return True
+
+    def state(self, card_id, now=None):
+        """PRESENT se la card è stata vista entro presence_timeout, altrimenti REMOVED"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            entry = self._cards.get(card_id)
+            if entry is not None and now - entry[0] < self.presence_timeout:
+                return PRESENT
+            return REMOVED
+
+    def present_cards(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return [card_id for card_id, (last_seen, _) in self._cards.items()
+                    if now - last_seen < self.presence_timeout]
+
+    def clear(self):
+        with self._lock:
+            self._cards.clear()
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, tracked=len(self._cards))
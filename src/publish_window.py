@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Finestra scorrevole di publish QoS1 in volo
+Ogni publish viene tracciata per mid fino al PUBACK del broker (on_publish):
+al massimo `size` messaggi non confermati alla volta, e solo quelli
+confermati vengono considerati consegnati
+"""
+import threading
+import time
+from collections import OrderedDict
+
+class PublishWindow:
+    """Publish in volo per mid, confermati dai callback on_publish"""
+
+    # PUBACK anticipati ricordati: il listener riceve anche i mid di altre
+    # publish del client (badge, status), mai tracciati dalla finestra
+    EARLY_LIMIT = 16
+
+    def __init__(self, size=4):
+        self.size = max(1, size)
+        self._cond = threading.Condition()
+        self._inflight = {}             # mid -> (elemento, istante publish)
+        self._acked = []                # Elementi confermati non ancora ritirati
+        self._early = OrderedDict()     # PUBACK arrivati prima di track(), i più recenti
+
+        # Statistiche
+        self.stats = {
+            'published': 0,
+            'acked': 0,
+            'abandoned': 0
+        }
+
+    def on_publish(self, mid):
+        """Callback on_publish (thread di rete paho)"""
+        with self._cond:
+            entry = self._inflight.pop(mid, None)
+            if entry is None:
+                self._early[mid] = None
+                if len(self._early) > self.EARLY_LIMIT:
+                    self._early.popitem(last=False)
+            else:
+                self._acked.append(entry[0])
+                self.stats['acked'] += 1
+            self._cond.notify_all()
+
+    def track(self, mid, item):
+        """Registra una publish appena inviata"""
+        with self._cond:
+            self.stats['published'] += 1
+            if mid in self._early:
+                del self._early[mid]
+                self._acked.append(item)
+                self.stats['acked'] += 1
+            else:
+                self._inflight[mid] = (item, time.monotonic())
+            self._cond.notify_all()
+
+    def wait_slot(self, timeout):
+        """Attende un posto libero nella finestra (False allo scadere)"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while len(self._inflight) >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def wait_all(self, timeout):
+        """Attende la conferma di tutte le publish in volo"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._inflight:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def take_acked(self):
+        """Elementi confermati dall'ultima chiamata"""
+        with self._cond:
+            acked, self._acked = self._acked, []
+            return acked
+
+    def abandon(self):
+        """Rinuncia alle publish non confermate (restano da reinviare)"""
+        with self._cond:
+            items = [item for item, _ in self._inflight.values()]
+            self._inflight.clear()
+            self._early.clear()
+            self.stats['abandoned'] += len(items)
+            return items
+
+    def in_flight(self):
+        with self._cond:
+            return len(self._inflight)
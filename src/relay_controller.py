@@ -2,16 +2,23 @@
 """
 Controller relè - Versione semplice che funziona
 """
-import RPi.GPIO as GPIO
 import time
 import threading
 import atexit
 from config import Config
+from hardware import GPIO
+from relay_scheduler import RelayScheduler
+from metrics import registry, DURATION_BUCKETS
+
+RELAY_ACTIVATIONS = registry.counter('relay_activations_total', 'Attivazioni relè', ('relay',))
+RELAY_ON_SECONDS = registry.histogram('relay_on_seconds', 'Tempo effettivo di relè acceso', ('relay',),
+                                      buckets=DURATION_BUCKETS)
 
 class RelayController:
     """Gestione singolo relè - versione semplice"""
     
-    def __init__(self, relay_id="default", gpio_pin=None, active_time=None, active_low=None, initial_state=None):
+    def __init__(self, relay_id="default", gpio_pin=None, active_time=None, active_low=None, initial_state=None,
+                 scheduler=None):
         self.relay_id = relay_id
         self.gpio_pin = gpio_pin or Config.RELAY_IN_PIN
         self.active_time = active_time or Config.RELAY_IN_ACTIVE_TIME
@@ -20,7 +27,16 @@ class RelayController:
         self.is_initialized = False
         self.is_active = False
         self._lock = threading.Lock()
-        self._current_thread = None
+        self._generation = 0          # Incrementata a ogni nuova attivazione/spegnimento
+        self.off_deadline = None      # Spegnimento programmato (time.monotonic())
+        self.on_since = None          # Accensione corrente (time.monotonic())
+        self._release_callbacks = []  # Chiamati allo spegnimento con l'istante monotono
+        self._activations_metric = RELAY_ACTIVATIONS.labels(relay_id)
+        self._on_time_metric = RELAY_ON_SECONDS.labels(relay_id)
+        
+        # Scheduler condiviso dal RelayManager (o proprio se usato da solo)
+        self._owns_scheduler = scheduler is None
+        self.scheduler = scheduler or RelayScheduler(name=f"RelayScheduler-{relay_id}")
         
         # Registra cleanup semplice
         atexit.register(self._simple_cleanup)
@@ -64,65 +80,87 @@ class RelayController:
             print(f"Errore init relè {self.relay_id}: {e}")
             return False
     
-    def activate(self, duration=None):
-        """Attiva relè"""
+    def activate(self, duration=None, on_release=None):
+        """
+        Attiva relè (una riattivazione prolunga il timer corrente)
+        on_release: callback(off_at) chiamata quando il relè si spegne
+        """
         if not self.is_initialized:
             return False
         
         duration = duration or self.active_time
         
         with self._lock:
-            # Interrompi thread precedente
-            if self.is_active and self._current_thread:
-                self._current_thread = None
-            
-            self.is_active = True
-            
-            # Nuovo thread
-            thread = threading.Thread(
-                target=self._activation_worker, 
-                args=(duration,),
-                daemon=False
-            )
-            self._current_thread = thread
-            thread.start()
+            deadline = time.monotonic() + duration
             
+            if self.is_active:
+                # Timer già programmato: sposta solo la scadenza in avanti
+                if deadline > self.off_deadline:
+                    self.off_deadline = deadline
+            else:
+                self._generation += 1
+                self.off_deadline = deadline
+                self._set_relay_state(True)
+                self.is_active = True
+                self.on_since = time.monotonic()
+                self.scheduler.schedule(deadline, self._deactivate, self._generation)
+            self._activations_metric.inc()
+            if on_release is not None:
+                self._release_callbacks.append(on_release)
+        
+        print(f"Relè {self.relay_id}: ON per {duration}s")
         return True
     
-    def _activation_worker(self, duration):
-        """Worker thread per attivazione"""
-        current_thread = threading.current_thread()
-        
+    def _deactivate(self, generation):
+        """Callback scheduler: spegne alla scadenza (riprogramma se prolungata)"""
         try:
-            # Attiva
-            self._set_relay_state(True)
-            print(f"Relè {self.relay_id}: ON per {duration}s")
-            
-            # Aspetta con controllo interruzione
-            elapsed = 0
-            while elapsed < duration:
-                with self._lock:
-                    if self._current_thread != current_thread:
-                        return
-                
-                sleep_time = min(0.1, duration - elapsed)
-                time.sleep(sleep_time)
-                elapsed += sleep_time
-            
-            # Disattiva
             with self._lock:
-                if self._current_thread == current_thread:
-                    self._set_relay_state(False)
-                    self.is_active = False
-                    self._current_thread = None
-                    print(f"Relè {self.relay_id}: OFF")
+                if generation != self._generation or not self.is_active:
+                    return False
+                
+                if self.off_deadline > time.monotonic():
+                    self.scheduler.schedule(self.off_deadline, self._deactivate, generation)
+                    return False
                 
+                self._set_relay_state(False)
+                self.is_active = False
+                self.off_deadline = None
+                self._record_on_time()
+                callbacks = self._take_release_callbacks()
+            
+            self._notify_release(callbacks)
+            print(f"Relè {self.relay_id}: OFF")
+            return True
+            
         except Exception as e:
-            print(f"Errore thread relè {self.relay_id}: {e}")
+            print(f"Errore timer relè {self.relay_id}: {e}")
             self._set_relay_state(False)
             with self._lock:
                 self.is_active = False
-                self._current_thread = None
+                self.off_deadline = None
+                callbacks = self._take_release_callbacks()
+            self._notify_release(callbacks)
+            return True
+    
+    def _take_release_callbacks(self):
+        """Callback di spegnimento in attesa (chiamare con il lock)"""
+        callbacks, self._release_callbacks = self._release_callbacks, []
+        return callbacks
+    
+    def _notify_release(self, callbacks):
+        """Notifica lo spegnimento fuori dal lock"""
+        off_at = time.monotonic()
+        for callback in callbacks:
+            try:
+                callback(off_at)
+            except Exception as e:
+                print(f"⚠️ Errore callback spegnimento relè {self.relay_id}: {e}")
+    
+    def _record_on_time(self):
+        """Durata dell'accensione appena terminata (chiamare con il lock)"""
+        if self.on_since is not None:
+            self._on_time_metric.observe(time.monotonic() - self.on_since)
+            self.on_since = None
     
     def _set_relay_state(self, active):
         """Imposta stato GPIO"""
@@ -142,7 +180,11 @@ class RelayController:
         try:
             with self._lock:
                 self.is_active = False
-                self._current_thread = None
+                self.off_deadline = None
+                self._generation += 1
+                self._record_on_time()
+                callbacks = self._take_release_callbacks()
+            self._notify_release(callbacks)
             
             if self.is_initialized:
                 # Livello per spegnere basato su active_low
@@ -183,17 +225,16 @@ class RelayController:
             'active': self.is_active,
             'pin': self.gpio_pin,
             'active_low': self.active_low,
-            'duration': self.active_time
+            'duration': self.active_time,
+            'off_in_ms': round(max(0.0, self.off_deadline - time.monotonic()) * 1000) if self.off_deadline else None
         }
     
     def cleanup(self):
         """Cleanup"""
         try:
-            with self._lock:
-                self.is_active = False
-                self._current_thread = None
-            
             self.force_off()
+            if self._owns_scheduler:
+                self.scheduler.stop()
             print(f"Cleanup relè {self.relay_id} completato")
             
         except Exception as e:
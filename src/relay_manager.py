@@ -4,9 +4,10 @@ Manager relè semplice
 """
 import threading
 import atexit
-import RPi.GPIO as GPIO
 from config import Config
+from hardware import GPIO
 from relay_controller import RelayController
+from relay_scheduler import RelayScheduler
 
 class RelayManager:
     """Manager semplice per relè multipli"""
@@ -14,8 +15,16 @@ class RelayManager:
     def __init__(self):
         self.relays = {}
         self.is_initialized = False
+        
+        # Instradamento per corsia: (corsia, direzione) -> relè, corsia -> primo relè
+        self.routes = {}
+        self.lane_relays = {}
+        self.definitions = {}
         self._lock = threading.Lock()
         
+        # Un solo thread timer per tutti i relè
+        self.scheduler = RelayScheduler()
+        
         # Cleanup automatico
         atexit.register(self._cleanup_all)
     
@@ -23,11 +32,8 @@ class RelayManager:
         """Cleanup automatico all'uscita"""
         try:
             # Spegni pin conosciuti
-            pins_to_clean = []
-            if Config.RELAY_IN_ENABLE:
-                pins_to_clean.append(Config.RELAY_IN_PIN)
-            if Config.RELAY_OUT_ENABLE:
-                pins_to_clean.append(Config.RELAY_OUT_PIN)
+            pins_to_clean = [relay['pin'] for relay in Config.get_relay_definitions()
+                             if relay['pin'] is not None]
             
             GPIO.setmode(GPIO.BCM)
             for pin in pins_to_clean:
@@ -47,46 +53,34 @@ class RelayManager:
         try:
             print("⚡ Inizializzazione Relay Manager...")
             
-            # Relè IN
-            if Config.RELAY_IN_ENABLE:
-                print(f"🔵 Relè IN (GPIO {Config.RELAY_IN_PIN})")
-                relay_in = RelayController(
-                    relay_id="in",
-                    gpio_pin=Config.RELAY_IN_PIN,
-                    active_time=Config.RELAY_IN_ACTIVE_TIME,
-                    active_low=Config.RELAY_IN_ACTIVE_LOW,
-                    initial_state=Config.RELAY_IN_INITIAL_STATE
+            for definition in Config.get_relay_definitions():
+                relay_id = definition['id']
+                print(f"⚡ Relè {relay_id.upper()} (GPIO {definition['pin']}, "
+                      f"{definition['direction'].upper()}, corsia {definition['lane']})")
+                relay = RelayController(
+                    relay_id=relay_id,
+                    gpio_pin=definition['pin'],
+                    active_time=definition['active_time'],
+                    active_low=definition['active_low'],
+                    initial_state=definition['initial_state'],
+                    scheduler=self.scheduler
                 )
                 
-                if relay_in.initialize():
-                    self.relays["in"] = relay_in
-                    print("✅ Relè IN OK")
-                else:
-                    print("❌ Relè IN fallito")
+                if not relay.initialize():
+                    print(f"❌ Relè {relay_id.upper()} fallito")
                     return False
-            
-            # Relè OUT
-            if Config.BIDIRECTIONAL_MODE and Config.RELAY_OUT_ENABLE:
-                print(f"🔴 Relè OUT (GPIO {Config.RELAY_OUT_PIN})")
-                relay_out = RelayController(
-                    relay_id="out",
-                    gpio_pin=Config.RELAY_OUT_PIN,
-                    active_time=Config.RELAY_OUT_ACTIVE_TIME,
-                    active_low=Config.RELAY_OUT_ACTIVE_LOW,
-                    initial_state=Config.RELAY_OUT_INITIAL_STATE
-                )
                 
-                if relay_out.initialize():
-                    self.relays["out"] = relay_out
-                    print("✅ Relè OUT OK")
-                else:
-                    print("❌ Relè OUT fallito")
-                    return False
+                self.relays[relay_id] = relay
+                self.definitions[relay_id] = definition
+                self.routes.setdefault((definition['lane'], definition['direction']), relay_id)
+                self.lane_relays.setdefault(definition['lane'], relay_id)
+                print(f"✅ Relè {relay_id.upper()} OK")
             
             if not self.relays:
                 print("❌ Nessun relè configurato")
                 return False
             
+            self.scheduler.start()
             self.is_initialized = True
             print(f"✅ RelayManager: {len(self.relays)} relè attivi")
             return True
@@ -95,15 +89,26 @@ class RelayManager:
             print(f"❌ Errore RelayManager: {e}")
             return False
     
-    def activate_relay(self, direction, duration=None):
-        """Attiva relè"""
+    def route(self, lane, direction):
+        """
+        Relè da attivare per una card: stessa corsia e direzione, altrimenti
+        il primo relè della corsia (mai un relè di un'altra corsia)
+        Returns: ID relè o None
+        """
+        relay_id = self.routes.get((lane, direction))
+        if relay_id is None:
+            relay_id = self.lane_relays.get(lane)
+        return relay_id
+    
+    def activate_relay(self, direction, duration=None, on_release=None):
+        """Attiva relè (on_release: callback(off_at) allo spegnimento)"""
         with self._lock:
             if direction not in self.relays:
                 print(f"❌ Relè {direction.upper()} non configurato")
                 return False
             
             relay = self.relays[direction]
-            result = relay.activate(duration)
+            result = relay.activate(duration, on_release=on_release)
             
             if result:
                 print(f"⚡ Relè {direction.upper()}: attivato")
@@ -126,9 +131,7 @@ class RelayManager:
     def get_relay_status(self, direction):
         """Status relè specifico"""
         if direction in self.relays:
-            status = self.relays[direction].get_status()
-            status['direction'] = direction
-            return status
+            return self._relay_status(direction)
         return None
     
     def get_all_status(self):
@@ -136,16 +139,22 @@ class RelayManager:
         status = {
             'initialized': self.is_initialized,
             'active_relays': len(self.relays),
+            'scheduler': self.scheduler.get_status(),
             'relays': {}
         }
         
-        for direction, relay in self.relays.items():
-            relay_status = relay.get_status()
-            relay_status['direction'] = direction
-            status['relays'][direction] = relay_status
+        for relay_id in self.relays:
+            status['relays'][relay_id] = self._relay_status(relay_id)
         
         return status
     
+    def _relay_status(self, relay_id):
+        status = self.relays[relay_id].get_status()
+        definition = self.definitions.get(relay_id, {})
+        status['direction'] = definition.get('direction', relay_id)
+        status['lane'] = definition.get('lane', Config.DEFAULT_LANE)
+        return status
+    
     def is_relay_active(self, direction):
         """Controlla se relè attivo"""
         if direction in self.relays:
@@ -164,6 +173,7 @@ class RelayManager:
             # Pulisci ogni relè
             for direction, relay in self.relays.items():
                 relay.cleanup()
+            self.scheduler.stop()
             
             # Cleanup GPIO finale
             try:
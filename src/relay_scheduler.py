@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Scheduler timer relè
+Un solo thread per RelayManager con un heap di scadenze: attivare un relè
+costa un inserimento nell'heap invece della creazione di un thread
+"""
+import heapq
+import itertools
+import threading
+import time
+
+class RelayScheduler:
+    """Heap di (scadenza, ordine, callback, generazione) servito da un thread"""
+
+    def __init__(self, name="RelayScheduler"):
+        self.name = name
+        self._heap = []
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+        # Statistiche
+        self.stats = {
+            'scheduled': 0,
+            'fired': 0,
+            'skipped': 0,
+            'max_lateness_ms': 0.0
+        }
+
+    def start(self):
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, daemon=True, name=self.name)
+            self._thread.start()
+
+    def stop(self):
+        with self._condition:
+            self._running = False
+            self._heap.clear()
+            self._condition.notify()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=1)
+        self._thread = None
+
+    def schedule(self, deadline, callback, generation):
+        """
+        Programma callback(generation) alla scadenza (time.monotonic())
+        Le voci superate da una riattivazione vengono scartate dal callback stesso
+        """
+        if not self._running:
+            self.start()
+
+        with self._condition:
+            entry = (deadline, next(self._order), callback, generation)
+            heapq.heappush(self._heap, entry)
+            self.stats['scheduled'] += 1
+            # Sveglia il thread solo se la nuova scadenza è la più vicina
+            if self._heap[0] is entry:
+                self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._condition.wait(timeout)
+
+                if not self._running:
+                    return
+
+                deadline, _, callback, generation = heapq.heappop(self._heap)
+
+            lateness_ms = (time.monotonic() - deadline) * 1000
+            try:
+                if callback(generation):
+                    self.stats['fired'] += 1
+                    if lateness_ms > self.stats['max_lateness_ms']:
+                        self.stats['max_lateness_ms'] = round(lateness_ms, 3)
+                else:
+                    self.stats['skipped'] += 1
+            except Exception as e:
+                print(f"⚠️ Errore timer relè: {e}")
+
+    def pending(self):
+        with self._condition:
+            return len(self._heap)
+
+    def get_status(self):
+        """Status scheduler"""
+        return {
+            'running': self._running,
+            'pending': self.pending(),
+            'stats': self.stats.copy()
+        }
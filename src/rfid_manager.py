@@ -8,6 +8,11 @@ import time
 from queue import Queue, Empty
 from config import Config
 from rfid_reader import RFIDReader
+from metrics import registry
+from access_trace import AccessTrace, ENQUEUED, DEQUEUED
+from event_sequence import get_event_sequence
+
+CARD_QUEUE_DEPTH = registry.gauge('card_queue_depth', 'Card lette in attesa di decisione')
 
 class RFIDManager:
     """Classe per gestire lettori RFID multipli"""
@@ -16,53 +21,41 @@ class RFIDManager:
         self.readers = {}
         self.reader_threads = {}
         self.card_queue = Queue()
+        self.reader_queues = {}  # Code separate per lettore (modalità pipeline)
+        self.pipeline_mode = Config.PIPELINE_MODE
         self.running = False
         self.is_initialized = False
+        
+        CARD_QUEUE_DEPTH.set_function(self.pending_cards)
     
     def initialize(self):
-        """Inizializza i lettori RFID attivi"""
+        """Inizializza i lettori RFID configurati"""
         try:
             print("📖 Inizializzazione RFID Manager...")
             
-            # Inizializza lettore IN se abilitato
-            if Config.RFID_IN_ENABLE:
-                print(f"🔵 Configurazione RFID Reader IN (RST: {Config.RFID_IN_RST_PIN}, SDA: {Config.RFID_IN_SDA_PIN})")
-                reader_in = RFIDReader(
-                    reader_id="in",
-                    rst_pin=Config.RFID_IN_RST_PIN,
-                    sda_pin=Config.RFID_IN_SDA_PIN
+            for definition in Config.get_reader_definitions():
+                reader_id = definition['id']
+                print(f"📡 Configurazione RFID Reader {reader_id.upper()} "
+                      f"({definition['direction'].upper()}, corsia {definition['lane']}, "
+                      f"RST: {definition['rst_pin']}, SDA: {definition['sda_pin']})")
+                reader = RFIDReader(
+                    reader_id=reader_id,
+                    rst_pin=definition['rst_pin'],
+                    sda_pin=definition['sda_pin'],
+                    direction=definition['direction'],
+                    lane=definition['lane'],
+                    irq_pin=definition['irq_pin']
                 )
                 
-                if reader_in.initialize():
-                    if reader_in.test_connection():
-                        self.readers["in"] = reader_in
-                        print("✅ RFID Reader IN inizializzato correttamente")
-                    else:
-                        print("❌ Test connessione RFID IN fallito")
-                        return False
-                else:
-                    print("❌ Inizializzazione RFID IN fallita")
+                if not reader.initialize():
+                    print(f"❌ Inizializzazione RFID {reader_id.upper()} fallita")
                     return False
-            
-            # Inizializza lettore OUT se abilitato e in modalità bidirezionale
-            if Config.BIDIRECTIONAL_MODE and Config.RFID_OUT_ENABLE:
-                print(f"🔴 Configurazione RFID Reader OUT (RST: {Config.RFID_OUT_RST_PIN}, SDA: {Config.RFID_OUT_SDA_PIN})")
-                reader_out = RFIDReader(
-                    reader_id="out",
-                    rst_pin=Config.RFID_OUT_RST_PIN,
-                    sda_pin=Config.RFID_OUT_SDA_PIN
-                )
-                
-                if reader_out.initialize():
-                    if reader_out.test_connection():
-                        self.readers["out"] = reader_out
-                        print("✅ RFID Reader OUT inizializzato correttamente")
-                    else:
-                        print("❌ Test connessione RFID OUT fallito")
-                        return False
-                else:
-                    print("❌ Inizializzazione RFID OUT fallita")
+                if not reader.test_connection():
+                    print(f"❌ Test connessione RFID {reader_id.upper()} fallito")
                     return False
+                
+                self.readers[reader_id] = reader
+                print(f"✅ RFID Reader {reader_id.upper()} inizializzato correttamente")
             
             if not self.readers:
                 print("❌ Nessun lettore RFID configurato")
@@ -86,16 +79,19 @@ class RFIDManager:
             self.running = True
             
             # Avvia un thread per ogni lettore
-            for direction, reader in self.readers.items():
+            for reader_id, reader in self.readers.items():
+                if self.pipeline_mode:
+                    self.reader_queues.setdefault(reader_id, Queue())
+                
                 thread = threading.Thread(
                     target=self._reader_thread,
-                    args=(direction, reader),
+                    args=(reader_id, reader),
                     daemon=True,
-                    name=f"RFID-{direction.upper()}"
+                    name=f"RFID-{reader_id.upper()}"
                 )
                 thread.start()
-                self.reader_threads[direction] = thread
-                print(f"🚀 Thread RFID {direction.upper()} avviato")
+                self.reader_threads[reader_id] = thread
+                print(f"🚀 Thread RFID {reader_id.upper()} avviato")
             
             print(f"✅ Tutti i thread di lettura RFID avviati")
             return True
@@ -110,55 +106,76 @@ class RFIDManager:
         self.running = False
         
         # Aspetta che tutti i thread terminino
-        for direction, thread in self.reader_threads.items():
+        for reader_id, thread in self.reader_threads.items():
             thread.join(timeout=2)
-            print(f"🔴 Thread RFID {direction.upper()} terminato")
+            print(f"🔴 Thread RFID {reader_id.upper()} terminato")
         
         self.reader_threads.clear()
     
-    def _reader_thread(self, direction, reader):
+    def _reader_thread(self, reader_id, reader):
         """Thread di lettura per un singolo lettore RFID"""
-        print(f"📡 Thread RFID {direction.upper()} in ascolto...")
+        print(f"📡 Thread RFID {reader_id.upper()} in ascolto...")
         
         while self.running:
             try:
-                # Legge una card (operazione bloccante)
+                # Legge una card: bus/IRQ e simulatore attendono la card fino al
+                # proprio timeout, SimpleMFRC522 risponde subito se la card è appoggiata
                 card_id, card_data = reader.read_card()
                 
                 if card_id is not None:
+                    trace = AccessTrace()
+                    
                     # Ottiene le informazioni complete della card
                     card_info = reader.get_card_info(card_id, card_data)
                     
-                    # Aggiunge la direzione alle informazioni
-                    card_info['direction'] = direction
-                    card_info['reader_id'] = reader.reader_id
-                    card_info['timestamp'] = time.time()
+                    # Aggiunge direzione e corsia (instradamento verso il relè)
+                    card_info.direction = reader.direction
+                    card_info.lane = reader.lane
+                    card_info.reader_id = reader_id
+                    card_info.timestamp = time.time()
+                    card_info.event_seq = get_event_sequence().next()  # Identità stabile dell'evento
+                    card_info.trace = trace
                     
-                    # Mette la card nella coda
-                    self.card_queue.put(card_info)
+                    # Mette la card nella coda (del lettore in modalità pipeline)
+                    trace.mark(ENQUEUED)
+                    self._queue_for(reader_id).put(card_info)
                     
-                    print(f"📱 Card rilevata su lettore {direction.upper()}: {card_info['uid_formatted']}")
+                    print(f"📱 Card rilevata su lettore {reader_id.upper()}: {card_info.uid_formatted}")
                 
-                # Breve pausa per evitare letture duplicate
-                time.sleep(0.1)
+                # Breve pausa per evitare letture duplicate (lettori che non attendono)
+                if not reader.waits_for_card:
+                    time.sleep(0.1)
                 
             except Exception as e:
                 if self.running:  # Solo se non stiamo fermando il sistema
-                    print(f"⚠️ Errore nel thread RFID {direction.upper()}: {e}")
+                    print(f"⚠️ Errore nel thread RFID {reader_id.upper()}: {e}")
                     time.sleep(1)
     
-    def get_next_card(self, timeout=None):
+    def _queue_for(self, reader_id):
+        """Coda di destinazione per un lettore"""
+        if self.pipeline_mode:
+            return self.reader_queues.get(reader_id, self.card_queue)
+        return self.card_queue
+    
+    def get_next_card(self, timeout=None, reader_id=None):
         """
         Ottiene la prossima card dalla coda
         Args:
             timeout (float): Timeout in secondi (None = blocca indefinitamente)
+            reader_id (str): Lettore da servire (solo modalità pipeline)
         Returns:
             dict: Informazioni della card o None se timeout
         """
+        queue = self._queue_for(reader_id) if reader_id else self.card_queue
         try:
-            return self.card_queue.get(block=True, timeout=timeout)
+            card_info = queue.get(block=True, timeout=timeout)
         except Empty:
             return None
+        
+        trace = card_info.get('trace')
+        if trace is not None:
+            trace.mark(DEQUEUED)
+        return card_info
     
     def wait_for_card(self):
         """
@@ -168,9 +185,15 @@ class RFIDManager:
         """
         return self.get_next_card()
     
+    def pending_cards(self):
+        """Numero di card in coda (tutte le code)"""
+        return self.card_queue.qsize() + sum(q.qsize() for q in list(self.reader_queues.values()))
+    
     def has_pending_cards(self):
         """Controlla se ci sono card in attesa nella coda"""
-        return not self.card_queue.empty()
+        if not self.card_queue.empty():
+            return True
+        return any(not q.empty() for q in self.reader_queues.values())
     
     def get_active_readers(self):
         """Restituisce la lista dei lettori attivi"""
@@ -182,14 +205,18 @@ class RFIDManager:
             'initialized': self.is_initialized,
             'running': self.running,
             'active_readers': len(self.readers),
+            'pipeline_mode': self.pipeline_mode,
             'readers': {}
         }
         
-        for direction, reader in self.readers.items():
-            status['readers'][direction] = {
+        for reader_id, reader in self.readers.items():
+            status['readers'][reader_id] = {
                 'reader_id': reader.reader_id,
+                'direction': reader.direction,
+                'lane': reader.lane,
                 'initialized': reader.is_initialized,
-                'thread_running': direction in self.reader_threads
+                'thread_running': reader_id in self.reader_threads,
+                'presence': reader.presence.get_stats()
             }
         
         return status
@@ -201,9 +228,9 @@ class RFIDManager:
             self.stop_reading()
             
             # Pulisce i lettori
-            for direction, reader in self.readers.items():
+            for reader_id, reader in self.readers.items():
                 reader.cleanup()
-                print(f"🧹 Lettore RFID {direction.upper()} pulito")
+                print(f"🧹 Lettore RFID {reader_id.upper()} pulito")
             
             self.readers.clear()
             print("🧹 RFID Manager cleanup completato")
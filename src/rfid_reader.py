@@ -1,32 +1,56 @@
 #!/usr/bin/env python3
 """
-Lettore RFID con debounce per evitare letture multiple
+Lettore RFID con tracciamento presenza per evitare letture multiple
 """
-import RPi.GPIO as GPIO
-from mfrc522 import SimpleMFRC522
 import time
 from config import Config
+from hardware import GPIO, create_card_reader, probe_card_reader
+from presence_tracker import PresenceTracker
+from metrics import registry
+from card_event import CardEvent
+
+CARD_READS = registry.counter('rfid_reads_total', 'Letture UID dal lettore (incluse quelle duplicate)', ('reader',))
+CARD_EVENTS = registry.counter('rfid_card_events_total', 'Presentazioni card elaborate', ('reader',))
 
 class RFIDReader:
-    """Lettore RFID con debounce"""
+    """Lettore RFID con tracciamento presenza (un evento per presentazione)"""
     
-    def __init__(self, reader_id="default", rst_pin=None, sda_pin=None):
+    def __init__(self, reader_id="default", rst_pin=None, sda_pin=None, direction=None, lane=None,
+                 irq_pin=None):
         self.reader_id = reader_id
+        self.irq_pin = irq_pin
+        self.direction = direction or reader_id
+        self.lane = lane or Config.DEFAULT_LANE
         self.rst_pin = rst_pin or Config.RFID_IN_RST_PIN
         self.sda_pin = sda_pin or Config.RFID_IN_SDA_PIN
         self.reader = None
         self.is_initialized = False
         
-        # Debounce per evitare letture multiple
+        # Presenza per UID: card appoggiata o alternata non genera eventi duplicati
+        self.presence = PresenceTracker()
+        self._reads_metric = CARD_READS.labels(reader_id)
+        self._events_metric = CARD_EVENTS.labels(reader_id)
         self.last_card_id = None
         self.last_read_time = 0
-        self.debounce_time = Config.RFID_DEBOUNCE_TIME
+    
+    @property
+    def debounce_time(self):
+        return self.presence.debounce_time
+    
+    @debounce_time.setter
+    def debounce_time(self, value):
+        self.presence.debounce_time = value
+    
+    @property
+    def waits_for_card(self):
+        """True se read() attende la card (bus/IRQ, simulatore); SimpleMFRC522 risponde subito con la card appoggiata"""
+        return getattr(self.reader, 'waits_for_card', False)
     
     def initialize(self):
         """Inizializza lettore"""
         try:
             GPIO.setmode(GPIO.BCM)
-            self.reader = SimpleMFRC522()
+            self.reader = create_card_reader(self.reader_id, self.rst_pin, self.sda_pin, irq_pin=self.irq_pin)
             self.is_initialized = True
             return True
         except Exception as e:
@@ -34,27 +58,28 @@ class RFIDReader:
             return False
     
     def read_card(self):
-        """Legge card con debounce"""
+        """Legge card: None se la stessa presentazione è già stata segnalata"""
         if not self.is_initialized:
             return None, None
         
         try:
             card_id, card_data = self.reader.read()
-            current_time = time.time()
+            if card_id is None:
+                return None, None
             
-            # Debounce: ignora se stessa card letta di recente
-            if (card_id == self.last_card_id and 
-                (current_time - self.last_read_time) < self.debounce_time):
-                return None, None  # Ignora lettura duplicata
+            self._reads_metric.inc()
+            if not self.presence.observe(card_id):
+                return None, None  # Card ancora presente o riappoggiata nel debounce
             
-            # Aggiorna debounce
             self.last_card_id = card_id
-            self.last_read_time = current_time
+            self.last_read_time = time.time()
+            self._events_metric.inc()
             
             return card_id, card_data
             
         except Exception as e:
             print(f"Errore lettura RFID {self.reader_id}: {e}")
+            time.sleep(0.1)  # Evita un ciclo stretto se il lettore continua a fallire
             return None, None
     
     def format_card_uid(self, card_id):
@@ -105,23 +130,21 @@ class RFIDReader:
             return str(card_id)
     
     def get_card_info(self, card_id, card_data):
-        """Info complete card"""
-        return {
-            'raw_id': card_id,
-            'uid_formatted': self.format_card_uid(card_id),
-            'uid_hex': hex(card_id) if card_id else None,
-            'data': card_data.strip() if card_data else None,
-            'data_length': len(card_data) if card_data else 0
-        }
+        """Info complete card (evento che attraversa tutto il percorso del tap)"""
+        return CardEvent(
+            raw_id=card_id,
+            uid_formatted=self.format_card_uid(card_id),
+            uid_hex=hex(card_id) if card_id else None,
+            data=card_data.strip() if card_data else None,
+            data_length=len(card_data) if card_data else 0
+        )
     
     def test_connection(self):
         """Test connessione modulo"""
         if not self.is_initialized:
             return False
         try:
-            test_reader = SimpleMFRC522()
-            del test_reader
-            return True
+            return probe_card_reader(self.reader_id, self.rst_pin, self.sda_pin, reader=self.reader)
         except Exception as e:
             print(f"Test RFID {self.reader_id} fallito: {e}")
             return False
@@ -130,6 +153,9 @@ class RFIDReader:
         """Cleanup"""
         try:
             if self.is_initialized:
+                # Il driver nativo tiene aperto il device spidev
+                if hasattr(self.reader, 'close'):
+                    self.reader.close()
                 GPIO.cleanup()
         except:
             pass
\ No newline at end of file
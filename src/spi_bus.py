@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Proprietario del bus SPI per più lettori MFRC522
+Un solo thread per bus interroga i lettori a turno (round robin con quote),
+ognuno con il proprio chip select e la propria linea di reset: i trasferimenti
+non si sovrappongono mai e aggiungere un lettore non rallenta gli altri
+I lettori con linea IRQ cablata non vengono interrogati: il bus li arma con
+un REQA e dorme finché il fronte GPIO non segnala la risposta di una card
+"""
+import threading
+import time
+from queue import Queue, Empty, Full
+from mfrc522_driver import uid_to_num
+
+# Chip select hardware del kernel per pin SDA (BCM): CE0 = GPIO8, CE1 = GPIO7
+HARDWARE_CS_DEVICES = {8: 0, 7: 1}
+
+def parse_poll_quotas(value, default=1):
+    """
+    Quote di polling per lettore
+    '2' -> tutti 2; 'in:3,out:1' -> per lettore (gli altri usano default)
+    Returns: (quota predefinita, {reader_id: quota})
+    """
+    quotas = {}
+    value = (value or '').strip()
+    if not value:
+        return default, quotas
+
+    if ':' not in value:
+        return max(1, int(value)), quotas
+
+    for item in value.split(','):
+        if ':' not in item:
+            continue
+        reader_id, quota = item.split(':', 1)
+        quotas[reader_id.strip()] = max(1, int(quota))
+    return default, quotas
+
+class SPIChannel:
+    """Vista di un singolo lettore sul bus: seleziona il chip e serializza i trasferimenti"""
+
+    def __init__(self, bus, spi, cs_pin=None):
+        self._bus = bus
+        self._spi = spi
+        self.cs_pin = cs_pin
+
+    def xfer2(self, data):
+        with self._bus.lock:
+            if self.cs_pin is None:
+                return self._spi.xfer2(data)
+
+            gpio = self._bus.gpio
+            gpio.output(self.cs_pin, gpio.LOW)
+            try:
+                return self._spi.xfer2(data)
+            finally:
+                gpio.output(self.cs_pin, gpio.HIGH)
+
+    def close(self):
+        # I device spidev appartengono al bus
+        pass
+
+class BusCardReader:
+    """Lettore con interfaccia read()/read_id() alimentato dal thread del bus"""
+
+    waits_for_card = True  # read() attende la card fino al timeout
+
+    def __init__(self, bus, reader_id, driver, quota=1, timeout=0.5, irq_pin=None):
+        self._bus = bus
+        self.reader_id = reader_id
+        self.driver = driver
+        self.quota = quota
+        self.timeout = timeout
+        self.irq_pin = irq_pin
+        self.armed_at = None
+        self.cards = Queue(maxsize=8)
+
+        # Statistiche
+        self.stats = {
+            'polls': 0,
+            'arms': 0,
+            'irq_wakeups': 0,
+            'detections': 0,
+            'dropped': 0
+        }
+
+    def read(self):
+        """Prossima card rilevata dal bus: (card_id, testo) oppure (None, None)"""
+        self._bus.start()
+        try:
+            return self.cards.get(timeout=self.timeout)
+        except Empty:
+            return None, None
+
+    def read_id(self):
+        card_id, _ = self.read()
+        return card_id
+
+    def version(self):
+        return self.driver.version()
+
+    def close(self):
+        self._bus.detach(self.reader_id)
+
+class SPIBus:
+    """
+    Bus SPI condiviso: un thread, un turno per lettore
+    Ogni turno esegue fino a 'quota' tentativi REQA; una card rilevata chiude
+    il turno così una card appoggiata non monopolizza il bus
+    """
+
+    def __init__(self, bus_number=0, gpio=None, speed_hz=1000000, gpio_cs=False,
+                 default_quota=1, quotas=None, idle_sleep=0.005, irq_rearm_interval=0.05,
+                 spi_factory=None):
+        self.bus_number = bus_number
+        self.gpio = gpio
+        self.speed_hz = speed_hz
+        self.gpio_cs = gpio_cs
+        self.default_quota = default_quota
+        self.quotas = quotas or {}
+        self.idle_sleep = idle_sleep
+        self.irq_rearm_interval = irq_rearm_interval
+        self._spi_factory = spi_factory or self._open_spidev
+
+        self.lock = threading.RLock()
+        self._devices = {}
+        self._readers = {}
+        self._order = []
+        self._running = False
+        self._thread = None
+
+        # Lettori con fronte IRQ in attesa di servizio
+        self._irq_pending = set()
+        self._wakeup = threading.Event()
+
+        # Statistiche
+        self.stats = {
+            'cycles': 0,
+            'last_cycle_ms': 0.0,
+            'max_cycle_ms': 0.0
+        }
+
+    def _open_spidev(self, device, no_cs):
+        import spidev
+
+        spi = spidev.SpiDev()
+        spi.open(self.bus_number, device)
+        spi.max_speed_hz = self.speed_hz
+        spi.mode = 0
+        if no_cs:
+            spi.no_cs = True
+        return spi
+
+    def _device(self, device, no_cs=False):
+        if device not in self._devices:
+            self._devices[device] = self._spi_factory(device, no_cs)
+        return self._devices[device]
+
+    def prepare_cs_pins(self, pins):
+        """Porta alti tutti i chip select GPIO prima del primo trasferimento"""
+        if not self.gpio_cs:
+            return
+        with self.lock:
+            for pin in pins:
+                self.gpio.setup(pin, self.gpio.OUT, initial=self.gpio.HIGH)
+
+    def channel(self, sda_pin):
+        """
+        Canale per il chip select del lettore
+        gpio_cs=False: solo CE0/CE1 del kernel (un device spidev ciascuno)
+        gpio_cs=True: un solo device senza CS del kernel, SDA pilotato via GPIO
+        (richiede dtoverlay=spi0-0cs), quindi più di due lettori per bus
+        """
+        with self.lock:
+            if self.gpio_cs:
+                self.gpio.setup(sda_pin, self.gpio.OUT, initial=self.gpio.HIGH)
+                return SPIChannel(self, self._device(0, no_cs=True), cs_pin=sda_pin)
+
+            if sda_pin not in HARDWARE_CS_DEVICES:
+                raise ValueError(f"SDA {sda_pin} non è un chip select hardware "
+                                 f"(usa GPIO8/GPIO7 oppure RFID_SPI_GPIO_CS=True)")
+            return SPIChannel(self, self._device(HARDWARE_CS_DEVICES[sda_pin]))
+
+    def attach(self, reader_id, driver, timeout=0.5, irq_pin=None):
+        """
+        Registra un lettore sul bus e ne restituisce la vista read()
+        Con irq_pin il lettore è servito a interrupt invece che a polling
+        """
+        quota = self.quotas.get(reader_id, self.default_quota)
+        reader = BusCardReader(self, reader_id, driver, quota=quota, timeout=timeout, irq_pin=irq_pin)
+
+        with self.lock:
+            if reader_id not in self._readers:
+                self._order.append(reader_id)
+            self._readers[reader_id] = reader
+
+            if irq_pin is not None:
+                driver.enable_irq()
+                self.gpio.setup(irq_pin, self.gpio.IN, pull_up_down=self.gpio.PUD_UP)
+                self.gpio.add_event_detect(irq_pin, self.gpio.FALLING,
+                                           callback=lambda pin: self._on_irq(reader_id))
+        return reader
+
+    def detach(self, reader_id):
+        with self.lock:
+            reader = self._readers.pop(reader_id, None)
+            if reader_id in self._order:
+                self._order.remove(reader_id)
+            empty = not self._readers
+
+            if reader is not None and reader.irq_pin is not None:
+                try:
+                    self.gpio.remove_event_detect(reader.irq_pin)
+                except Exception:
+                    pass
+
+        if empty:
+            self.stop()
+
+    def start(self):
+        with self.lock:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name=f"SPIBus-{self.bus_number}")
+            self._thread.start()
+
+    def stop(self):
+        with self.lock:
+            self._running = False
+            thread = self._thread
+            self._thread = None
+        self._wakeup.set()
+
+        if thread and thread is not threading.current_thread():
+            thread.join(timeout=1)
+
+        with self.lock:
+            for spi in self._devices.values():
+                try:
+                    spi.close()
+                except Exception:
+                    pass
+            self._devices.clear()
+
+    def _on_irq(self, reader_id):
+        """Callback GPIO (thread RPi.GPIO): segnala soltanto, l'SPI resta al thread del bus"""
+        with self.lock:
+            self._irq_pending.add(reader_id)
+        self._wakeup.set()
+
+    def poll_cycle(self):
+        """Un giro completo sui lettori; True se almeno una card è stata rilevata"""
+        with self.lock:
+            readers = [self._readers[reader_id] for reader_id in self._order]
+            pending = self._irq_pending
+            self._irq_pending = set()
+
+        detected = False
+        for reader in readers:
+            if reader.irq_pin is not None:
+                detected = self._serve_irq_reader(reader, reader.reader_id in pending) or detected
+                continue
+
+            for _ in range(reader.quota):
+                reader.stats['polls'] += 1
+                try:
+                    card = self._read_once(reader.driver)
+                except Exception as e:
+                    print(f"⚠️ Errore SPI lettore {reader.reader_id}: {e}")
+                    break
+
+                if card is None:
+                    continue
+
+                detected = self._deliver(reader, card)
+                break
+
+        return detected
+
+    def _serve_irq_reader(self, reader, fired):
+        """Legge l'UID dopo un fronte IRQ e riarma il REQA quando serve"""
+        now = time.monotonic()
+        detected = False
+        try:
+            if fired:
+                reader.stats['irq_wakeups'] += 1
+                uid = reader.driver.irq_uid()
+                if uid is not None:
+                    text = reader.driver.read_sector_text(uid) if reader.driver.read_data else None
+                    detected = self._deliver(reader, (uid_to_num(uid), text))
+
+            # La card risponde solo a un REQA inviato: riarmo dopo ogni fronte o a intervalli
+            if fired or reader.armed_at is None or now - reader.armed_at >= self.irq_rearm_interval:
+                reader.driver.arm_irq()
+                reader.armed_at = now
+                reader.stats['arms'] += 1
+        except Exception as e:
+            print(f"⚠️ Errore SPI lettore {reader.reader_id}: {e}")
+            reader.armed_at = None
+
+        return detected
+
+    def _deliver(self, reader, card):
+        reader.stats['detections'] += 1
+        try:
+            reader.cards.put_nowait(card)
+        except Full:
+            reader.stats['dropped'] += 1
+        return True
+
+    def _idle_wait(self):
+        """Attesa tra due giri: breve se ci sono lettori a polling, fino al riarmo altrimenti"""
+        with self.lock:
+            readers = list(self._readers.values())
+
+        polled = any(reader.irq_pin is None for reader in readers)
+        if polled:
+            return self.idle_sleep
+
+        now = time.monotonic()
+        deadlines = [reader.armed_at + self.irq_rearm_interval for reader in readers
+                     if reader.armed_at is not None]
+        if not deadlines:
+            return self.irq_rearm_interval
+        return max(0.0, min(deadlines) - now)
+
+    def _read_once(self, driver):
+        uid = driver.read_uid_once()
+        if uid is None:
+            return None
+        text = driver.read_sector_text(uid) if driver.read_data else None
+        return uid_to_num(uid), text
+
+    def _run(self):
+        while self._running:
+            self._wakeup.clear()
+            started = time.perf_counter()
+            detected = self.poll_cycle()
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.stats['cycles'] += 1
+            self.stats['last_cycle_ms'] = elapsed_ms
+            self.stats['max_cycle_ms'] = max(self.stats['max_cycle_ms'], elapsed_ms)
+
+            if not detected:
+                # Un fronte IRQ interrompe l'attesa
+                wait = self._idle_wait()
+                if wait > 0:
+                    self._wakeup.wait(wait)
+
+    def get_status(self):
+        with self.lock:
+            return {
+                'bus': self.bus_number,
+                'running': self._running,
+                'gpio_cs': self.gpio_cs,
+                'readers': {reader_id: dict(reader.stats, quota=reader.quota, irq=reader.irq_pin is not None)
+                            for reader_id, reader in self._readers.items()},
+                **self.stats
+            }
@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Replica locale delle card autorizzate per decisioni offline
+Indice ordinato su disco (mmap + ricerca binaria) con delta incrementali
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+from datetime import datetime
+from config import Config
+
+# Header indice: magic, larghezza record, riservato, numero card, versione
+INDEX_MAGIC = b'RFWL'
+INDEX_HEADER = struct.Struct('<4sHHIQ')
+RECORD_WIDTH = 16
+
+def normalize_uid(card_uid):
+    """Normalizza un UID nel formato usato come chiave dell'indice"""
+    if card_uid is None:
+        return None
+    uid = str(card_uid).strip().upper()
+    return uid or None
+
+def is_indexable(uid):
+    """UID memorizzabile nell'indice: ASCII e al massimo RECORD_WIDTH caratteri"""
+    return uid.isascii() and len(uid) <= RECORD_WIDTH
+
+def encode_uid(card_uid):
+    """UID -> record a larghezza fissa (ordinabile byte per byte)"""
+    raw = card_uid.encode('ascii')
+    if len(raw) > RECORD_WIDTH:
+        raise ValueError(f"UID troppo lungo per l'indice: {card_uid}")
+    return raw.ljust(RECORD_WIDTH, b'\0')
+
+class WhitelistReplica:
+    """Insieme delle card autorizzate replicato dal server"""
+
+    def __init__(self, directory=None, index_file=None):
+        directory = directory or Config.LOG_DIRECTORY
+        index_file = index_file or Config.WHITELIST_FILE
+
+        self.index_path = os.path.join(directory, index_file)
+        self.delta_path = self.index_path + '.delta'
+        self.compact_threshold = Config.WHITELIST_COMPACT_THRESHOLD
+
+        self.version = 0
+        self._count = 0
+        self._file = None
+        self._mm = None
+
+        # Delta applicati dopo l'ultimo snapshot (non ancora compattati)
+        self._added = set()
+        self._removed = set()
+
+        self._lock = threading.RLock()
+        self.last_update = None
+
+        # Statistiche
+        self.stats = {
+            'lookups': 0,
+            'snapshots_applied': 0,
+            'snapshots_skipped': 0,
+            'deltas_applied': 0,
+            'deltas_skipped': 0,
+            'invalid_uids': 0,
+            'compactions': 0
+        }
+
+    def load(self):
+        """Carica indice e delta persistiti"""
+        with self._lock:
+            try:
+                if os.path.exists(self.index_path):
+                    self._open_index()
+
+                self._replay_deltas()
+
+                if self.is_loaded():
+                    print(f"📋 Whitelist caricata: {len(self)} card (versione {self.version})")
+                return True
+
+            except Exception as e:
+                print(f"⚠️ Errore caricamento whitelist: {e}")
+                self._close_index()
+                self._added.clear()
+                self._removed.clear()
+                return False
+
+    def is_loaded(self):
+        """True se la replica ha ricevuto almeno uno snapshot"""
+        return self._mm is not None
+
+    def contains(self, card_uid):
+        """Verifica se la card è autorizzata nella replica"""
+        uid = normalize_uid(card_uid)
+        if uid is None:
+            return False
+
+        with self._lock:
+            self.stats['lookups'] += 1
+
+            if uid in self._removed:
+                return False
+            if uid in self._added:
+                return True
+
+            return self._index_contains(uid)
+
+    def apply_snapshot(self, cards, version=0):
+        """
+        Sostituisce l'intero insieme con uno snapshot completo
+        Gli snapshot più vecchi della versione corrente vengono ignorati (None)
+        """
+        uids = sorted(set(self._valid_uids(cards)))
+
+        with self._lock:
+            if version < self.version:
+                self.stats['snapshots_skipped'] += 1
+                print(f"⚠️ Snapshot whitelist ignorato: versione {version} < {self.version}")
+                return None
+
+            self._write_index(uids, version)
+
+            # Lo snapshot assorbe tutti i delta precedenti
+            self._added.clear()
+            self._removed.clear()
+            if os.path.exists(self.delta_path):
+                os.remove(self.delta_path)
+
+            self.stats['snapshots_applied'] += 1
+            self.last_update = datetime.now().isoformat()
+
+        print(f"📋 Snapshot whitelist applicato: {len(uids)} card (versione {version})")
+        return len(uids)
+
+    def apply_delta(self, add=None, remove=None, version=None):
+        """
+        Applica un delta incrementale
+        I delta con versione già applicata vengono ignorati
+        """
+        add = self._valid_uids(add)
+        remove = self._valid_uids(remove)
+
+        with self._lock:
+            if not self.is_loaded():
+                print("⚠️ Delta whitelist ignorato: nessuno snapshot disponibile")
+                self.stats['deltas_skipped'] += 1
+                return False
+
+            if version is not None and version <= self.version:
+                self.stats['deltas_skipped'] += 1
+                return False
+
+            # Persisti prima di applicare in memoria
+            record = {'add': add, 'remove': remove, 'version': version}
+            with open(self.delta_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, separators=(',', ':')) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._apply_delta_in_memory(add, remove, version)
+            self.stats['deltas_applied'] += 1
+            self.last_update = datetime.now().isoformat()
+
+            if len(self._added) + len(self._removed) >= self.compact_threshold:
+                self.compact()
+
+        return True
+
+    def _valid_uids(self, cards):
+        """UID normalizzati; quelli non memorizzabili nell'indice vengono scartati e segnalati"""
+        uids, invalid = [], []
+        for card in cards or []:
+            uid = normalize_uid(card)
+            if uid is not None:
+                (uids if is_indexable(uid) else invalid).append(uid)
+
+        if invalid:
+            with self._lock:
+                self.stats['invalid_uids'] += len(invalid)
+            print(f"⚠️ Whitelist: {len(invalid)} UID non validi ignorati (es. {invalid[0][:40]!r})")
+        return uids
+
+    def compact(self):
+        """Fonde i delta nell'indice ordinato"""
+        with self._lock:
+            if not self.is_loaded():
+                return False
+
+            uids = set(self._iter_index())
+            uids.difference_update(self._removed)
+            uids.update(self._added)
+
+            self._write_index(sorted(uids), self.version)
+            self._added.clear()
+            self._removed.clear()
+            if os.path.exists(self.delta_path):
+                os.remove(self.delta_path)
+
+            self.stats['compactions'] += 1
+
+        return True
+
+    def load_snapshot_file(self, path):
+        """
+        Importa uno snapshot da file
+        Formati: JSON {"version": N, "cards": [...]} oppure un UID per riga
+        """
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+
+            if content.lstrip().startswith('{'):
+                data = json.loads(content)
+                cards = data.get('cards', [])
+                version = data.get('version', 0)
+            else:
+                cards = [line for line in content.splitlines() if line.strip() and not line.startswith('#')]
+                version = 0
+
+            return self.apply_snapshot(cards, version)
+
+        except Exception as e:
+            print(f"❌ Errore import snapshot whitelist: {e}")
+            return None
+
+    def handle_snapshot_message(self, payload):
+        """Messaggio snapshot dal server: {"version": N, "cards": [...]}"""
+        return self.apply_snapshot(payload.get('cards', []), payload.get('version', 0))
+
+    def handle_delta_message(self, payload):
+        """Messaggio delta dal server: {"version": N, "add": [...], "remove": [...]}"""
+        return self.apply_delta(payload.get('add'), payload.get('remove'), payload.get('version'))
+
+    def __len__(self):
+        with self._lock:
+            base = self._count
+            # Correzione per i delta non ancora compattati
+            added = sum(1 for uid in self._added if not self._index_contains(uid))
+            removed = sum(1 for uid in self._removed if self._index_contains(uid))
+            return base + added - removed
+
+    def get_status(self):
+        """Status replica"""
+        with self._lock:
+            return {
+                'loaded': self.is_loaded(),
+                'version': self.version,
+                'cards': len(self) if self.is_loaded() else 0,
+                'pending_deltas': len(self._added) + len(self._removed),
+                'last_update': self.last_update,
+                'index_file': self.index_path,
+                'stats': self.stats.copy()
+            }
+
+    def close(self):
+        with self._lock:
+            self._close_index()
+
+    # --- Indice su disco ---
+
+    def _index_contains(self, uid):
+        if self._mm is None:
+            return False
+
+        try:
+            key = encode_uid(uid)
+        except (ValueError, UnicodeEncodeError):
+            return False
+
+        lo, hi = 0, self._count
+        offset = INDEX_HEADER.size
+
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = offset + mid * RECORD_WIDTH
+            record = self._mm[start:start + RECORD_WIDTH]
+            if record < key:
+                lo = mid + 1
+            elif record > key:
+                hi = mid
+            else:
+                return True
+
+        return False
+
+    def _iter_index(self):
+        offset = INDEX_HEADER.size
+        for i in range(self._count):
+            start = offset + i * RECORD_WIDTH
+            yield self._mm[start:start + RECORD_WIDTH].rstrip(b'\0').decode('ascii')
+
+    def _write_index(self, sorted_uids, version):
+        """Scrittura atomica: file temporaneo + rename"""
+        directory = os.path.dirname(self.index_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        records = [encode_uid(uid) for uid in sorted_uids]
+        tmp_path = self.index_path + '.tmp'
+
+        with open(tmp_path, 'wb') as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, RECORD_WIDTH, 0, len(records), version))
+            f.write(b''.join(records))
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._close_index()
+        os.replace(tmp_path, self.index_path)
+        self._open_index()
+
+    def _open_index(self):
+        self._file = open(self.index_path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, width, _, count, version = INDEX_HEADER.unpack(self._mm[:INDEX_HEADER.size])
+        if magic != INDEX_MAGIC or width != RECORD_WIDTH:
+            self._close_index()
+            raise ValueError("Formato indice whitelist non valido")
+
+        self._count = count
+        self.version = version
+
+    def _close_index(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._count = 0
+
+    def _replay_deltas(self):
+        if not os.path.exists(self.delta_path) or not self.is_loaded():
+            return
+
+        with open(self.delta_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Riga troncata (crash durante la scrittura)
+                    break
+                self._apply_delta_in_memory(record.get('add', []), record.get('remove', []), record.get('version'))
+
+    def _apply_delta_in_memory(self, add, remove, version):
+        for uid in remove:
+            self._added.discard(uid)
+            self._removed.add(uid)
+        for uid in add:
+            self._removed.discard(uid)
+            self._added.add(uid)
+
+        if version is not None:
+            self.version = max(self.version, version)
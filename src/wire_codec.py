@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Codifica dei payload MQTT
+JSON compatto (con backend veloce orjson se installato) e CBOR (RFC 8949,
+binario compatto) scelti per topic: un topic passa al binario solo se il
+server lo accetta (content type annunciato sul topic codec). In ricezione
+la codifica viene riconosciuta dal primo byte
+"""
+import json
+import struct
+import threading
+from config import Config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CONTENT_TYPE_JSON = 'application/json'
+CONTENT_TYPE_CBOR = 'application/cbor'
+
+class JsonCodec:
+    """JSON senza spazi, UTF-8"""
+
+    name = 'json'
+    content_type = CONTENT_TYPE_JSON
+
+    def __init__(self, backend=None):
+        backend = backend or Config.WIRE_JSON_BACKEND
+        if backend == 'auto':
+            backend = 'orjson' if orjson is not None else 'stdlib'
+        elif backend == 'orjson' and orjson is None:
+            print("⚠️ orjson non installato, uso json della libreria standard")
+            backend = 'stdlib'
+        self.backend = backend
+
+    def encode(self, obj):
+        if self.backend == 'orjson':
+            try:
+                return orjson.dumps(obj)
+            except TypeError:
+                pass  # Tipi non supportati da orjson (es. interi oltre 64 bit)
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    def decode(self, data):
+        if self.backend == 'orjson':
+            return orjson.loads(data)
+        return json.loads(data)
+
+    def encode_with_items(self, obj, key, encoded_items):
+        """obj con la chiave `key` = lista di elementi già codificati"""
+        head = self.encode(obj)
+        body = b','.join(encoded_items)
+        key_bytes = self.encode(key)
+        if head == b'{}':
+            return b'{' + key_bytes + b':[' + body + b']}'
+        return head[:-1] + b',' + key_bytes + b':[' + body + b']}'
+
+class CborCodec:
+    """
+    Sottoinsieme CBOR a lunghezza definita: null, bool, interi, float64,
+    testo, byte, liste e mappe (in decodifica anche float16/32)
+    """
+
+    name = 'cbor'
+    content_type = CONTENT_TYPE_CBOR
+
+    def encode(self, obj):
+        out = bytearray()
+        self._encode(obj, out)
+        return bytes(out)
+
+    def decode(self, data):
+        value, offset = self._decode(memoryview(data), 0)
+        if offset != len(data):
+            raise ValueError("CBOR: byte in eccesso dopo il valore")
+        return value
+
+    def encode_with_items(self, obj, key, encoded_items):
+        """obj con la chiave `key` = lista di elementi già codificati"""
+        out = bytearray()
+        self._head(5, len(obj) + 1, out)
+        for item_key, item_value in obj.items():
+            self._encode(item_key, out)
+            self._encode(item_value, out)
+        self._encode(key, out)
+        self._head(4, len(encoded_items), out)
+        for item in encoded_items:
+            out += item
+        return bytes(out)
+
+    # --- Encoder ---
+
+    @staticmethod
+    def _head(major, length, out):
+        if length < 24:
+            out.append(major << 5 | length)
+        elif length < 0x100:
+            out += struct.pack('>BB', major << 5 | 24, length)
+        elif length < 0x10000:
+            out += struct.pack('>BH', major << 5 | 25, length)
+        elif length < 0x100000000:
+            out += struct.pack('>BI', major << 5 | 26, length)
+        elif length < 0x10000000000000000:
+            out += struct.pack('>BQ', major << 5 | 27, length)
+        else:
+            raise ValueError("CBOR: intero oltre 64 bit")
+
+    def _encode(self, obj, out):
+        if obj is None:
+            out.append(0xf6)
+        elif obj is True:
+            out.append(0xf5)
+        elif obj is False:
+            out.append(0xf4)
+        elif isinstance(obj, int):
+            if obj >= 0:
+                self._head(0, obj, out)
+            else:
+                self._head(1, -1 - obj, out)
+        elif isinstance(obj, float):
+            out += struct.pack('>Bd', 0xfb, obj)
+        elif isinstance(obj, str):
+            data = obj.encode('utf-8')
+            self._head(3, len(data), out)
+            out += data
+        elif isinstance(obj, (bytes, bytearray)):
+            self._head(2, len(obj), out)
+            out += obj
+        elif isinstance(obj, (list, tuple)):
+            self._head(4, len(obj), out)
+            for item in obj:
+                self._encode(item, out)
+        elif isinstance(obj, dict):
+            self._head(5, len(obj), out)
+            for key, value in obj.items():
+                self._encode(key, out)
+                self._encode(value, out)
+        else:
+            raise TypeError(f"CBOR: tipo non supportato {type(obj).__name__}")
+
+    # --- Decoder ---
+
+    def _length(self, data, offset, info):
+        if info < 24:
+            return info, offset
+        size = {24: 1, 25: 2, 26: 4, 27: 8}.get(info)
+        if size is None:
+            raise ValueError("CBOR: lunghezze indefinite non supportate")
+        end = offset + size
+        if end > len(data):
+            raise ValueError("CBOR: dati troncati")
+        return int.from_bytes(data[offset:end], 'big'), end
+
+    def _decode(self, data, offset):
+        if offset >= len(data):
+            raise ValueError("CBOR: dati troncati")
+        initial = data[offset]
+        major, info = initial >> 5, initial & 0x1f
+        offset += 1
+
+        if major == 7:
+            if info == 20:
+                return False, offset
+            if info == 21:
+                return True, offset
+            if info in (22, 23):
+                return None, offset
+            formats = {25: ('>e', 2), 26: ('>f', 4), 27: ('>d', 8)}
+            if info not in formats:
+                raise ValueError(f"CBOR: valore semplice non supportato ({info})")
+            fmt, size = formats[info]
+            if offset + size > len(data):
+                raise ValueError("CBOR: dati troncati")
+            return struct.unpack(fmt, data[offset:offset + size])[0], offset + size
+
+        value, offset = self._length(data, offset, info)
+        if major == 0:
+            return value, offset
+        if major == 1:
+            return -1 - value, offset
+        if major in (2, 3):
+            end = offset + value
+            if end > len(data):
+                raise ValueError("CBOR: dati troncati")
+            chunk = bytes(data[offset:end])
+            return (chunk.decode('utf-8') if major == 3 else chunk), end
+        if major == 4:
+            items = []
+            for _ in range(value):
+                item, offset = self._decode(data, offset)
+                items.append(item)
+            return items, offset
+        if major == 5:
+            result = {}
+            for _ in range(value):
+                key, offset = self._decode(data, offset)
+                result[key], offset = self._decode(data, offset)
+            return result, offset
+        raise ValueError("CBOR: tag non supportati")
+
+CODECS = {
+    JsonCodec.name: JsonCodec,
+    CborCodec.name: CborCodec,
+}
+
+def create_codec(name):
+    if name not in CODECS:
+        raise ValueError(f"Codifica sconosciuta: {name} (disponibili: {', '.join(CODECS)})")
+    return CODECS[name]()
+
+_cbor = CborCodec()
+
+def decode_payload(data):
+    """Payload ricevuto in JSON o CBOR (riconosciuto dal primo byte)"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    stripped = data.lstrip()
+    if stripped[:1] in (b'{', b'['):
+        return json.loads(data) if orjson is None else orjson.loads(data)
+    return _cbor.decode(data)
+
+class WireCodecs:
+    """
+    Codifica per topic (suffisso dopo gate/<id>/): preferenza da
+    WIRE_CODEC / WIRE_CODEC_TOPICS; con la negoziazione attiva una codifica
+    diversa da JSON si usa solo se il server ne ha annunciato il content type
+    per quel topic (o per "*"), altrimenti si resta su JSON
+    """
+
+    def __init__(self, default=None, topics=None, negotiate=None):
+        self.default = default or Config.WIRE_CODEC
+        self.negotiate = Config.WIRE_CODEC_NEGOTIATE if negotiate is None else negotiate
+        self.preferred = self._parse_topics(Config.WIRE_CODEC_TOPICS if topics is None else topics)
+        self._lock = threading.Lock()
+        self._accepted = {}     # topic -> content type accettati dal server
+        self._codecs = {}       # nome -> istanza
+
+        # Errori di configurazione subito all'avvio
+        for name in set(self.preferred.values()) | {self.default}:
+            self._codec(name)
+
+    @staticmethod
+    def _parse_topics(spec):
+        """"badge=cbor,offline_audit=cbor" -> {topic: codifica}"""
+        preferred = {}
+        for item in spec.split(','):
+            if '=' in item:
+                topic, name = item.split('=', 1)
+                preferred[topic.strip()] = name.strip()
+        return preferred
+
+    def _codec(self, name):
+        codec = self._codecs.get(name)
+        if codec is None:
+            codec = self._codecs[name] = create_codec(name)
+        return codec
+
+    def codec_for(self, topic):
+        """Codifica da usare per un topic"""
+        codec = self._codec(self.preferred.get(topic, self.default))
+        if codec.content_type == CONTENT_TYPE_JSON or not self.negotiate:
+            return codec
+
+        with self._lock:
+            accepted = self._accepted.get(topic) or self._accepted.get('*', ())
+            if codec.content_type in accepted:
+                return codec
+        return self._codec(JsonCodec.name)
+
+    def encode(self, topic, obj):
+        """Payload codificato per il topic"""
+        return self.codec_for(topic).encode(obj)
+
+    def handle_advert(self, payload):
+        """
+        Annuncio del server: {"accept": {"badge": ["application/cbor", ...], "*": [...]}}
+        Sostituisce l'annuncio precedente (messaggio retained)
+        """
+        accept = payload.get('accept') or {}
+        with self._lock:
+            self._accepted = {topic: set(types) for topic, types in accept.items()}
+        print(f"📦 Codifiche accettate dal server: "
+              f"{', '.join(f'{topic}={sorted(types)}' for topic, types in accept.items()) or 'solo JSON'}")
+
+    def content_types(self, topics):
+        """Content type in uso per i topic indicati (annunciati nello status)"""
+        return {topic: self.codec_for(topic).content_type for topic in topics}
+
+    def get_status(self):
+        with self._lock:
+            accepted = {topic: sorted(types) for topic, types in self._accepted.items()}
+        return {
+            'default': self.default,
+            'preferred': dict(self.preferred),
+            'negotiate': self.negotiate,
+            'accepted': accepted,
+            'json_backend': self._codec(JsonCodec.name).backend
+        }
+
+# Codifiche di processo, create al primo uso
+_codecs = None
+_codecs_lock = threading.Lock()
+
+def get_wire_codecs():
+    """Codifiche per topic condivise da client MQTT, audit offline e controllo manuale"""
+    global _codecs
+    with _codecs_lock:
+        if _codecs is None:
+            _codecs = WireCodecs()
+        return _codecs
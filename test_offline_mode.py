@@ -106,7 +106,7 @@ def test_offline_mode():
         # Test 4: Verifica coda offline
         print(f"\n🧪 TEST 4: VERIFICA CODA OFFLINE")
         
-        queue_size = offline_manager.offline_queue.qsize()
+        queue_size = offline_manager.get_queue_size()
         print(f"📊 Elementi in coda: {queue_size}")
         
         if queue_size > 0:
@@ -118,27 +118,21 @@ def test_offline_mode():
         # Test 5: Verifica file persistente
         print(f"\n🧪 TEST 5: VERIFICA FILE PERSISTENTE")
         
-        queue_file = os.path.join(Config.LOG_DIRECTORY, Config.OFFLINE_STORAGE_FILE)
-        
-        if os.path.exists(queue_file):
-            print(f"✅ File coda offline esistente: {queue_file}")
-            try:
-                with open(queue_file, 'r') as f:
-                    data = json.load(f)
-                print(f"📊 Dati file coda:")
-                print(f"   saved_at: {data.get('saved_at', 'N/A')}")
-                print(f"   queue_size: {data.get('queue_size', 'N/A')}")
-                
-                queue_data = data.get('queue_data', [])
-                if queue_data:
-                    last_entry = queue_data[-1]
-                    print(f"   ultimo_evento: {last_entry.get('timestamp', 'N/A')}")
-                    print(f"   offline_authorized: {last_entry.get('offline_authorized', 'N/A')}")
-                
-            except Exception as e:
-                print(f"⚠️ Errore lettura file coda: {e}")
+        journal_status = offline_manager.journal.get_status()
+        
+        if journal_status['live_events'] > 0:
+            print(f"✅ Journal coda offline: {journal_status['directory']}")
+            print(f"📊 Dati journal:")
+            print(f"   segmenti: {journal_status['segments']}")
+            print(f"   eventi: {journal_status['live_events']}")
+            
+            queue_data = offline_manager.get_queue_items()
+            if queue_data:
+                last_entry = queue_data[-1]
+                print(f"   ultimo_evento: {last_entry.get('timestamp', 'N/A')}")
+                print(f"   offline_authorized: {last_entry.get('offline_authorized', 'N/A')}")
         else:
-            print(f"❌ File coda offline non trovato: {queue_file}")
+            print(f"❌ Journal coda offline vuoto: {journal_status['directory']}")
         
         # Test 6: Test con múltiple card
         print(f"\n🧪 TEST 6: ACCESSI MULTIPLI OFFLINE")
@@ -160,7 +154,7 @@ def test_offline_mode():
             
             time.sleep(0.1)
         
-        final_queue_size = offline_manager.offline_queue.qsize()
+        final_queue_size = offline_manager.get_queue_size()
         print(f"📊 Coda finale: {final_queue_size} elementi")
         
         # Test 7: Statistiche offline
@@ -285,7 +279,7 @@ def main():
         print("💡 Se hai problemi nel sistema reale:")
         print("   1. Verifica che MQTT sia davvero disconnesso")
         print("   2. Controlla i log per errori specifici")
-        print("   3. Verifica permessi file offline_queue.json")
+        print("   3. Verifica permessi directory journal offline (logs/offline_journal)")
     else:
         print("\n💔 OFFLINE MODE HA PROBLEMI")
         print("🔧 Controlla gli errori sopra e:")
@@ -106,7 +106,7 @@ def test_offline_mode_simplified():
         # Test 3: Verifica persistenza
         print(f"\n🧪 TEST 3: VERIFICA PERSISTENZA DATI")
         
-        queue_size = offline_manager.offline_queue.qsize()
+        queue_size = offline_manager.get_queue_size()
         print(f"📊 Elementi in coda: {queue_size}")
         
         if queue_size > 0:
@@ -115,19 +115,15 @@ def test_offline_mode_simplified():
             print("❌ Nessun evento salvato")
             success = False
         
-        # Test 4: File persistente
-        queue_file = os.path.join(Config.LOG_DIRECTORY, Config.OFFLINE_STORAGE_FILE)
-        
-        if os.path.exists(queue_file):
-            print(f"✅ File persistente creato: {queue_file}")
-            try:
-                with open(queue_file, 'r') as f:
-                    data = json.load(f)
-                print(f"📁 File contiene {data.get('queue_size', 0)} eventi")
-            except Exception as e:
-                print(f"⚠️ Errore lettura file: {e}")
+        # Test 4: Journal persistente
+        journal_status = offline_manager.journal.get_status()
+        
+        if journal_status['live_events'] > 0:
+            print(f"✅ Journal persistente: {journal_status['directory']}")
+            print(f"📁 Journal contiene {journal_status['live_events']} eventi "
+                  f"in {journal_status['segments']} segmenti")
         else:
-            print(f"❌ File persistente non creato")
+            print(f"❌ Journal persistente vuoto")
         
         # Test 5: Accessi multipli
         print(f"\n🧪 TEST 4: ACCESSI MULTIPLI OFFLINE")
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Test writer asincrono log accessi
+"""
+import sys
+import os
+import csv
+import json
+import tempfile
+
+# Aggiungi src al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from access_log_writer import AccessLogWriter
+from logger import AccessLogger
+
+def make_record(index):
+    return {
+        'timestamp': f"2026-01-01T00:00:{index:02d}",
+        'card_uid': f"CARD{index:04d}",
+        'raw_id': index,
+        'tornello_id': 'T1',
+        'direzione': 'in',
+        'authorized': True,
+        'auth_message': 'ok',
+        'relay_activated': True,
+        'card_data': '',
+        'auth_time_ms': 10,
+        'event_type': 'access_attempt'
+    }
+
+def make_writer(tmp, **kwargs):
+    AccessLogger(tmp)  # Crea header CSV
+    csv_path = os.path.join(tmp, "access_log.csv")
+    json_path = os.path.join(tmp, "access_log.jsonl")
+    options = {'queue_size': 100, 'flush_interval': 60, 'fsync_policy': 'never'}
+    options.update(kwargs)
+    return AccessLogWriter(csv_path, json_path, **options), csv_path, json_path
+
+def read_jsonl(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+def test_batched_write_and_flush():
+    """I record accodati finiscono su CSV e JSON in un solo blocco"""
+    with tempfile.TemporaryDirectory() as tmp:
+        writer, csv_path, json_path = make_writer(tmp)
+
+        for i in range(5):
+            assert writer.submit(make_record(i))
+
+        assert writer.flush(timeout=5)
+
+        with open(csv_path, 'r', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+
+        assert [r['card_uid'] for r in rows] == [f"CARD{i:04d}" for i in range(5)]
+        assert read_jsonl(json_path) == [make_record(i) for i in range(5)]
+        assert writer.stats['batches'] == 1
+        writer.close()
+    print("✅ Scrittura a blocchi OK")
+
+def test_jsonl_rotates_by_size():
+    """Oltre la dimensione massima il segmento JSON Lines diventa .1"""
+    with tempfile.TemporaryDirectory() as tmp:
+        line_size = len(json.dumps(make_record(0), separators=(',', ':'))) + 1
+        writer, _, json_path = make_writer(tmp, json_max_bytes=line_size * 3)
+
+        for i in range(4):
+            writer.submit(make_record(i))
+            writer.flush()
+        writer.submit(make_record(4))
+        writer.close()
+
+        assert [r['raw_id'] for r in read_jsonl(json_path + ".1")] == [0, 1, 2]
+        assert [r['raw_id'] for r in read_jsonl(json_path)] == [3, 4]
+        assert writer.stats['rotations'] == 1
+    print("✅ Rotazione JSON Lines OK")
+
+def test_full_queue_drops_without_blocking():
+    """Coda piena: il record viene scartato, il chiamante non attende"""
+    with tempfile.TemporaryDirectory() as tmp:
+        writer, _, _ = make_writer(tmp, queue_size=2)
+        writer.start()
+
+        results = [writer.submit(make_record(i)) for i in range(5)]
+        assert results.count(False) >= 1
+        assert writer.stats['dropped'] >= 1
+        writer.close()
+    print("✅ Coda piena non bloccante OK")
+
+def test_jsonl_is_append_only():
+    """Un nuovo writer accoda ai record esistenti senza riscriverli"""
+    with tempfile.TemporaryDirectory() as tmp:
+        writer, _, json_path = make_writer(tmp)
+        writer.submit(make_record(1))
+        writer.close()
+
+        with open(json_path, 'rb') as f:
+            before = f.read()
+
+        writer, _, _ = make_writer(tmp)
+        writer.submit(make_record(2))
+        writer.close()
+
+        with open(json_path, 'rb') as f:
+            assert f.read().startswith(before)
+        assert [r['raw_id'] for r in read_jsonl(json_path)] == [1, 2]
+    print("✅ JSON Lines in append OK")
+
+if __name__ == "__main__":
+    print("🧪 TEST WRITER LOG ACCESSI")
+    print("==========================")
+
+    test_batched_write_and_flush()
+    test_jsonl_rotates_by_size()
+    test_full_queue_drops_without_blocking()
+    test_jsonl_is_append_only()
+
+    print("\n✅ Tutti i test superati!")
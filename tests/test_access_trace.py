@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Test trace per accesso (fasi, chiusura a relè spento, export a campione)
+"""
+import sys
+import os
+import json
+import tempfile
+import threading
+import time
+
+# Aggiungi src al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+os.environ['HARDWARE_BACKEND'] = 'simulated'
+from config import Config
+Config.HARDWARE_BACKEND = 'simulated'
+
+from access_trace import (AccessTrace, AccessTracer, ENQUEUED, DEQUEUED, AUTH_SENT,
+                          AUTH_RECEIVED, RELAY_ON, RELAY_OFF, LOGGED)
+from relay_controller import RelayController
+from relay_scheduler import RelayScheduler
+from rfid_manager import RFIDManager
+
+def make_trace():
+    trace = AccessTrace(detected_at=100.0)
+    for stage, at in ((ENQUEUED, 100.001), (DEQUEUED, 100.011), (AUTH_SENT, 100.012),
+                      (AUTH_RECEIVED, 100.062), (RELAY_ON, 100.063)):
+        trace.mark(stage, at)
+    return trace
+
+def test_spans():
+    trace = make_trace()
+    trace.mark(LOGGED, 100.065)
+
+    spans = trace.spans_ms()
+    assert spans['queue_wait'] == 10.0
+    assert spans['auth'] == 50.0
+    assert spans['total'] == 65.0
+    assert 'relay_hold' not in spans
+    assert trace.offsets_ms()['relay_on'] == 63.0
+    print("✅ Durate per fase OK")
+
+def test_finish_waits_for_relay_off_and_samples():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'traces.jsonl')
+        tracer = AccessTracer(sample_rate=1.0, export_path=path)
+
+        trace = make_trace()
+        trace.mark(LOGGED, 100.065)
+        assert not tracer.finish(trace, {'card_uid': 'AB'})  # Relè ancora acceso
+
+        trace.mark(RELAY_OFF, 103.063)
+        assert tracer.finish(trace, {'card_uid': 'AB'})
+        assert not tracer.finish(trace)  # Chiusa una sola volta
+
+        with open(path, encoding='utf-8') as export_file:
+            records = [json.loads(line) for line in export_file]
+        assert len(records) == 1
+        assert records[0]['card_uid'] == 'AB'
+        assert records[0]['spans_ms']['relay_hold'] == 3000.0
+
+        # Accesso negato: nessun relè, chiusa al log; campionamento 0 = nessun export
+        quiet = AccessTracer(sample_rate=0.0, export_path=path)
+        denied = AccessTrace(detected_at=0.0)
+        denied.mark(AUTH_RECEIVED, 0.02)
+        denied.mark(LOGGED, 0.021)
+        assert quiet.finish(denied)
+        assert quiet.stats['exported'] == 0
+        assert denied.spans_ms()['log'] == 1.0
+    print("✅ Chiusura ed export a campione OK")
+
+def test_relay_release_callback():
+    scheduler = RelayScheduler(name="TestTraceScheduler")
+    relay = RelayController("trace", gpio_pin=21, active_time=0.05, active_low=False, scheduler=scheduler)
+    assert relay.initialize()
+    released = []
+    try:
+        start = time.monotonic()
+        assert relay.activate(0.05, on_release=released.append)
+        time.sleep(0.2)
+        assert len(released) == 1 and released[0] - start >= 0.05
+
+        relay.activate(5, on_release=released.append)
+        relay.force_off()
+        assert len(released) == 2
+    finally:
+        relay.force_off()
+        scheduler.stop()
+    print("✅ Callback spegnimento relè OK")
+
+def test_manager_marks_dequeue():
+    manager = RFIDManager()
+    trace = AccessTrace()
+    trace.mark(ENQUEUED)
+    manager.card_queue.put({'uid_formatted': 'AB', 'trace': trace})
+
+    card_info = manager.get_next_card(timeout=0.1)
+    assert card_info['trace'] is trace
+    assert trace.marks[DEQUEUED] >= trace.marks[ENQUEUED]
+    print("✅ Marcatura uscita coda OK")
+
+class InstantReader:
+    """Come SimpleMFRC522 con una card appoggiata: read() risponde subito"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def read(self):
+        self.calls += 1
+        return 0xC67BD90561, ''
+
+def test_reader_thread_pauses_for_instant_reader():
+    """Card appoggiata su un lettore che non attende: niente ciclo continuo di letture"""
+    from rfid_reader import RFIDReader
+
+    reader = RFIDReader('in')
+    reader.reader = InstantReader()
+    reader.is_initialized = True
+    reader.presence.observe(0xC67BD90561)  # Già segnalata: letture soppresse
+    assert not reader.waits_for_card
+
+    manager = RFIDManager()
+    manager.running = True
+    thread = threading.Thread(target=manager._reader_thread, args=('in', reader), daemon=True)
+    thread.start()
+    time.sleep(0.35)
+    manager.running = False
+    thread.join(timeout=1)
+
+    assert 1 <= reader.reader.calls <= 6
+    assert manager.card_queue.empty()
+    print("✅ Pausa lettore senza attesa OK")
+
+if __name__ == "__main__":
+    print("🧪 TEST TRACE ACCESSI")
+    print("=====================")
+
+    test_spans()
+    test_finish_waits_for_relay_off_and_samples()
+    test_relay_release_callback()
+    test_manager_marks_dequeue()
+    test_reader_thread_pauses_for_instant_reader()
+
+    print("\n✅ Tutti i test superati!")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Test cache decisioni di autorizzazione
+"""
+import sys
+import os
+import time
+
+# Aggiungi src al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from auth_cache import AuthCache
+
+def test_hit_and_miss():
+    """Decisioni positive e negative restituite dalla cache"""
+    cache = AuthCache(max_size=10, ttl=60, negative_ttl=60)
+
+    assert cache.get('AAAA0001') is None
+
+    cache.put('AAAA0001', True, 'Benvenuto')
+    cache.put('BBBB0002', False, 'Abbonamento scaduto')
+
+    hit = cache.get('AAAA0001')
+    assert hit['authorized'] is True
+    assert hit['cached'] is True
+    assert hit['message'] == 'Benvenuto'
+
+    assert cache.get('BBBB0002')['authorized'] is False
+    assert cache.get_status()['stats']['hits'] == 2
+    print("✅ Hit/miss cache OK")
+
+def test_ttl_expiry():
+    """Le voci scadono secondo il TTL della decisione"""
+    cache = AuthCache(max_size=10, ttl=60, negative_ttl=0.05)
+
+    cache.put('AAAA0001', True)
+    cache.put('BBBB0002', False)
+    time.sleep(0.1)
+
+    assert cache.get('AAAA0001') is not None
+    assert cache.get('BBBB0002') is None
+    print("✅ Scadenza TTL OK")
+
+def test_lru_eviction():
+    """Oltre il limite viene rimossa la voce meno usata"""
+    cache = AuthCache(max_size=2, ttl=60, negative_ttl=60)
+
+    cache.put('A', True)
+    cache.put('B', True)
+    cache.get('A')
+    cache.put('C', True)
+
+    assert len(cache) == 2
+    assert cache.get('B') is None
+    assert cache.get('A') is not None
+    assert cache.get_status()['stats']['evictions'] == 1
+    print("✅ Eviction LRU OK")
+
+def test_invalidation_messages():
+    """Messaggi di invalidazione dal server"""
+    cache = AuthCache(max_size=10, ttl=60, negative_ttl=60)
+    for uid in ('A', 'B', 'C'):
+        cache.put(uid, True)
+
+    assert cache.handle_invalidation({'card_uid': 'A'}) == 1
+    assert cache.get('A') is None
+
+    assert cache.handle_invalidation({'card_uids': ['B', 'X']}) == 1
+
+    cache.handle_invalidation({'all': True})
+    assert len(cache) == 0
+    print("✅ Invalidazione OK")
+
+if __name__ == "__main__":
+    print("🧪 TEST CACHE AUTORIZZAZIONI")
+    print("============================")
+
+    test_hit_and_miss()
+    test_ttl_expiry()
+    test_lru_eviction()
+    test_invalidation_messages()
+
+    print("\n✅ Tutti i test superati!")
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Test multiplexer richieste di autenticazione
+"""
+import sys
+import os
+import threading
+import time
+
+# Aggiungi src al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from auth_rpc import AuthRequestMultiplexer, refresh_request_id
+
+def test_resolve_by_request_id():
+    """Richieste per la stessa card non collidono"""
+    mux = AuthRequestMultiplexer()
+
+    first = mux.register('AAAA0001', timeout=1)
+    second = mux.register('AAAA0001', timeout=1)
+
+    mux.resolve({'request_id': second.request_id}, {'authorized': False})
+    mux.resolve({'request_id': first.request_id}, {'authorized': True})
+
+    assert mux.wait(first)['authorized'] is True
+    assert mux.wait(second)['authorized'] is False
+    assert mux.pending_count() == 0
+    print("✅ Correlazione request_id OK")
+
+def test_legacy_response_without_id():
+    """Senza request_id si risolve la richiesta più vecchia della card"""
+    mux = AuthRequestMultiplexer()
+
+    first = mux.register('AAAA0001', timeout=1)
+    second = mux.register('AAAA0001', timeout=1)
+
+    mux.resolve({'card_uid': 'AAAA0001'}, {'authorized': True})
+
+    assert first.event.is_set()
+    assert not second.event.is_set()
+    print("✅ Fallback card_uid OK")
+
+def test_wakeup_is_immediate():
+    """Il waiter viene svegliato senza polling"""
+    mux = AuthRequestMultiplexer()
+    pending = mux.register('AAAA0001', timeout=2)
+
+    timer = threading.Timer(0.02, mux.resolve, args=({'request_id': pending.request_id}, {'authorized': True}))
+    start = time.monotonic()
+    timer.start()
+
+    assert mux.wait(pending) is not None
+    assert time.monotonic() - start < 0.5
+    print("✅ Risveglio immediato OK")
+
+def test_late_response_is_discarded():
+    """Risposte dopo il timeout non restano in memoria"""
+    mux = AuthRequestMultiplexer()
+    pending = mux.register('AAAA0001', timeout=0.01)
+
+    assert mux.wait(pending) is None
+    mux.cancel(pending)
+
+    assert mux.resolve({'request_id': pending.request_id}, {'authorized': True}) is None
+    assert mux.pending_count() == 0
+    assert mux.get_status()['stats']['unmatched'] == 1
+    print("✅ Risposta tardiva scartata OK")
+
+def test_sweep_expired():
+    """Le richieste scadute e abbandonate vengono rimosse"""
+    mux = AuthRequestMultiplexer()
+    mux.register('AAAA0001', timeout=0.01)
+    time.sleep(0.02)
+
+    assert mux.sweep() == 1
+    assert mux.pending_count() == 0
+    print("✅ Sweep richieste scadute OK")
+
+def test_abandoned_request_gets_late_response():
+    """Dopo la decisione locale la risposta tardiva viene ancora associata"""
+    expired = []
+    mux = AuthRequestMultiplexer(on_abandoned_expired=expired.append)
+
+    late = mux.register('AAAA0001', timeout=1)
+    assert mux.wait(late, timeout=0.01) is None
+    assert mux.abandon(late, {'authorized': True}) is None
+
+    resolved = mux.resolve({'request_id': late.request_id}, {'authorized': False})
+    assert resolved is late
+    assert resolved.local_result['authorized'] is True
+    assert mux.get_status()['stats']['late_responses'] == 1
+
+    # Mai risposta: notificata alla scadenza
+    silent = mux.register('BBBB0002', timeout=0.01)
+    mux.abandon(silent, {'authorized': True})
+    time.sleep(0.02)
+    mux.sweep()
+    assert expired == [silent]
+    print("✅ Risposta tardiva riconciliata OK")
+
+def test_cache_refresh_does_not_steal_request():
+    """Risposta al badge deciso dalla cache e richiesta reale per la stessa card"""
+    mux = AuthRequestMultiplexer()
+
+    refresh_id = refresh_request_id()               # Tap 1: decisione da cache
+    real = mux.register('AAAA0001', timeout=1)      # Tap 2: cache scaduta, richiesta reale
+
+    assert mux.resolve({'request_id': refresh_id, 'card_uid': 'AAAA0001'}, {'authorized': False}) is None
+    assert not real.event.is_set()
+
+    assert mux.resolve({'request_id': real.request_id, 'card_uid': 'AAAA0001'}, {'authorized': True}) is real
+    assert mux.wait(real)['authorized'] is True
+
+    stats = mux.get_status()['stats']
+    assert stats['refresh_responses'] == 1 and stats['unmatched'] == 0
+    print("✅ Refresh da cache non associato alla richiesta reale OK")
+
+if __name__ == "__main__":
+    print("🧪 TEST MULTIPLEXER AUTH")
+    print("========================")
+
+    test_resolve_by_request_id()
+    test_legacy_response_without_id()
+    test_wakeup_is_immediate()
+    test_late_response_is_discarded()
+    test_sweep_expired()
+    test_abandoned_request_gets_late_response()
+    test_cache_refresh_does_not_steal_request()
+
+    print("\n✅ Tutti i test superati!")
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Test supervisore connessione MQTT
+"""
+import sys
+import os
+import threading
+import time
+
+# Aggiungi src al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from config import Config
+from connection_supervisor import ConnectionSupervisor
+
+class FakeMQTTClient:
+    """Client minimale: i primi N tentativi di connessione falliscono"""
+
+    def __init__(self, failures=0, connected=False):
+        self.is_connected = connected
+        self.connection_listeners = []
+        self.keepalive_rtt_ms = None
+        self.failures = failures
+        self.attempts = 0
+
+    def start_connection(self):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise ConnectionRefusedError("broker non raggiungibile")
+        threading.Timer(0.01, self.simulate_connect).start()
+
+    def stop_connection(self):
+        self.is_connected = False
+
+    def simulate_connect(self):
+        self.is_connected = True
+        for listener in list(self.connection_listeners):
+            listener(True, 0)
+
+    def simulate_disconnect(self):
+        self.is_connected = False
+        for listener in list(self.connection_listeners):
+            listener(False, 1)
+
+def make_supervisor(client):
+    supervisor = ConnectionSupervisor(client)
+    supervisor.backoff_min = 0.05
+    supervisor.backoff_max = 0.2
+    supervisor.connect_timeout = 1
+    supervisor.watchdog_interval = 0.05
+    return supervisor
+
+def wait_for(predicate, timeout=3):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+def test_backoff_then_connect():
+    """Tentativi falliti con backoff, poi connessione"""
+    client = FakeMQTTClient(failures=2)
+    supervisor = make_supervisor(client)
+    supervisor.start()
+
+    assert supervisor.wait_online(3)
+    assert client.attempts == 3
+    status = supervisor.get_status()
+    assert status['state'] == ConnectionSupervisor.ONLINE
+    assert status['stats']['connect_failures'] == 2
+    assert status['stats']['last_backoff_s'] is not None
+    assert status['attempts'] == 0
+    supervisor.stop()
+    print("✅ Backoff e connessione OK")
+
+def test_backoff_is_bounded():
+    """Il ritardo cresce in modo esponenziale ma resta entro il massimo"""
+    supervisor = make_supervisor(FakeMQTTClient())
+    for attempts in range(1, 12):
+        supervisor._attempts = attempts
+        ceiling = min(supervisor.backoff_max, supervisor.backoff_min * (2 ** (attempts - 1)))
+        delay = supervisor._backoff_delay()
+        assert ceiling / 2 <= delay <= ceiling
+    print("✅ Limite backoff OK")
+
+def test_listeners_on_disconnect_and_reconnect():
+    """I listener ricevono solo i passaggi online/offline e il client si riconnette"""
+    client = FakeMQTTClient()
+    supervisor = make_supervisor(client)
+    events = []
+    supervisor.add_listener(events.append)
+    supervisor.start()
+
+    assert supervisor.wait_online(3)
+    client.simulate_disconnect()
+    assert wait_for(lambda: events == [True, False, True])
+    assert client.attempts == 2
+    assert supervisor.stats['disconnections'] == 1
+    supervisor.stop()
+    print("✅ Listener disconnessione/riconnessione OK")
+
+def test_degraded_on_slow_keepalive():
+    """RTT keepalive oltre soglia: degraded ma ancora online"""
+    client = FakeMQTTClient()
+    supervisor = make_supervisor(client)
+    events = []
+    supervisor.add_listener(events.append)
+    supervisor.start()
+    assert supervisor.wait_online(3)
+
+    client.keepalive_rtt_ms = Config.CONNECTION_RTT_DEGRADED_MS + 1
+    assert wait_for(lambda: supervisor.state == ConnectionSupervisor.DEGRADED)
+    assert supervisor.is_online()
+
+    client.keepalive_rtt_ms = 5
+    assert wait_for(lambda: supervisor.state == ConnectionSupervisor.ONLINE)
+    assert events == [True]
+    supervisor.stop()
+    print("✅ Stato degraded OK")
+
+def test_passive_mode():
+    """Client già connesso: il supervisore osserva senza riconnettere"""
+    client = FakeMQTTClient(connected=True)
+    supervisor = make_supervisor(client)
+    supervisor.start()
+
+    assert supervisor.is_online()
+    assert not supervisor.manage_connection
+    client.simulate_disconnect()
+    time.sleep(0.2)
+    assert not supervisor.is_online()
+    assert client.attempts == 0
+    supervisor.stop()
+    print("✅ Modalità passiva OK")
+
+def test_offline_manager_wakes_sync():
+    """Il ritorno online sveglia subito la sincronizzazione della coda"""
+    from offline_manager import OfflineManager
+
+    client = FakeMQTTClient(connected=True)
+    supervisor = make_supervisor(client)
+    manager = OfflineManager.__new__(OfflineManager)
+    manager.supervisor = supervisor
+    manager.mqtt_client = client
+    manager.logger = None
+    manager.is_online = True
+    manager.offline_queue = [{'card_info': {}}]
+    manager.stats = {'connection_checks': 0, 'last_connection_check': None}
+    manager._sync_wakeup = threading.Event()
+
+    supervisor.add_listener(manager._on_connection_state_change)
+    supervisor.start()
+
+    client.simulate_disconnect()
+    assert wait_for(lambda: not manager.check_connection())
+    client.simulate_connect()
+    assert manager._sync_wakeup.wait(1)
+    assert manager.check_connection()
+    supervisor.stop()
+    print("✅ Risveglio sincronizzazione OK")
+
+if __name__ == "__main__":
+    print("🧪 TEST SUPERVISORE CONNESSIONE")
+    print("===============================")
+
+    test_backoff_then_connect()
+    test_backoff_is_bounded()
+    test_listeners_on_disconnect_and_reconnect()
+    test_degraded_on_slow_keepalive()
+    test_passive_mode()
+    test_offline_manager_wakes_sync()
+
+    print("\n✅ Tutti i test superati!")
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Test lettori/relè multipli per corsia (hardware simulato)
+"""
+import sys
+import os
+import contextlib
+
+# Aggiungi src al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+os.environ['HARDWARE_BACKEND'] = 'simulated'
+from config import Config
+Config.HARDWARE_BACKEND = 'simulated'
+
+from relay_manager import RelayManager
+
+LANES_ENV = {
+    'RFID_READERS': 'a_in,a_out,b_in',
+    'RFID_A_IN_RST_PIN': '22', 'RFID_A_IN_SDA_PIN': '8', 'RFID_A_IN_LANE': 'a',
+    'RFID_A_OUT_RST_PIN': '25', 'RFID_A_OUT_SDA_PIN': '7', 'RFID_A_OUT_LANE': 'a',
+    'RFID_A_OUT_DIRECTION': 'out',
+    'RFID_B_IN_RST_PIN': '23', 'RFID_B_IN_SDA_PIN': '17', 'RFID_B_IN_LANE': 'b', 'RFID_B_IN_IRQ_PIN': '24',
+    'RELAYS': 'gate_a_in,gate_a_out,gate_b',
+    'RELAY_GATE_A_IN_PIN': '18', 'RELAY_GATE_A_IN_LANE': 'a',
+    'RELAY_GATE_A_OUT_PIN': '19', 'RELAY_GATE_A_OUT_LANE': 'a', 'RELAY_GATE_A_OUT_DIRECTION': 'out',
+    'RELAY_GATE_B_PIN': '20', 'RELAY_GATE_B_LANE': 'b', 'RELAY_GATE_B_ACTIVE_TIME': '0.5',
+}
+
+@contextlib.contextmanager
+def lane_config(env=None, **overrides):
+    """Applica temporaneamente variabili d'ambiente e valori di Config"""
+    env = env or {}
+    saved_env = {key: os.environ.get(key) for key in env}
+    saved_config = {key: getattr(Config, key) for key in overrides}
+    os.environ.update(env)
+    for key, value in overrides.items():
+        setattr(Config, key, value)
+    try:
+        yield
+    finally:
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        for key, value in saved_config.items():
+            setattr(Config, key, value)
+
+def lanes():
+    return lane_config(LANES_ENV, RFID_READERS=LANES_ENV['RFID_READERS'], RELAYS=LANES_ENV['RELAYS'])
+
+def test_legacy_in_out_definitions():
+    """Senza liste esplicite valgono le variabili RFID_IN_*/RELAY_OUT_*"""
+    with lane_config(RFID_READERS='', RELAYS='', BIDIRECTIONAL_MODE=True, RFID_IN_ENABLE=True,
+                     RFID_OUT_ENABLE=False, RELAY_IN_ENABLE=True, RELAY_OUT_ENABLE=True):
+        readers = Config.get_reader_definitions()
+        relays = Config.get_relay_definitions()
+
+    assert [(r['id'], r['direction'], r['lane']) for r in readers] == [('in', 'in', Config.DEFAULT_LANE)]
+    assert readers[0]['sda_pin'] == Config.RFID_IN_SDA_PIN
+    assert [r['id'] for r in relays] == ['in', 'out']
+    assert relays[1]['pin'] == Config.RELAY_OUT_PIN
+    print("✅ Definizioni IN/OUT classiche OK")
+
+def test_lane_definitions_and_validation():
+    """Lettori e relè per corsia dalle variabili RFID_<ID>_*/RELAY_<ID>_*"""
+    with lanes():
+        readers = {r['id']: r for r in Config.get_reader_definitions()}
+        relays = {r['id']: r for r in Config.get_relay_definitions()}
+
+        assert readers['a_out']['direction'] == 'out'
+        assert readers['a_in']['irq_pin'] is None
+        assert readers['b_in'] == {'id': 'b_in', 'direction': 'in', 'lane': 'b',
+                                   'rst_pin': 23, 'sda_pin': 17, 'irq_pin': 24}
+        assert relays['gate_b']['active_time'] == 0.5
+        assert Config.validate_config() == []
+
+        with lane_config({'RELAY_GATE_B_PIN': '19'}):
+            assert any('GPIO 19' in error for error in Config.validate_config())
+    print("✅ Definizioni per corsia OK")
+
+def test_relay_routing_by_lane():
+    """Ogni card apre il relè della propria corsia, mai quello di un'altra"""
+    with lanes():
+        manager = RelayManager()
+        assert manager.initialize()
+        try:
+            assert manager.route('a', 'in') == 'gate_a_in'
+            assert manager.route('a', 'out') == 'gate_a_out'
+            assert manager.route('b', 'out') == 'gate_b'  # Unico relè della corsia B
+            assert manager.route('c', 'in') is None
+            assert manager.get_all_status()['relays']['gate_a_out']['lane'] == 'a'
+        finally:
+            manager.cleanup()
+    print("✅ Instradamento per corsia OK")
+
+if __name__ == "__main__":
+    print("🧪 TEST CORSIE MULTIPLE")
+    print("=======================")
+
+    test_legacy_in_out_definitions()
+    test_lane_definitions_and_validation()
+    test_relay_routing_by_lane()
+
+    print("\n✅ Tutti i test superati!")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Test registro metriche ed endpoint Prometheus
+"""
+import sys
+import os
+import threading
+import urllib.request
+
+# Aggiungi src al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from metrics import MetricsRegistry, MetricsServer
+
+def test_exposition_format():
+    """Contatori, gauge e istogrammi nel formato testo Prometheus"""
+    registry = MetricsRegistry()
+    reads = registry.counter('rfid_reads_total', 'Letture', ('reader',))
+    depth = registry.gauge('card_queue_depth', 'Coda')
+    latency = registry.histogram('auth_latency_seconds', 'Latenza', ('source',), buckets=(0.01, 0.1))
+
+    reads.labels('in').inc()
+    reads.labels(reader='in').inc(2)
+    depth.set_function(lambda: 4)
+    for value in (0.005, 0.01, 0.05, 3.0):
+        latency.labels('online').observe(value)
+
+    text = registry.expose()
+    assert '# TYPE rfid_reads_total counter' in text
+    assert 'rfid_reads_total{reader="in"} 3' in text
+    assert 'card_queue_depth 4' in text
+    assert 'auth_latency_seconds_bucket{source="online",le="0.01"} 2' in text
+    assert 'auth_latency_seconds_bucket{source="online",le="0.1"} 3' in text
+    assert 'auth_latency_seconds_bucket{source="online",le="+Inf"} 4' in text
+    assert 'auth_latency_seconds_count{source="online"} 4' in text
+
+    # Registrazione ripetuta: stessa metrica
+    assert registry.counter('rfid_reads_total', 'Letture', ('reader',)) is reads
+    print("✅ Formato Prometheus OK")
+
+def test_concurrent_increments_not_lost():
+    registry = MetricsRegistry()
+    counter = registry.counter('events_total', 'Eventi', ('reader',))
+    histogram = registry.histogram('lag_seconds', 'Lag')
+
+    def worker():
+        child = counter.labels('in')
+        for _ in range(5000):
+            child.inc()
+            histogram.observe(0.001)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert counter.value('in') == 20000
+    assert histogram.labels().snapshot()[2] == 20000
+    print("✅ Incrementi concorrenti OK")
+
+def test_http_endpoint():
+    registry = MetricsRegistry()
+    registry.counter('relay_activations_total', 'Attivazioni', ('relay',)).labels('in').inc()
+
+    server = MetricsServer(registry, host='127.0.0.1', port=0)
+    assert server.start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics", timeout=2) as response:
+            assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+            body = response.read().decode('utf-8')
+        assert 'relay_activations_total{relay="in"} 1' in body
+    finally:
+        server.stop()
+    print("✅ Endpoint HTTP OK")
+
+if __name__ == "__main__":
+    print("🧪 TEST METRICHE")
+    print("================")
+
+    test_exposition_format()
+    test_concurrent_increments_not_lost()
+    test_http_endpoint()
+
+    print("\n✅ Tutti i test superati!")
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Test journal append-only della coda offline
+"""
+import sys
+import os
+import json
+import tempfile
+
+# Aggiungi src al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from config import Config
+from offline_journal import OfflineJournal
+
+def make_entry(index):
+    return {
+        'timestamp': f"2026-01-01T00:00:{index:02d}",
+        'card_info': {'uid_formatted': f"CARD{index:04d}", 'direction': 'in', 'raw_id': index},
+        'offline_authorized': True,
+        'offline_message': 'ok',
+        'sync_attempts': 0
+    }
+
+def open_journal(directory, **kwargs):
+    options = {'segment_max_records': 4, 'max_segments': 3, 'fsync': False}
+    options.update(kwargs)
+    journal = OfflineJournal(directory=directory, **options)
+    return journal, journal.load()
+
+def test_append_and_replay():
+    """Gli eventi sopravvivono alla riapertura, quelli rimossi no"""
+    with tempfile.TemporaryDirectory() as tmp:
+        journal, entries = open_journal(tmp)
+        assert entries == []
+
+        appended = [make_entry(i) for i in range(6)]
+        for entry in appended:
+            journal.append(entry)
+        assert [e['journal_seq'] for e in appended] == [1, 2, 3, 4, 5, 6]
+
+        journal.delete([2, 5])
+        journal.close()
+
+        journal, entries = open_journal(tmp)
+        assert [e['journal_seq'] for e in entries] == [1, 3, 4, 6]
+        assert entries[0]['card_info']['uid_formatted'] == 'CARD0000'
+
+        # Le sequenze riprendono dopo l'ultima
+        assert journal.append(make_entry(7)) == 7
+        journal.close()
+    print("✅ Append e replay OK")
+
+def test_dead_segments_removed():
+    """I segmenti più vecchi senza eventi vivi vengono eliminati"""
+    with tempfile.TemporaryDirectory() as tmp:
+        journal, _ = open_journal(tmp)
+
+        entries = [make_entry(i) for i in range(8)]
+        for entry in entries:
+            journal.append(entry)
+        assert journal.get_status()['segments'] == 2
+
+        journal.delete([e['journal_seq'] for e in entries[:4]])
+        status = journal.get_status()
+        assert status['segments'] < 3
+        assert status['stats']['segments_removed'] >= 1
+        assert status['live_events'] == 4
+        journal.close()
+    print("✅ Rimozione segmenti OK")
+
+def test_torn_write_is_discarded():
+    """Riga finale incompleta (crash) scartata senza perdere gli eventi precedenti"""
+    with tempfile.TemporaryDirectory() as tmp:
+        journal, _ = open_journal(tmp, segment_max_records=100)
+        for i in range(3):
+            journal.append(make_entry(i))
+        journal.close()
+
+        segment = os.path.join(tmp, sorted(os.listdir(tmp))[-1])
+        with open(segment, 'ab') as f:
+            f.write(b'1234abcd {"op":"add","seq":4,"ent')
+
+        journal, entries = open_journal(tmp, segment_max_records=100)
+        assert [e['journal_seq'] for e in entries] == [1, 2, 3]
+        assert journal.get_status()['stats']['truncated_bytes'] > 0
+
+        # La scrittura successiva riparte da una riga valida
+        journal.append(make_entry(4))
+        journal.close()
+
+        journal, entries = open_journal(tmp, segment_max_records=100)
+        assert [e['journal_seq'] for e in entries] == [1, 2, 3, 4]
+        journal.close()
+    print("✅ Scrittura interrotta OK")
+
+def test_checksum_mismatch_skipped():
+    """Una riga con checksum errato viene ignorata"""
+    with tempfile.TemporaryDirectory() as tmp:
+        journal, _ = open_journal(tmp, segment_max_records=100)
+        for i in range(3):
+            journal.append(make_entry(i))
+        journal.close()
+
+        segment = os.path.join(tmp, sorted(os.listdir(tmp))[-1])
+        with open(segment, 'rb') as f:
+            lines = f.read().splitlines(keepends=True)
+        lines[1] = lines[1].replace(b'CARD0001', b'CARD9999')
+        with open(segment, 'wb') as f:
+            f.writelines(lines)
+
+        journal, entries = open_journal(tmp, segment_max_records=100)
+        assert [e['journal_seq'] for e in entries] == [1, 3]
+        assert journal.get_status()['stats']['corrupted_records'] == 1
+        journal.close()
+    print("✅ Checksum errato OK")
+
+def test_compaction():
+    """La compattazione lascia un solo segmento con gli eventi vivi"""
+    with tempfile.TemporaryDirectory() as tmp:
+        journal, _ = open_journal(tmp, segment_max_records=2, max_segments=2)
+
+        entries = [make_entry(i) for i in range(10)]
+        for entry in entries:
+            journal.append(entry)
+        # Il primo evento resta bloccato: i segmenti non possono essere eliminati
+        journal.delete([e['journal_seq'] for e in entries[1:9]])
+        assert journal.needs_compaction()
+
+        live = [entries[0], entries[9]]
+        journal.compact(live)
+        assert journal.get_status()['segments'] == 1
+        journal.append(make_entry(10))
+        journal.close()
+
+        journal, reloaded = open_journal(tmp, segment_max_records=2, max_segments=2)
+        assert [e['journal_seq'] for e in reloaded] == [1, 10, 11]
+        journal.close()
+    print("✅ Compattazione OK")
+
+def test_offline_manager_uses_journal():
+    """OfflineManager: evento nel journal, coda ricaricata e migrazione formato JSON"""
+    from offline_manager import OfflineManager
+
+    original_dir = Config.LOG_DIRECTORY
+    with tempfile.TemporaryDirectory() as tmp:
+        Config.LOG_DIRECTORY = tmp
+        try:
+            # Coda del formato precedente
+            with open(os.path.join(tmp, Config.OFFLINE_STORAGE_FILE), 'w', encoding='utf-8') as f:
+                json.dump({'queue_data': [make_entry(1)]}, f)
+
+            manager = OfflineManager()
+            assert manager.get_queue_size() == 1
+            assert os.path.exists(os.path.join(tmp, Config.OFFLINE_STORAGE_FILE + ".migrated"))
+
+            manager._add_to_offline_queue({'uid_formatted': 'AABBCCDD', 'direction': 'in', 'raw_id': 1}, True, 'ok')
+            manager.journal.close()
+
+            reloaded = OfflineManager()
+            items = reloaded.get_queue_items()
+            assert [i['card_info']['uid_formatted'] for i in items] == ['CARD0001', 'AABBCCDD']
+
+            reloaded._remove_from_queue(items[:1])
+            assert reloaded.get_queue_size() == 1
+            reloaded.journal.close()
+
+            assert OfflineManager().get_queue_size() == 1
+        finally:
+            Config.LOG_DIRECTORY = original_dir
+    print("✅ Integrazione OfflineManager OK")
+
+if __name__ == "__main__":
+    print("🧪 TEST JOURNAL CODA OFFLINE")
+    print("============================")
+
+    test_append_and_replay()
+    test_dead_segments_removed()
+    test_torn_write_is_discarded()
+    test_checksum_mismatch_skipped()
+    test_compaction()
+    test_offline_manager_uses_journal()
+
+    print("\n✅ Tutti i test superati!")
@@ -4,6 +4,7 @@ Test specifico per verificare modalità offline e relè
 """
 import sys
 import os
+import tempfile
 sys.path.insert(0, 'src')
 
 from config import Config
@@ -12,6 +13,16 @@ from relay_manager import RelayManager
 from logger import AccessLogger
 
 def test_offline_relay():
+    # Coda, journal e log in una directory temporanea: i file in logs/ restano intatti
+    original_dir = Config.LOG_DIRECTORY
+    with tempfile.TemporaryDirectory() as tmp:
+        Config.LOG_DIRECTORY = tmp
+        try:
+            return run_offline_relay()
+        finally:
+            Config.LOG_DIRECTORY = original_dir
+
+def run_offline_relay():
     print("🧪 TEST MODALITÀ OFFLINE E RELÈ")
     print("="*50)
     
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test overflow della coda offline su segmenti compressi
+"""
+import sys
+import os
+import tempfile
+
+# Aggiungi src al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from config import Config
+from offline_manager import OfflineManager
+from offline_spill import OfflineSpill
+from test_offline_sync import FakeMQTTClient, offline_manager
+
+def make_entry(seq):
+    return {'event_seq': seq, 'card_info': {'uid_formatted': f"CARD{seq:04d}"}, 'journal_seq': 99}
+
+def test_segments_sealed_and_reloaded():
+    with tempfile.TemporaryDirectory() as tmp:
+        spill = OfflineSpill(directory=tmp, max_bytes=1 << 20, segment_events=4, fsync=False)
+        spill.load()
+        for seq in range(1, 11):
+            spill.append(make_entry(seq))
+
+        names = sorted(os.listdir(tmp))
+        assert [name.endswith('.jsonl.gz') for name in names] == [True, True, False]
+        spill.close()
+
+        # Scrittura interrotta nel segmento attivo
+        with open(os.path.join(tmp, names[-1]), 'ab') as f:
+            f.write(b'0000 {"event_seq"')
+
+        reloaded = OfflineSpill(directory=tmp, max_bytes=1 << 20, segment_events=4, fsync=False)
+        assert reloaded.load() == 10
+
+        seqs = []
+        while not reloaded.is_empty():
+            segment_id, entries = reloaded.take_oldest()
+            seqs += [entry['event_seq'] for entry in entries]
+            assert 'journal_seq' not in entries[0]
+            reloaded.release(segment_id)
+        assert seqs == list(range(1, 11))
+        assert os.listdir(tmp) == []
+    print("✅ Segmenti compressi e ricaricati OK")
+
+def test_byte_limit_drops_oldest_segment():
+    with tempfile.TemporaryDirectory() as tmp:
+        spill = OfflineSpill(directory=tmp, max_bytes=400, segment_events=5, fsync=False)
+        spill.load()
+        for seq in range(1, 41):
+            spill.append(make_entry(seq))
+
+        status = spill.get_status()
+        assert status['bytes'] <= 400 + 5 * 100
+        assert status['stats']['dropped_events'] > 0
+        assert status['events'] == 40 - status['stats']['dropped_events']
+
+        _, entries = spill.take_oldest()
+        assert entries[0]['event_seq'] == status['stats']['dropped_events'] + 1
+    print("✅ Limite in byte OK")
+
+def test_manager_spills_and_streams_back_in_order():
+    """Memoria limitata durante l'interruzione, tutto inviato in ordine alla riconnessione"""
+    mqtt_client = FakeMQTTClient()
+    with offline_manager(mqtt_client, events=23, OFFLINE_MAX_QUEUE_SIZE=5, OFFLINE_SPILL_SEGMENT_EVENTS=4,
+                         OFFLINE_SPILL_MAX_BYTES=1 << 20, OFFLINE_SYNC_BATCH_SIZE=2) as manager:
+        assert len(manager.offline_queue) == 5
+        assert manager.get_queue_size() == 23
+        manager.journal.close()
+        manager.spill.close()
+
+        manager = OfflineManager(mqtt_client)
+        assert manager.get_queue_size() == 23 and len(manager.offline_queue) <= 5
+        manager.is_online = True
+
+        queue_sizes = []
+        publish = mqtt_client.client.publish
+        def tracking_publish(*args, **kwargs):
+            queue_sizes.append(len(manager.offline_queue))
+            return publish(*args, **kwargs)
+        mqtt_client.client.publish = tracking_publish
+
+        manager.sync_offline_data()
+
+        sent = [event['card_uid'] for _, batch in mqtt_client.client.messages for event in batch['events']]
+        assert sent == [f"CARD{i:04d}" for i in range(23)]
+        assert max(queue_sizes) <= 5
+        assert manager.get_queue_size() == 0
+        manager.journal.close()
+        assert OfflineManager(mqtt_client).get_queue_size() == 0
+    print("✅ Spill e sync in ordine OK")
+
+if __name__ == "__main__":
+    print("🧪 TEST SPILL CODA OFFLINE")
+    print("==========================")
+
+    test_segments_sealed_and_reloaded()
+    test_byte_limit_drops_oldest_segment()
+    test_manager_spills_and_streams_back_in_order()
+
+    print("\n✅ Tutti i test superati!")
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Test sync audit offline a batch con finestra di publish confermate (PUBACK)
+"""
+import sys
+import os
+import json
+import tempfile
+import threading
+import contextlib
+
+# Aggiungi src al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from config import Config
+from offline_manager import OfflineManager
+from publish_window import PublishWindow
+from event_sequence import EventSequence, AckCursor
+
+class PublishInfo:
+    def __init__(self, rc, mid):
+        self.rc = rc
+        self.mid = mid
+
+class FakeBroker:
+    """Client paho finto: conferma (on_publish) le publish QoS1 su richiesta"""
+
+    def __init__(self, owner, auto_ack=True):
+        self.owner = owner
+        self.auto_ack = auto_ack
+        self.messages = []
+        self.unacked = []
+        self.max_in_flight = 0
+        self._mid = 0
+        self._lock = threading.Lock()
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        with self._lock:
+            self._mid += 1
+            mid = self._mid
+            self.messages.append((topic, json.loads(payload)))
+            self.unacked.append(mid)
+            self.max_in_flight = max(self.max_in_flight, len(self.unacked))
+
+        if self.auto_ack:
+            # PUBACK dal thread di rete, a volte prima che publish ritorni
+            ack = threading.Timer(0.001 * (mid % 3), self.ack, args=(mid,))
+            ack.start()
+        return PublishInfo(0, mid)
+
+    def ack(self, mid):
+        with self._lock:
+            self.unacked.remove(mid)
+        self.owner._on_publish(None, None, mid)
+
+class FakeMQTTClient:
+    def __init__(self, auto_ack=True):
+        self.is_connected = True
+        self.publish_listeners = []
+        self.client = FakeBroker(self, auto_ack)
+
+    def add_publish_listener(self, listener):
+        self.publish_listeners.append(listener)
+
+    def remove_publish_listener(self, listener):
+        self.publish_listeners.remove(listener)
+
+    def _on_publish(self, client, userdata, mid):
+        for listener in list(self.publish_listeners):
+            listener(mid)
+
+@contextlib.contextmanager
+def offline_manager(mqtt_client, events, **overrides):
+    """OfflineManager online con `events` eventi in coda, in una directory temporanea"""
+    settings = dict(OFFLINE_SYNC_BATCH_SIZE=3, OFFLINE_SYNC_BATCH_BYTES=16384,
+                    OFFLINE_SYNC_WINDOW=2, OFFLINE_SYNC_ACK_TIMEOUT=1.0, OFFLINE_JOURNAL_FSYNC=False)
+    settings.update(overrides)
+    saved = {key: getattr(Config, key) for key in list(settings) + ['LOG_DIRECTORY']}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for key, value in dict(settings, LOG_DIRECTORY=tmp).items():
+            setattr(Config, key, value)
+        try:
+            manager = OfflineManager(mqtt_client)
+            for i in range(events):
+                card_info = {'uid_formatted': f"CARD{i:04d}", 'direction': 'in', 'raw_id': i}
+                manager._add_to_offline_queue(card_info, True, 'ok')
+            manager.is_online = True
+            yield manager
+            manager.journal.close()
+        finally:
+            for key, value in saved.items():
+                setattr(Config, key, value)
+
+def test_publish_window_early_ack():
+    """PUBACK arrivato prima di track(): la publish risulta comunque confermata"""
+    window = PublishWindow(size=1)
+    window.on_publish(7)
+    window.track(7, 'a')
+    window.track(8, 'b')
+    assert not window.wait_slot(0.01)
+    assert window.take_acked() == ['a']
+    assert window.abandon() == ['b']
+    print("✅ Finestra publish OK")
+
+def test_publish_window_ignores_unrelated_acks():
+    """PUBACK di altre publish del client: memoria limitata durante la sync"""
+    window = PublishWindow(size=2)
+    for mid in range(1000, 6000):
+        window.on_publish(mid)  # Badge, heartbeat, status
+    assert len(window._early) == PublishWindow.EARLY_LIMIT
+
+    window.on_publish(7)
+    window.track(7, 'a')
+    window.track(1000, 'b')  # PUBACK non più ricordato: resta in volo
+    assert window.take_acked() == ['a']
+    assert window.abandon() == ['b']
+    assert not window._early
+    print("✅ PUBACK estranei limitati OK")
+
+def test_batched_sync_removes_acked_events():
+    mqtt_client = FakeMQTTClient()
+    with offline_manager(mqtt_client, events=7) as manager:
+        manager.sync_offline_data()
+
+        batches = [payload for _, payload in mqtt_client.client.messages]
+        assert [batch['count'] for batch in batches] == [3, 3, 1]
+        assert batches[0]['sync_type'] == 'offline_audit_batch'
+        assert [event['card_uid'] for event in batches[2]['events']] == ['CARD0006']
+        assert mqtt_client.client.max_in_flight <= 2
+        assert manager.get_queue_size() == 0
+        assert mqtt_client.publish_listeners == []
+
+        # Dopo il riavvio il journal è vuoto
+        assert OfflineManager(mqtt_client).get_queue_size() == 0
+    print("✅ Sync a batch OK")
+
+def test_byte_limit_splits_batches():
+    mqtt_client = FakeMQTTClient()
+    with offline_manager(mqtt_client, events=4, OFFLINE_SYNC_BATCH_SIZE=50,
+                         OFFLINE_SYNC_BATCH_BYTES=600) as manager:
+        manager.sync_offline_data()
+        counts = [payload['count'] for _, payload in mqtt_client.client.messages]
+        assert len(counts) > 1 and sum(counts) == 4
+        assert manager.get_queue_size() == 0
+    print("✅ Limite byte per batch OK")
+
+def test_unacked_batches_stay_queued():
+    """Senza PUBACK gli eventi restano in coda (anche dopo il riavvio)"""
+    mqtt_client = FakeMQTTClient(auto_ack=False)
+    with offline_manager(mqtt_client, events=5, OFFLINE_SYNC_ACK_TIMEOUT=0.05) as manager:
+        manager.sync_offline_data()
+
+        assert len(mqtt_client.client.messages) == 2  # Finestra piena, sync sospesa
+        assert manager.get_queue_size() == 5
+        assert all(item['sync_attempts'] == 1 for item in manager.get_queue_items()[:3])
+
+        # Broker di nuovo attivo: tutto reinviato e confermato
+        mqtt_client.client.auto_ack = True
+        mqtt_client.client.messages.clear()
+        manager.sync_offline_data()
+        assert manager.get_queue_size() == 0
+        assert OfflineManager(mqtt_client).get_queue_size() == 0
+    print("✅ Batch non confermati in coda OK")
+
+def test_event_sequence_survives_restart():
+    """Numeri monotoni anche dopo un riavvio (a blocchi: buchi sì, ripetizioni no)"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'seq.json')
+        sequence = EventSequence(path, block=10)
+        assert [sequence.next() for _ in range(3)] == [1, 2, 3]
+
+        restarted = EventSequence(path, block=10)
+        assert restarted.next() == 11
+
+        cursor = AckCursor(os.path.join(tmp, 'cursor.json'))
+        assert cursor.advance(5) and not cursor.advance(4)
+        assert cursor.mark([5, 3, 4]) == 3 and cursor.mark([4]) == 0
+        reloaded = AckCursor(os.path.join(tmp, 'cursor.json'))
+        assert reloaded.acked_seq == 5
+        assert reloaded.is_acked(3) and reloaded.is_acked(5)
+        assert not reloaded.is_acked(2) and not reloaded.is_acked(6)
+    print("✅ Sequenza eventi persistente OK")
+
+def test_server_ack_advances_cursor():
+    """Ack del server: eventi confermati fuori dalla coda, anche al riavvio"""
+    mqtt_client = FakeMQTTClient(auto_ack=False)
+    with offline_manager(mqtt_client, events=5, OFFLINE_SYNC_WINDOW=5,
+                         OFFLINE_SYNC_ACK_TIMEOUT=0.05) as manager:
+        seqs = [item['event_seq'] for item in manager.get_queue_items()]
+        assert seqs == sorted(set(seqs))
+
+        # Inviati ma PUBACK perso: li conferma l'ack del server
+        manager.sync_offline_data()
+        assert manager.handle_audit_ack(seqs[1]) == 2
+        assert manager.handle_audit_ack(seqs[0]) == 0  # Ack vecchio ignorato
+        assert [item['event_seq'] for item in manager.get_queue_items()] == seqs[2:]
+
+        # Crash tra ack e journal: al riavvio gli eventi acquisiti vengono scartati
+        manager.ack_cursor.mark(seqs[2:4])
+        reloaded = OfflineManager(mqtt_client)
+        assert [item['event_seq'] for item in reloaded.get_queue_items()] == seqs[4:]
+
+        # I nuovi eventi proseguono la sequenza
+        reloaded._add_to_offline_queue({'uid_formatted': 'NEW', 'direction': 'in', 'raw_id': 9}, True, 'ok')
+        assert reloaded.get_queue_items()[-1]['event_seq'] > seqs[-1]
+        reloaded.journal.close()
+    print("✅ Cursore ack server OK")
+
+def test_sync_skips_acked_and_sends_seq():
+    mqtt_client = FakeMQTTClient()
+    with offline_manager(mqtt_client, events=4) as manager:
+        seqs = [item['event_seq'] for item in manager.get_queue_items()]
+        manager.ack_cursor.mark([seqs[0]])  # Ack arrivato, evento ancora in coda
+
+        manager.sync_offline_data()
+        batches = [payload for _, payload in mqtt_client.client.messages]
+        sent = [event['event_seq'] for batch in batches for event in batch['events']]
+        assert sent == seqs[1:]
+        assert batches[0]['first_seq'] == seqs[1]
+        assert manager.stats['acked_skipped'] == 1
+        assert manager.get_queue_size() == 0
+    print("✅ Sync dal cursore OK")
+
+def test_out_of_order_ack_keeps_unsent_events():
+    """Seq N+1 in coda, inviato e confermato prima che arrivi N: N va comunque inviato"""
+    mqtt_client = FakeMQTTClient(auto_ack=False)
+    with offline_manager(mqtt_client, events=0, OFFLINE_SYNC_ACK_TIMEOUT=0.05) as manager:
+        first, second = manager.sequence.next(), manager.sequence.next()
+
+        manager._add_to_offline_queue({'uid_formatted': 'B', 'direction': 'in', 'raw_id': 2,
+                                       'event_seq': second}, True, 'ok')
+        manager.sync_offline_data()  # PUBACK perso
+        assert manager.handle_audit_ack(second) == 1
+
+        # Il worker dell'altro lettore accoda N solo ora
+        manager._add_to_offline_queue({'uid_formatted': 'A', 'direction': 'out', 'raw_id': 1,
+                                       'event_seq': first}, True, 'ok')
+        assert not manager.ack_cursor.is_acked(first)
+        assert [item['event_seq'] for item in manager.get_queue_items()] == [first]
+        assert manager.handle_audit_ack(second) == 0  # Ack ripetuto: N non ancora inviato
+
+        mqtt_client.client.auto_ack = True
+        mqtt_client.client.messages.clear()
+        manager.sync_offline_data()
+        sent = [event['event_seq'] for _, batch in mqtt_client.client.messages for event in batch['events']]
+        assert sent == [first]
+        assert manager.get_queue_size() == 0
+    print("✅ Ack fuori ordine non scarta eventi non inviati OK")
+
+def test_ack_cursor_stays_bounded_with_gaps():
+    """Numeri con buchi (tap online): il cursore non cresce con gli ack"""
+    mqtt_client = FakeMQTTClient(auto_ack=False)
+    with offline_manager(mqtt_client, events=0) as manager:
+        for i in range(2000):
+            seq = manager.sequence.next()
+            manager.sequence.next()  # Consumato da un tap online
+            manager._add_to_offline_queue({'uid_formatted': f"CARD{i:04d}", 'direction': 'in',
+                                           'raw_id': i, 'event_seq': seq}, True, 'ok')
+            manager._sent_seqs.add(seq)  # Inviato, PUBACK perso
+            assert manager.handle_audit_ack(seq) == 1
+
+        assert manager.get_queue_size() == 0
+        assert manager.ack_cursor.range_count() == 0
+        assert os.path.getsize(manager.ack_cursor.path) < 200
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cursor = AckCursor(os.path.join(tmp, 'cursor.json'))
+        cursor.mark(range(1, 6000, 2))
+        assert cursor.range_count() == 3000
+        # Ancora in coda: 5001 e successivi
+        assert cursor.prune(5001) and cursor.range_count() == 500
+        assert cursor.is_acked(5001) and not cursor.is_acked(4999)
+        assert not cursor.prune(5001)
+        assert AckCursor(os.path.join(tmp, 'cursor.json')).range_count() == 500
+    print("✅ Cursore ack limitato con numeri non contigui OK")
+
+if __name__ == "__main__":
+    print("🧪 TEST SYNC AUDIT OFFLINE")
+    print("==========================")
+
+    test_publish_window_early_ack()
+    test_publish_window_ignores_unrelated_acks()
+    test_batched_sync_removes_acked_events()
+    test_byte_limit_splits_batches()
+    test_unacked_batches_stay_queued()
+    test_event_sequence_survives_restart()
+    test_server_ack_advances_cursor()
+    test_sync_skips_acked_and_sends_seq()
+    test_out_of_order_ack_keeps_unsent_events()
+    test_ack_cursor_stays_bounded_with_gaps()
+
+    print("\n✅ Tutti i test superati!")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Test tracciamento presenza card
+"""
+import sys
+import os
+
+# Aggiungi src al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from presence_tracker import PresenceTracker, PRESENT, REMOVED
+
+def make_tracker(**kwargs):
+    options = {'presence_timeout': 1.0, 'debounce_time': 2.0, 'max_cards': 16}
+    options.update(kwargs)
+    return PresenceTracker(**options)
+
+def test_resting_card_single_event():
+    """Una card appoggiata genera un solo evento finché resta vista"""
+    tracker = make_tracker()
+
+    assert tracker.observe(0xA, now=0.0)
+    for step in range(1, 20):
+        assert not tracker.observe(0xA, now=step * 0.5)  # 10s appoggiata
+
+    assert tracker.state(0xA, now=9.8) == PRESENT
+    assert tracker.state(0xA, now=11.0) == REMOVED
+    assert tracker.observe(0xA, now=11.0)  # Tolta e ripresentata
+    assert tracker.stats['events'] == 2
+    print("✅ Card appoggiata: un evento OK")
+
+def test_alternating_cards_keep_debounce():
+    """A, B, A: la seconda lettura di A resta nel debounce di A"""
+    tracker = make_tracker(presence_timeout=0.2)
+
+    assert tracker.observe(0xA, now=0.0)
+    assert tracker.observe(0xB, now=0.5)
+    assert not tracker.observe(0xA, now=1.0)
+    assert tracker.stats['suppressed_debounce'] == 1
+    assert tracker.observe(0xA, now=2.5)
+    print("✅ Card alternate OK")
+
+def test_bounded_map_and_expiry():
+    """La mappa resta limitata e le voci scadute vengono rimosse"""
+    tracker = make_tracker(max_cards=3)
+
+    for card in range(5):
+        assert tracker.observe(card, now=card * 0.01)
+    assert tracker.get_stats()['tracked'] == 3
+    assert tracker.stats['evictions'] == 2
+
+    assert tracker.observe(99, now=10.0)
+    assert tracker.get_stats()['tracked'] == 1
+    assert tracker.present_cards(now=10.5) == [99]
+    print("✅ Mappa limitata OK")
+
+if __name__ == "__main__":
+    print("🧪 TEST PRESENZA CARD")
+    print("=====================")
+
+    test_resting_card_single_event()
+    test_alternating_cards_keep_debounce()
+    test_bounded_map_and_expiry()
+
+    print("\n✅ Tutti i test superati!")
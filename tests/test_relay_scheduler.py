@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Test scheduler timer relè (hardware simulato)
+"""
+import sys
+import os
+import threading
+import time
+
+# Aggiungi src al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+os.environ['HARDWARE_BACKEND'] = 'simulated'
+from config import Config
+Config.HARDWARE_BACKEND = 'simulated'
+
+from hardware import GPIO
+from relay_controller import RelayController
+from relay_scheduler import RelayScheduler
+
+def make_relay(scheduler, pin, relay_id="in"):
+    relay = RelayController(relay_id=relay_id, gpio_pin=pin, active_time=1, active_low=False,
+                            scheduler=scheduler)
+    assert relay.initialize()
+    return relay
+
+def test_callbacks_in_deadline_order():
+    """Le scadenze vengono servite in ordine, indipendentemente dall'inserimento"""
+    scheduler = RelayScheduler()
+    fired = []
+    done = threading.Event()
+
+    def callback(generation):
+        fired.append(generation)
+        if len(fired) == 3:
+            done.set()
+        return True
+
+    now = time.monotonic()
+    scheduler.schedule(now + 0.06, callback, 3)
+    scheduler.schedule(now + 0.02, callback, 1)
+    scheduler.schedule(now + 0.04, callback, 2)
+
+    assert done.wait(1)
+    assert fired == [1, 2, 3]
+    assert scheduler.stats['max_lateness_ms'] < 50
+    scheduler.stop()
+    print("✅ Ordine scadenze OK")
+
+def test_relay_off_after_duration():
+    """Il relè si spegne alla scadenza senza creare thread per attivazione"""
+    scheduler = RelayScheduler()
+    relay = make_relay(scheduler, 20)
+    threads_before = threading.active_count()
+
+    start = time.monotonic()
+    assert relay.activate(0.1)
+    assert relay.is_active and GPIO.input(20) == GPIO.HIGH
+
+    while relay.is_active and time.monotonic() - start < 1:
+        time.sleep(0.005)
+    elapsed = time.monotonic() - start
+
+    assert not relay.is_active and GPIO.input(20) == GPIO.LOW
+    assert 0.1 <= elapsed < 0.15
+    assert threading.active_count() <= threads_before + 1
+    scheduler.stop()
+    print("✅ Spegnimento a scadenza OK")
+
+def test_reactivation_extends_timer():
+    """Una riattivazione prolunga lo spegnimento senza nuove voci nell'heap"""
+    scheduler = RelayScheduler()
+    relay = make_relay(scheduler, 21)
+
+    start = time.monotonic()
+    relay.activate(0.1)
+    time.sleep(0.05)
+    for _ in range(100):
+        relay.activate(0.1)
+    assert scheduler.pending() == 1
+
+    time.sleep(0.08)
+    assert relay.is_active  # Il primo timer è scaduto ma è stato prolungato
+
+    while relay.is_active and time.monotonic() - start < 1:
+        time.sleep(0.005)
+    assert 0.15 <= time.monotonic() - start < 0.2
+    scheduler.stop()
+    print("✅ Prolungamento timer OK")
+
+def test_force_off_cancels_timer():
+    """Dopo force_off il timer precedente non spegne una nuova attivazione"""
+    scheduler = RelayScheduler()
+    relay = make_relay(scheduler, 22)
+
+    relay.activate(0.05)
+    relay.force_off()
+    relay.activate(0.2)
+
+    time.sleep(0.1)
+    assert relay.is_active
+    time.sleep(0.15)
+    assert not relay.is_active
+    assert scheduler.stats['skipped'] >= 1
+    scheduler.stop()
+    print("✅ Annullamento con force_off OK")
+
+def test_shared_scheduler_multiple_relays():
+    """Un solo scheduler serve relè diversi con durate diverse"""
+    scheduler = RelayScheduler()
+    relay_in = make_relay(scheduler, 23, "in")
+    relay_out = make_relay(scheduler, 24, "out")
+
+    relay_in.activate(0.15)
+    relay_out.activate(0.05)
+    time.sleep(0.1)
+    assert relay_in.is_active and not relay_out.is_active
+    time.sleep(0.1)
+    assert not relay_in.is_active
+    assert scheduler.stats['fired'] == 2
+    scheduler.stop()
+    print("✅ Scheduler condiviso OK")
+
+if __name__ == "__main__":
+    print("🧪 TEST SCHEDULER RELÈ")
+    print("======================")
+
+    test_callbacks_in_deadline_order()
+    test_relay_off_after_duration()
+    test_reactivation_extends_timer()
+    test_force_off_cancels_timer()
+    test_shared_scheduler_multiple_relays()
+
+    print("\n✅ Tutti i test superati!")
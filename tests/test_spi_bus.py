@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Test bus SPI condiviso con più lettori emulati (nessun SPI richiesto)
+"""
+import sys
+import os
+import time
+
+# Aggiungi src al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+os.environ['HARDWARE_BACKEND'] = 'simulated'
+from config import Config
+Config.HARDWARE_BACKEND = 'simulated'
+
+from hardware import HardwareSimulator
+from mfrc522_driver import MFRC522Driver, uid_to_num
+from spi_bus import SPIBus, parse_poll_quotas
+from test_mfrc522_driver import FakeChip
+
+def make_uid(*head):
+    bcc = 0
+    for byte in head:
+        bcc ^= byte
+    return list(head) + [bcc]
+
+class GPIOSelectedSPI:
+    """Un solo device SPI: risponde il chip il cui pin SDA è basso"""
+
+    def __init__(self, gpio, chips):
+        self.gpio = gpio
+        self.chips = chips
+
+    def xfer2(self, data):
+        selected = [pin for pin in self.chips if self.gpio.input(pin) == self.gpio.LOW]
+        assert len(selected) == 1, f"chip select non esclusivo: {selected}"
+        return self.chips[selected[0]].xfer2(data)
+
+    def close(self):
+        pass
+
+def test_parse_poll_quotas():
+    assert parse_poll_quotas('') == (1, {})
+    assert parse_poll_quotas('3') == (3, {})
+    assert parse_poll_quotas('in:2, out:1') == (1, {'in': 2, 'out': 1})
+    print("✅ Parsing quote OK")
+
+def test_hardware_cs_round_robin():
+    """CE0/CE1: ogni lettore riceve solo le proprie card"""
+    uid_in = make_uid(0xC6, 0x7B, 0xD9, 0x05)
+    uid_out = make_uid(0x11, 0x22, 0x33, 0x44)
+    chips = {0: FakeChip(uid=uid_in), 1: FakeChip(uid=uid_out)}
+    bus = SPIBus(spi_factory=lambda device, no_cs: chips[device], idle_sleep=0)
+
+    reader_in = bus.attach('in', MFRC522Driver(bus.channel(8)))
+    reader_out = bus.attach('out', MFRC522Driver(bus.channel(7)))
+
+    assert bus.poll_cycle()
+    assert reader_in.cards.get_nowait() == (uid_to_num(uid_in), None)
+    assert reader_out.cards.get_nowait() == (uid_to_num(uid_out), None)
+
+    try:
+        bus.channel(17)
+        assert False, "SDA non CE accettato senza RFID_SPI_GPIO_CS"
+    except ValueError:
+        pass
+    print("✅ Round robin CE0/CE1 OK")
+
+def test_gpio_cs_three_readers_with_quota():
+    """Tre lettori su GPIO CS: chip select esclusivo e quote rispettate"""
+    gpio = HardwareSimulator().gpio
+    uid = make_uid(0xAA, 0xBB, 0xCC, 0xDD)
+    chips = {8: FakeChip(), 7: FakeChip(), 17: FakeChip(uid=uid)}
+    shared = GPIOSelectedSPI(gpio, chips)
+
+    bus = SPIBus(gpio=gpio, gpio_cs=True, quotas={'a': 3},
+                 spi_factory=lambda device, no_cs: shared, idle_sleep=0)
+    channels = {reader_id: bus.channel(pin) for reader_id, pin in (('a', 8), ('b', 7), ('c', 17))}
+    readers = {reader_id: bus.attach(reader_id, MFRC522Driver(channel))
+               for reader_id, channel in channels.items()}
+
+    assert bus.poll_cycle()
+    assert readers['a'].stats['polls'] == 3
+    assert readers['b'].stats['polls'] == 1
+    assert readers['c'].cards.get_nowait()[0] == uid_to_num(uid)
+    assert readers['a'].cards.empty() and readers['b'].cards.empty()
+    print("✅ GPIO CS con tre lettori OK")
+
+def test_bus_thread_feeds_read():
+    """Il thread del bus alimenta read() e si ferma all'ultimo detach"""
+    uid = make_uid(0x01, 0x02, 0x03, 0x04)
+    bus = SPIBus(spi_factory=lambda device, no_cs: FakeChip(uid=uid), idle_sleep=0.001)
+    reader = bus.attach('in', MFRC522Driver(bus.channel(8)), timeout=1.0)
+
+    assert reader.read() == (uid_to_num(uid), None)
+    assert reader.version() == 0x92
+
+    reader.close()
+    assert not bus.get_status()['running']
+    print("✅ Thread bus OK")
+
+def test_irq_reader_served_on_edge():
+    """Lettore con IRQ: armato senza polling, UID letto solo dopo il fronte"""
+    gpio = HardwareSimulator().gpio
+    uid = make_uid(0x0A, 0x0B, 0x0C, 0x0D)
+    bus = SPIBus(gpio=gpio, spi_factory=lambda device, no_cs: FakeChip(uid=uid),
+                 irq_rearm_interval=10.0)
+    reader = bus.attach('in', MFRC522Driver(bus.channel(8)), irq_pin=24)
+
+    assert not bus.poll_cycle()
+    assert reader.stats['arms'] == 1 and reader.cards.empty()
+
+    gpio.trigger_edge(24)
+    assert bus.poll_cycle()
+    assert reader.cards.get_nowait() == (uid_to_num(uid), None)
+    assert reader.stats['polls'] == 0
+    assert reader.stats['irq_wakeups'] == 1 and reader.stats['arms'] == 2
+
+    # Solo lettori IRQ: il thread dorme fino al riarmo
+    assert bus._idle_wait() > 5
+    print("✅ Lettore IRQ OK")
+
+def test_irq_thread_idle_until_edge():
+    """Il thread del bus non gira a vuoto e si sveglia sul fronte"""
+    gpio = HardwareSimulator().gpio
+    uid = make_uid(0x21, 0x22, 0x23, 0x24)
+    bus = SPIBus(gpio=gpio, spi_factory=lambda device, no_cs: FakeChip(uid=uid),
+                 irq_rearm_interval=10.0)
+    reader = bus.attach('in', MFRC522Driver(bus.channel(8)), irq_pin=24, timeout=1.0)
+
+    bus.start()
+    try:
+        time.sleep(0.1)
+        assert bus.stats['cycles'] <= 2
+
+        gpio.trigger_edge(24)
+        assert reader.read() == (uid_to_num(uid), None)
+    finally:
+        reader.close()
+    print("✅ Thread IRQ inattivo fino al fronte OK")
+
+if __name__ == "__main__":
+    print("🧪 TEST BUS SPI CONDIVISO")
+    print("=========================")
+
+    test_parse_poll_quotas()
+    test_hardware_cs_round_robin()
+    test_gpio_cs_three_readers_with_quota()
+    test_bus_thread_feeds_read()
+    test_irq_reader_served_on_edge()
+    test_irq_thread_idle_until_edge()
+
+    print("\n✅ Tutti i test superati!")
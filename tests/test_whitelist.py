@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Test replica whitelist per decisioni offline
+"""
+import sys
+import os
+import tempfile
+
+# Aggiungi src al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from whitelist import WhitelistReplica
+
+def test_snapshot_lookup():
+    """Ricerca nello snapshot ordinato"""
+    with tempfile.TemporaryDirectory() as tmp:
+        replica = WhitelistReplica(directory=tmp, index_file='wl.idx')
+        assert not replica.is_loaded()
+
+        cards = [f"{i:08X}" for i in range(0, 20000, 2)]
+        replica.apply_snapshot(cards, version=1)
+
+        assert replica.contains('00000000')
+        assert replica.contains('00004E1E')
+        assert replica.contains('c67bd905') is False
+        assert not replica.contains('00000001')
+        assert len(replica) == 10000
+        replica.close()
+    print("✅ Lookup snapshot OK")
+
+def test_deltas_and_persistence():
+    """Delta applicati e ricaricati dopo un riavvio"""
+    with tempfile.TemporaryDirectory() as tmp:
+        replica = WhitelistReplica(directory=tmp, index_file='wl.idx')
+        replica.apply_snapshot(['AAAA0001', 'BBBB0002'], version=1)
+
+        assert replica.apply_delta(add=['CCCC0003'], remove=['AAAA0001'], version=2)
+        # Versione già applicata: ignorato
+        assert not replica.apply_delta(add=['AAAA0001'], version=2)
+        replica.close()
+
+        restored = WhitelistReplica(directory=tmp, index_file='wl.idx')
+        assert restored.load()
+        assert restored.version == 2
+        assert restored.contains('CCCC0003')
+        assert restored.contains('BBBB0002')
+        assert not restored.contains('AAAA0001')
+        assert len(restored) == 2
+        restored.close()
+    print("✅ Delta e persistenza OK")
+
+def test_compaction():
+    """I delta vengono fusi nell'indice oltre la soglia"""
+    with tempfile.TemporaryDirectory() as tmp:
+        replica = WhitelistReplica(directory=tmp, index_file='wl.idx')
+        replica.compact_threshold = 2
+        replica.apply_snapshot(['AAAA0001'], version=1)
+
+        replica.apply_delta(add=['BBBB0002', 'CCCC0003'], version=2)
+
+        status = replica.get_status()
+        assert status['pending_deltas'] == 0
+        assert status['stats']['compactions'] == 1
+        assert not os.path.exists(replica.delta_path)
+        assert replica.contains('CCCC0003')
+        replica.close()
+    print("✅ Compattazione OK")
+
+def test_stale_snapshot_is_ignored():
+    """Uno snapshot più vecchio della versione corrente non annulla i delta"""
+    with tempfile.TemporaryDirectory() as tmp:
+        replica = WhitelistReplica(directory=tmp, index_file='wl.idx')
+        replica.apply_snapshot(['AAAA0001'], version=3)
+        assert replica.apply_delta(add=['BBBB0002'], version=4)
+
+        assert replica.apply_snapshot(['CCCC0003'], version=2) is None
+        assert replica.version == 4
+        assert replica.contains('BBBB0002') and not replica.contains('CCCC0003')
+        assert replica.get_status()['stats']['snapshots_skipped'] == 1
+
+        # Stessa versione o successiva: applicato
+        assert replica.apply_snapshot(['CCCC0003'], version=4) == 1
+        assert replica.contains('CCCC0003') and not replica.contains('BBBB0002')
+        replica.close()
+    print("✅ Snapshot obsoleto ignorato OK")
+
+def test_invalid_uids_are_skipped():
+    """UID troppo lunghi o non ASCII scartati senza bloccare snapshot e delta"""
+    with tempfile.TemporaryDirectory() as tmp:
+        replica = WhitelistReplica(directory=tmp, index_file='wl.idx')
+        replica.compact_threshold = 2
+
+        assert replica.handle_snapshot_message(
+            {'version': 1, 'cards': ['AAAA0001', 'F' * 17, 'CARDÀ001', 'BBBB0002']}) == 2
+        assert replica.contains('AAAA0001') and replica.contains('BBBB0002')
+
+        assert replica.apply_delta(add=['CCCC0003', 'E' * 20], remove=['Ü'], version=2)
+        replica.apply_delta(add=['DDDD0004'], version=3)  # Compattazione
+        assert replica.get_status()['stats']['compactions'] == 1
+        assert replica.contains('CCCC0003') and replica.contains('DDDD0004')
+        assert not replica.contains('E' * 20)
+        assert replica.get_status()['stats']['invalid_uids'] == 4
+        replica.close()
+    print("✅ UID non validi ignorati OK")
+
+def test_delta_without_snapshot_is_ignored():
+    """Senza snapshot i delta non creano una replica parziale"""
+    with tempfile.TemporaryDirectory() as tmp:
+        replica = WhitelistReplica(directory=tmp, index_file='wl.idx')
+        assert not replica.apply_delta(add=['AAAA0001'], version=1)
+        assert not replica.is_loaded()
+    print("✅ Delta senza snapshot ignorato OK")
+
+if __name__ == "__main__":
+    print("🧪 TEST WHITELIST LOCALE")
+    print("========================")
+
+    test_snapshot_lookup()
+    test_deltas_and_persistence()
+    test_compaction()
+    test_stale_snapshot_is_ignored()
+    test_invalid_uids_are_skipped()
+    test_delta_without_snapshot_is_ignored()
+
+    print("\n✅ Tutti i test superati!")
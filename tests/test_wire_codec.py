@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Test codifiche payload MQTT (JSON compatto, CBOR, negoziazione per topic)
+"""
+import sys
+import os
+import json
+
+# Aggiungi src al path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from wire_codec import (JsonCodec, CborCodec, WireCodecs, decode_payload, orjson,
+                        CONTENT_TYPE_CBOR, CONTENT_TYPE_JSON)
+from card_event import CardEvent
+
+SAMPLE = {
+    'card_uid': 'C67BD905',
+    'direzione': 'in',
+    'event_seq': 123456,
+    'negativo': -1000,
+    'grande': 2 ** 40,
+    'ratio': 0.25,
+    'testo': 'àccesso ✅',
+    'card_data': None,
+    'auth_required': True,
+    'lista': [1, 'a', False, {'x': []}]
+}
+
+def test_cbor_roundtrip():
+    codec = CborCodec()
+    encoded = codec.encode(SAMPLE)
+
+    assert codec.decode(encoded) == SAMPLE
+    assert decode_payload(encoded) == SAMPLE  # Riconosciuto dal primo byte
+    assert len(encoded) < len(json.dumps(SAMPLE, ensure_ascii=False).encode('utf-8'))
+
+    # Valori noti da RFC 8949 (appendice A)
+    assert codec.encode(100) == bytes.fromhex('1864')
+    assert codec.encode(-1000) == bytes.fromhex('3903e7')
+    assert codec.encode('IETF') == bytes.fromhex('6449455446')
+    assert codec.decode(bytes.fromhex('f93c00')) == 1.0  # float16
+    try:
+        codec.decode(encoded[:-1])
+        assert False, "CBOR troncato accettato"
+    except ValueError:
+        pass
+    print("✅ Roundtrip CBOR OK")
+
+def test_json_backends():
+    compact = json.dumps(SAMPLE, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    backends = ['stdlib'] + (['orjson'] if orjson is not None else [])
+    for backend in backends:
+        codec = JsonCodec(backend)
+        encoded = codec.encode(SAMPLE)
+        assert encoded == compact
+        assert decode_payload(encoded) == SAMPLE
+    print(f"✅ JSON compatto OK ({', '.join(backends)})")
+
+def test_encode_with_items():
+    header = {'count': 2, 'first_seq': 1}
+    events = [{'event_seq': 1}, {'event_seq': 2, 'card_uid': 'AB'}]
+
+    for codec in (JsonCodec('stdlib'), CborCodec()):
+        payload = codec.encode_with_items(header, 'events', [codec.encode(event) for event in events])
+        assert decode_payload(payload) == dict(header, events=events)
+        assert decode_payload(codec.encode_with_items({}, 'events', [])) == {'events': []}
+    print("✅ Batch con eventi già codificati OK")
+
+def test_negotiation():
+    codecs = WireCodecs(default='json', topics='badge=cbor,offline_audit=cbor', negotiate=True)
+
+    # Senza annuncio del server si resta su JSON
+    assert codecs.codec_for('badge').content_type == CONTENT_TYPE_JSON
+
+    codecs.handle_advert({'accept': {'badge': [CONTENT_TYPE_CBOR, CONTENT_TYPE_JSON]}})
+    assert codecs.codec_for('badge').content_type == CONTENT_TYPE_CBOR
+    assert codecs.codec_for('offline_audit').content_type == CONTENT_TYPE_JSON
+    assert codecs.content_types(['badge', 'status']) == {'badge': CONTENT_TYPE_CBOR,
+                                                         'status': CONTENT_TYPE_JSON}
+
+    # Annuncio per tutti i topic, poi revoca (l'annuncio sostituisce il precedente)
+    codecs.handle_advert({'accept': {'*': [CONTENT_TYPE_CBOR]}})
+    assert codecs.codec_for('offline_audit').content_type == CONTENT_TYPE_CBOR
+    codecs.handle_advert({'accept': {}})
+    assert codecs.codec_for('badge').content_type == CONTENT_TYPE_JSON
+
+    # Senza negoziazione la preferenza vale subito
+    assert WireCodecs(default='cbor', topics='', negotiate=False).codec_for('status').name == 'cbor'
+    try:
+        WireCodecs(default='xml', topics='', negotiate=False)
+        assert False, "Codifica sconosciuta accettata"
+    except ValueError:
+        pass
+    print("✅ Negoziazione per topic OK")
+
+def test_card_event_payload_per_codec():
+    event = CardEvent(raw_id=1, uid_formatted='AB', direction='in', reader_id='in', event_seq=5)
+    json_payload = event.wire_payload('req', JsonCodec('stdlib'))
+    cbor_payload = event.wire_payload('req', CborCodec())
+
+    assert decode_payload(json_payload) == decode_payload(cbor_payload)
+    assert decode_payload(cbor_payload)['request_id'] == 'req'
+    assert event.wire_payload('req', CborCodec()) is cbor_payload
+    print("✅ Payload badge per codifica OK")
+
+if __name__ == "__main__":
+    print("🧪 TEST CODIFICHE PAYLOAD MQTT")
+    print("==============================")
+
+    test_cbor_roundtrip()
+    test_json_backends()
+    test_encode_with_items()
+    test_negotiation()
+    test_card_event_payload_per_codec()
+
+    print("\n✅ Tutti i test superati!")
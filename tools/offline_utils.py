@@ -168,26 +168,13 @@ def show_queue(offline_manager):
     print("\n📦 CODA ELEMENTI OFFLINE")
     print("="*60)
     
-    if offline_manager.offline_queue.empty():
+    # Copia degli elementi (la coda non viene modificata)
+    queue_items = offline_manager.get_queue_items()
+    
+    if not queue_items:
         print("📭 Coda vuota - Nessun elemento in attesa di sincronizzazione")
         return
     
-    # Estrai elementi per visualizzazione (senza rimuoverli)
-    queue_items = []
-    temp_items = []
-    
-    while not offline_manager.offline_queue.empty():
-        try:
-            item = offline_manager.offline_queue.get_nowait()
-            queue_items.append(item)
-            temp_items.append(item)
-        except:
-            break
-    
-    # Rimetti tutto nella coda
-    for item in temp_items:
-        offline_manager.offline_queue.put(item)
-    
     print(f"📊 Totale elementi: {len(queue_items)}")
     print("-" * 60)
     
@@ -213,16 +200,16 @@ def force_sync(offline_manager):
         print("💡 Controllare la connessione internet e riprovare")
         return
     
-    if offline_manager.offline_queue.empty():
+    if offline_manager.get_queue_size() == 0:
         print("📭 Nessun elemento da sincronizzare")
         return
     
-    queue_size_before = offline_manager.offline_queue.qsize()
+    queue_size_before = offline_manager.get_queue_size()
     print(f"📤 Inizio sincronizzazione di {queue_size_before} elementi...")
     
     offline_manager.sync_offline_data()
     
-    queue_size_after = offline_manager.offline_queue.qsize()
+    queue_size_after = offline_manager.get_queue_size()
     synced_count = queue_size_before - queue_size_after
     
     print(f"\n📊 Risultato sincronizzazione:")
@@ -237,7 +224,7 @@ def clear_queue(offline_manager):
     print("\n🧹 PULIZIA CODA OFFLINE")
     print("="*40)
     
-    queue_size = offline_manager.offline_queue.qsize()
+    queue_size = offline_manager.get_queue_size()
     
     if queue_size == 0:
         print("📭 Coda già vuota")
@@ -259,26 +246,12 @@ def export_queue(offline_manager, filename):
     print(f"\n📤 EXPORT CODA OFFLINE → {filename}")
     print("="*50)
     
-    if offline_manager.offline_queue.empty():
+    queue_items = offline_manager.get_queue_items()
+    
+    if not queue_items:
         print("📭 Coda vuota - Nessun dato da esportare")
         return
     
-    # Estrai elementi per export
-    queue_items = []
-    temp_items = []
-    
-    while not offline_manager.offline_queue.empty():
-        try:
-            item = offline_manager.offline_queue.get_nowait()
-            queue_items.append(item)
-            temp_items.append(item)
-        except:
-            break
-    
-    # Rimetti tutto nella coda
-    for item in temp_items:
-        offline_manager.offline_queue.put(item)
-    
     # Prepara dati per export
     export_data = {
         'export_timestamp': datetime.now().isoformat(),
@@ -333,20 +306,25 @@ def show_detailed_stats(offline_manager, logger):
     except Exception as e:
         print(f"⚠️ Errore lettura statistiche log: {e}")
     
-    # Analisi file coda offline
-    queue_file_path = os.path.join(Config.LOG_DIRECTORY, Config.OFFLINE_STORAGE_FILE)
-    if os.path.exists(queue_file_path):
+    # Analisi journal coda offline
+    journal_dir = os.path.join(Config.LOG_DIRECTORY, Config.OFFLINE_JOURNAL_DIR)
+    if os.path.isdir(journal_dir):
         try:
-            file_size = os.path.getsize(queue_file_path)
-            file_mod_time = datetime.fromtimestamp(os.path.getmtime(queue_file_path))
+            segments = [name for name in os.listdir(journal_dir) if name.endswith('.log')]
+            total_size = sum(os.path.getsize(os.path.join(journal_dir, name)) for name in segments)
+            
+            print(f"\n💾 Journal Coda Offline:")
+            print(f"   📁 Path: {journal_dir}")
+            print(f"   🧩 Segmenti: {len(segments)}")
+            print(f"   📏 Dimensione: {total_size} bytes")
             
-            print(f"\n💾 File Coda Offline:")
-            print(f"   📁 Path: {queue_file_path}")
-            print(f"   📏 Dimensione: {file_size} bytes")
-            print(f"   🕐 Ultima modifica: {file_mod_time.strftime('%H:%M:%S - %d/%m/%Y')}")
+            if segments:
+                last_segment = os.path.join(journal_dir, sorted(segments)[-1])
+                file_mod_time = datetime.fromtimestamp(os.path.getmtime(last_segment))
+                print(f"   🕐 Ultima modifica: {file_mod_time.strftime('%H:%M:%S - %d/%m/%Y')}")
             
         except Exception as e:
-            print(f"⚠️ Errore analisi file coda: {e}")
+            print(f"⚠️ Errore analisi journal coda: {e}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file